@@ -6,4 +6,4 @@ class CorecodeConfig(AppConfig):
 
     def ready(self):
         # Import and connect the signals
-        from . import models
\ No newline at end of file
+        from . import models, signals
@@ -0,0 +1,104 @@
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+from django.utils import timezone
+
+from .log import current_context
+
+logger = logging.getLogger(__name__)
+
+
+class AuditBuffer:
+    """Collect audit entries in memory and write them to AuditLog in batches.
+
+    An entry joins the buffer only once its transaction commits. The buffer
+    is written with one ``bulk_create`` when it holds ``AUDIT_BATCH_SIZE``
+    entries or ``AUDIT_FLUSH_INTERVAL`` seconds have passed, whichever comes
+    first, and when the process exits.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._entries = []
+        self._last_flush = time.monotonic()
+
+    def _entry(self, action, instance, context):
+        from .models import AuditLog
+
+        return AuditLog(
+            timestamp=timezone.now(),
+            action=action,
+            model=instance._meta.label,
+            object_id=str(instance.pk),
+            object_repr=str(instance)[:200],
+            username=context.get("user", ""),
+            request_id=context.get("request_id", ""),
+        )
+
+    def record(self, action, instance):
+        entry = self._entry(action, instance, current_context())
+        transaction.on_commit(lambda: self.add(entry))
+
+    def record_many(self, action, instances, related=()):
+        """Record ``action`` on ``instances`` written in bulk (no signals are sent).
+
+        Only models listed in AUDITED_MODELS are recorded. ``related`` names
+        the relations ``str()`` of an instance follows, so they are loaded
+        with one query each rather than one per instance.
+        """
+        instances = list(instances)
+        audited = getattr(settings, "AUDITED_MODELS", [])
+        if not instances or instances[0]._meta.label not in audited:
+            return
+        prefetch_related_objects(instances, *related)
+        context = current_context()
+        entries = [self._entry(action, instance, context) for instance in instances]
+        transaction.on_commit(lambda: self.add(*entries))
+
+    def add(self, *entries):
+        with self._lock:
+            self._entries.extend(entries)
+            max_entries = getattr(settings, "AUDIT_MAX_BUFFERED", 10000)
+            if len(self._entries) > max_entries:
+                dropped = len(self._entries) - max_entries
+                del self._entries[:dropped]
+                logger.warning("Audit buffer full, dropped %d entries", dropped)
+
+    def pending(self):
+        with self._lock:
+            return len(self._entries)
+
+    def flush_due(self):
+        if self.pending() >= getattr(settings, "AUDIT_BATCH_SIZE", 100):
+            return True
+        interval = getattr(settings, "AUDIT_FLUSH_INTERVAL", 10)
+        return self.pending() and time.monotonic() - self._last_flush >= interval
+
+    def flush(self):
+        """Write the buffered entries and return how many were written."""
+        from .models import AuditLog
+
+        if not self._flush_lock.acquire(blocking=False):
+            return 0
+        try:
+            with self._lock:
+                entries, self._entries = self._entries, []
+                self._last_flush = time.monotonic()
+            if entries:
+                AuditLog.objects.bulk_create(entries)
+            return len(entries)
+        except Exception:
+            logger.exception("Could not write %d audit entries", len(entries))
+            return 0
+        finally:
+            self._flush_lock.release()
+
+
+audit_log = AuditBuffer()
+atexit.register(audit_log.flush)
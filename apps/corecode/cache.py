@@ -0,0 +1,79 @@
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+
+def _stamp_cache():
+    return caches[getattr(settings, "VERSION_STAMP_CACHE", "shared")]
+
+
+def get_stamp(name):
+    """Return the shared version stamp for ``name``."""
+    return _stamp_cache().get(f"stamp:{name}")
+
+
+def bump_stamp(name):
+    """Invalidate every process-local copy of ``name`` across all workers."""
+    _stamp_cache().set(f"stamp:{name}", uuid.uuid4().hex, None)
+
+
+class ProcessCache:
+    """A value computed once per process and reloaded when its stamp changes.
+
+    The loaded value lives in this worker's memory. Other workers learn about
+    changes through a version stamp kept in the shared cache, which is read at
+    most once every ``VERSION_STAMP_TTL`` seconds.
+    """
+
+    def __init__(self, name, loader):
+        self.name = name
+        self.loader = loader
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._value = None
+        self._stamp = None
+        self._checked_at = 0.0
+
+    def _is_stale(self):
+        ttl = getattr(settings, "VERSION_STAMP_TTL", 2)
+        now = time.monotonic()
+        if now - self._checked_at < ttl:
+            return False
+        self._checked_at = now
+        return get_stamp(self.name) != self._stamp
+
+    def get(self):
+        if self._loaded and not self._is_stale():
+            return self._value
+        with self._lock:
+            if not self._loaded or get_stamp(self.name) != self._stamp:
+                stamp = get_stamp(self.name)
+                self._value = self.loader()
+                self._stamp = stamp
+                self._loaded = True
+                self._checked_at = time.monotonic()
+            return self._value
+
+    def clear(self):
+        """Drop this process' copy so the next ``get`` reloads it."""
+        with self._lock:
+            self._loaded = False
+            self._value = None
+
+    def invalidate(self):
+        """Drop the local copy and tell the other workers to do the same.
+
+        The stamp is bumped once the surrounding transaction commits so no
+        worker can reload the old rows under the new stamp.
+        """
+        self.clear()
+
+        def bump():
+            bump_stamp(self.name)
+            self.clear()
+
+        transaction.on_commit(bump)
@@ -1,32 +1,25 @@
-from .models import AcademicSession, AcademicTerm, SiteConfig
+from .utils import get_current_session, get_current_term, site_settings
+
 
 def site_defaults(request):
     contexts = {}
-    
-    # Safely get current session - with multiple exception handling
-    try:
-        current_session = AcademicSession.objects.get(current=True)
-        contexts["current_session"] = current_session.name
-    except AcademicSession.DoesNotExist:
-        contexts["current_session"] = "No Session Set"
-    except Exception as e:
-        contexts["current_session"] = "No Session Set"
 
-    # Safely get current term - with multiple exception handling
+    # Current session and term come from the per-process cache
     try:
-        current_term = AcademicTerm.objects.get(current=True)
-        contexts["current_term"] = current_term.name
-    except AcademicTerm.DoesNotExist:
-        contexts["current_term"] = "No Term Set"
+        current_session = get_current_session()
+        current_term = get_current_term()
     except Exception as e:
-        contexts["current_term"] = "No Term Set"
+        current_session = current_term = None
+
+    contexts["current_session"] = (
+        current_session.name if current_session else "No Session Set"
+    )
+    contexts["current_term"] = current_term.name if current_term else "No Term Set"
 
-    # Safely get site config
+    # Site config comes from the in-memory snapshot
     try:
-        vals = SiteConfig.objects.all()
-        for val in vals:
-            contexts[val.key] = val.value
+        contexts.update(site_settings.snapshot())
     except Exception as e:
         pass  # Ignore all site config errors
 
-    return contexts
\ No newline at end of file
+    return contexts
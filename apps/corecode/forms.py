@@ -15,7 +15,7 @@ SiteConfigForm = modelformset_factory(
         "key",
         "value",
     ),
-    extra=0,
+    extra=1,
 )
 
 
@@ -0,0 +1,167 @@
+import logging
+import re
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+_IN_LIST = re.compile(r"\bIN \((?:%s, )*%s\)", re.IGNORECASE)
+_STRINGS = re.compile(r"'(?:[^']|'')*'")
+_NUMBERS = re.compile(r"\b\d+\b")
+_SPACES = re.compile(r"\s+")
+
+
+def fingerprint(sql):
+    """Reduce a SQL statement to its shape so repeats can be counted."""
+    sql = _IN_LIST.sub("IN (...)", sql)
+    sql = _STRINGS.sub("?", sql)
+    sql = _NUMBERS.sub("?", sql)
+    return _SPACES.sub(" ", sql).strip()
+
+
+class QueryRecorder:
+    """``connection.execute_wrapper`` hook that times every SQL statement."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - start))
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def total_time(self):
+        return sum(duration for _, duration in self.queries)
+
+    def repeated(self, threshold):
+        """Return ``(fingerprint, count)`` pairs seen at least ``threshold`` times."""
+        counts = Counter(fingerprint(sql) for sql, _ in self.queries)
+        return [(fp, n) for fp, n in counts.most_common() if n >= threshold]
+
+
+class EndpointStats:
+    """Running totals for one URL name since the last flush."""
+
+    def __init__(self, url_name):
+        self.url_name = url_name
+        self.requests = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.total_queries = 0
+        self.max_queries = 0
+        self.total_sql_time = 0.0
+        self.n_plus_one_requests = 0
+        self.fingerprints = Counter()
+
+    def add(self, duration, recorder, repeated):
+        self.requests += 1
+        self.total_time += duration
+        self.max_time = max(self.max_time, duration)
+        self.total_queries += recorder.count
+        self.max_queries = max(self.max_queries, recorder.count)
+        self.total_sql_time += recorder.total_time
+        if repeated:
+            self.n_plus_one_requests += 1
+            for fp, count in repeated:
+                self.fingerprints[fp] = max(self.fingerprints[fp], count)
+            # Keep the fingerprint table bounded
+            if len(self.fingerprints) > 20:
+                self.fingerprints = Counter(dict(self.fingerprints.most_common(10)))
+
+    @property
+    def avg_time(self):
+        return self.total_time / self.requests if self.requests else 0.0
+
+    @property
+    def avg_queries(self):
+        return self.total_queries / self.requests if self.requests else 0.0
+
+    @property
+    def worst_fingerprint(self):
+        if not self.fingerprints:
+            return "", 0
+        return self.fingerprints.most_common(1)[0]
+
+
+class RequestStatsStore:
+    """Bounded, per-worker store of endpoint statistics.
+
+    Totals are kept in memory and written to the RequestStat table at most
+    once every ``REQUEST_STATS_FLUSH_INTERVAL`` seconds.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stats = {}
+        self._window_start = timezone.now()
+        self._last_flush = time.monotonic()
+
+    def record(self, url_name, duration, recorder, repeated):
+        max_endpoints = getattr(settings, "REQUEST_STATS_MAX_ENDPOINTS", 500)
+        with self._lock:
+            stats = self._stats.get(url_name)
+            if stats is None:
+                if len(self._stats) >= max_endpoints:
+                    return
+                stats = self._stats[url_name] = EndpointStats(url_name)
+            stats.add(duration, recorder, repeated)
+
+    def snapshot(self):
+        with self._lock:
+            return list(self._stats.values())
+
+    def flush_due(self):
+        interval = getattr(settings, "REQUEST_STATS_FLUSH_INTERVAL", 60)
+        return time.monotonic() - self._last_flush >= interval
+
+    def flush(self):
+        """Write the accumulated totals to the database and start a new window."""
+        from .models import RequestStat
+
+        if not self._flush_lock.acquire(blocking=False):
+            return 0
+        try:
+            with self._lock:
+                stats, self._stats = self._stats, {}
+                window_start, self._window_start = self._window_start, timezone.now()
+                self._last_flush = time.monotonic()
+            rows = []
+            for item in stats.values():
+                fp, fp_count = item.worst_fingerprint
+                rows.append(
+                    RequestStat(
+                        url_name=item.url_name,
+                        window_start=window_start,
+                        requests=item.requests,
+                        total_time_ms=round(item.total_time * 1000, 3),
+                        max_time_ms=round(item.max_time * 1000, 3),
+                        total_queries=item.total_queries,
+                        max_queries=item.max_queries,
+                        total_sql_ms=round(item.total_sql_time * 1000, 3),
+                        n_plus_one_requests=item.n_plus_one_requests,
+                        worst_fingerprint=fp,
+                        worst_fingerprint_count=fp_count,
+                    )
+                )
+            RequestStat.objects.bulk_create(rows)
+            return len(rows)
+        except Exception:
+            logger.exception("Could not flush request statistics")
+            return 0
+        finally:
+            self._flush_lock.release()
+
+
+request_stats = RequestStatsStore()
@@ -0,0 +1,91 @@
+"""Structured, non-blocking logging.
+
+Log calls in the request thread only put the record on an in-memory queue;
+a listener thread formats it as one JSON line and writes it to the rotating
+file. Every record carries the id, user and view of the request it was
+logged from (see ``RequestLogMiddleware``).
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+request_context = ContextVar("request_context", default=None)
+
+CONTEXT_FIELDS = ("request_id", "user", "view")
+# Attributes every LogRecord has; anything else was passed with ``extra=``
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+def current_context():
+    return request_context.get() or {}
+
+
+class RequestContextFilter(logging.Filter):
+    """Copy the current request's id, user and view onto the record."""
+
+    def filter(self, record):
+        context = current_context()
+        for field in CONTEXT_FIELDS:
+            if not hasattr(record, field):
+                setattr(record, field, context.get(field, ""))
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class QueueingFileHandler(logging.handlers.QueueHandler):
+    """A TimedRotatingFileHandler that writes from a background thread.
+
+    Takes the same arguments as ``TimedRotatingFileHandler``. When the queue
+    is full records are dropped rather than blocking the request.
+    """
+
+    def __init__(self, filename, queue_size=10000, **kwargs):
+        super().__init__(queue.Queue(queue_size))
+        self.target = logging.handlers.TimedRotatingFileHandler(filename, **kwargs)
+        self.dropped = 0
+        self.listener = logging.handlers.QueueListener(
+            self.queue, self.target, respect_handler_level=False
+        )
+        self.listener.start()
+        atexit.register(self.close)
+
+    def setFormatter(self, fmt):
+        # Formatting happens in the listener thread
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        # Render the message now, so the arguments can't change under us
+        record.msg, record.args = record.getMessage(), None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        if self.listener._thread is not None:
+            self.listener.stop()
+        self.target.close()
+        super().close()
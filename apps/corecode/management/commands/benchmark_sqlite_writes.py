@@ -0,0 +1,109 @@
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.corecode.sqlite import PRODUCTION_PRAGMAS, apply_pragmas
+
+# name -> (pragmas, statement that opens a transaction, connect timeout in s)
+PROFILES = {
+    "default": ({}, "BEGIN", 5.0),
+    "tuned": (PRODUCTION_PRAGMAS, "BEGIN IMMEDIATE", 20.0),
+}
+
+SCHEMA = """
+CREATE TABLE register (id INTEGER PRIMARY KEY, writer INTEGER, taken INTEGER);
+CREATE TABLE entry (
+    id INTEGER PRIMARY KEY,
+    register_id INTEGER REFERENCES register (id),
+    student INTEGER,
+    status TEXT
+);
+CREATE INDEX entry_register ON entry (register_id);
+"""
+
+
+def run_writer(path, profile, transactions, rows, writer):
+    """Submit ``transactions`` attendance registers the way take_attendance does.
+
+    Each transaction reads the register's existing entries, then writes the
+    register and one entry per student.
+    """
+    pragmas, begin, timeout = PROFILES[profile]
+    conn = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+    cursor = conn.cursor()
+    apply_pragmas(cursor, pragmas)
+    committed = failed = 0
+    for n in range(transactions):
+        try:
+            cursor.execute(begin)
+            cursor.execute(
+                "SELECT count(*) FROM entry WHERE register_id = "
+                "(SELECT max(id) FROM register WHERE writer = ?)",
+                (writer,),
+            )
+            cursor.fetchone()
+            cursor.execute(
+                "INSERT INTO register (writer, taken) VALUES (?, ?)", (writer, n)
+            )
+            register_id = cursor.lastrowid
+            cursor.executemany(
+                "INSERT INTO entry (register_id, student, status) VALUES (?, ?, 'P')",
+                [(register_id, student) for student in range(rows)],
+            )
+            cursor.execute("COMMIT")
+            committed += 1
+        except sqlite3.OperationalError:
+            if conn.in_transaction:
+                cursor.execute("ROLLBACK")
+            failed += 1
+    conn.close()
+    return committed, failed
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure concurrent-writer throughput on a scratch SQLite file with "
+        "SQLite's defaults and with the production profile"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--writers", type=int, default=8)
+        parser.add_argument(
+            "--transactions", type=int, default=100, help="Registers per writer"
+        )
+        parser.add_argument("--rows", type=int, default=40, help="Students per register")
+        parser.add_argument(
+            "--profile", choices=["both", *PROFILES], default="both"
+        )
+
+    def handle(self, *args, **options):
+        profiles = list(PROFILES) if options["profile"] == "both" else [options["profile"]]
+        for profile in profiles:
+            committed, failed, elapsed = self.run(profile, options)
+            self.stdout.write(
+                f"{profile:8} {options['writers']} writers: {committed} committed, "
+                f"{failed} failed ('database is locked'), "
+                f"{committed / elapsed:,.0f} transactions/s in {elapsed:.2f}s"
+            )
+
+    def run(self, profile, options):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bench.sqlite3")
+            conn = sqlite3.connect(path)
+            conn.executescript(SCHEMA)
+            conn.close()
+            jobs = [
+                (path, profile, options["transactions"], options["rows"], writer)
+                for writer in range(options["writers"])
+            ]
+            with multiprocessing.Pool(options["writers"]) as pool:
+                start = time.perf_counter()
+                results = pool.starmap(run_writer, jobs)
+                elapsed = time.perf_counter() - start
+        committed = sum(c for c, _ in results)
+        failed = sum(f for _, f in results)
+        return committed, failed, elapsed
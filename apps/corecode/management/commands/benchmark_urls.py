@@ -0,0 +1,246 @@
+import json
+import platform
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import URLPattern, URLResolver, get_resolver, reverse
+from django.utils import timezone
+
+from apps.corecode.instrumentation import QueryRecorder
+from apps.corecode.models import StudentClass
+from apps.finance.models import Invoice
+from apps.students.models import Student
+from attendance.models import AttendanceRegister
+
+# The views we care most about; ``--key`` benchmarks only these
+KEY_VIEWS = [
+    "view-results",
+    "invoice-list",
+    "class-report-sheet",
+    "attendance:attendance_summary_data",
+    "attendance:take_attendance",
+]
+
+# Routes that change data on GET or end the session
+SKIP_VIEWS = {
+    "logout",
+    "attendance:lock_register",
+    "attendance:unlock_register",
+}
+SKIP_NAMESPACES = {"admin"}
+
+# Querysets used to fill URL kwargs that are not ``pk`` of a class-based view
+KWARG_MODELS = {
+    "student_id": Student.objects.all(),
+    "class_id": StudentClass.objects.filter(student__isnull=False),
+}
+PK_MODELS = {
+    "attendance:take_attendance": AttendanceRegister.objects.filter(is_locked=False),
+}
+
+
+def _first_pk(queryset):
+    if not hasattr(queryset, "values_list"):
+        queryset = queryset._default_manager.all()
+    return queryset.order_by("pk").values_list("pk", flat=True).first()
+
+
+def _extra_query(name):
+    """Query strings some views need to render something meaningful."""
+    if name == "receipt-create":
+        return {"invoice": _first_pk(Invoice)}
+    if name == "attendance:attendance_summary_data":
+        register = AttendanceRegister.objects.order_by("-date").first()
+        if register:
+            return {
+                "class": register.student_class_id,
+                "term": register.term_id,
+                "session": register.session_id,
+            }
+    if name == "student-performance":
+        student = Student.objects.order_by("pk").first()
+        if student:
+            return {"reg": student.registration_number}
+    return {}
+
+
+def iter_routes(patterns=None, namespace=None):
+    """Yield ``(view_name, pattern)`` for every named route."""
+    if patterns is None:
+        patterns = get_resolver().url_patterns
+    for entry in patterns:
+        if isinstance(entry, URLResolver):
+            ns = entry.namespace
+            if ns in SKIP_NAMESPACES:
+                continue
+            child_ns = ":".join(filter(None, [namespace, ns])) or None
+            yield from iter_routes(entry.url_patterns, child_ns)
+        elif isinstance(entry, URLPattern) and entry.name:
+            name = f"{namespace}:{entry.name}" if namespace else entry.name
+            yield name, entry
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = (
+        "Request every named route as a logged-in admin and report latency, "
+        "query count and response size, optionally against a saved baseline"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("-n", "--iterations", type=int, default=10)
+        parser.add_argument("--warmup", type=int, default=1)
+        parser.add_argument("--user", default="admin", help="Username to log in as")
+        parser.add_argument("--key", action="store_true", help="Only the key views")
+        parser.add_argument("--only", nargs="*", default=[], help="View names to run")
+        parser.add_argument("--save", metavar="PATH", help="Write results as a JSON baseline")
+        parser.add_argument("--compare", metavar="PATH", help="Compare with a JSON baseline")
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=0.2,
+            help="Allowed p95 slowdown before a view counts as a regression (0.2 = 20%%)",
+        )
+        parser.add_argument(
+            "--min-delta-ms",
+            type=float,
+            default=5.0,
+            help="Ignore p95 slowdowns smaller than this many milliseconds",
+        )
+        parser.add_argument(
+            "--fail-on-regression",
+            action="store_true",
+            help="Exit with an error when any view regressed",
+        )
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(username=options["user"]).first()
+        if user is None:
+            raise CommandError(
+                f"User {options['user']!r} not found. Seed the database first "
+                "(python manage.py seed_school)."
+            )
+
+        wanted = set(options["only"]) | (set(KEY_VIEWS) if options["key"] else set())
+        results = {}
+        with override_settings(ALLOWED_HOSTS=["*"], REQUEST_STATS_ENABLED=False):
+            client = Client(raise_request_exception=False)
+            client.force_login(user)
+            for name, pattern in iter_routes():
+                if name in SKIP_VIEWS or (wanted and name not in wanted):
+                    continue
+                url = self.build_url(name, pattern)
+                if url is None:
+                    self.stderr.write(f"skip {name}: no sample data for its URL")
+                    continue
+                results[name] = self.measure(client, url, options)
+                self.stdout.write(self.format_row(name, results[name]))
+                self.stdout.flush()
+
+        if options["save"]:
+            payload = {
+                "created": timezone.now().isoformat(),
+                "python": platform.python_version(),
+                "database": connection.vendor,
+                "iterations": options["iterations"],
+                "results": results,
+            }
+            with open(options["save"], "w") as fh:
+                json.dump(payload, fh, indent=2, sort_keys=True)
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {options['save']}"))
+
+        if options["compare"]:
+            regressions = self.compare(
+                results, options["compare"], options["tolerance"], options["min_delta_ms"]
+            )
+            if regressions and options["fail_on_regression"]:
+                raise CommandError(f"{len(regressions)} view(s) regressed: {', '.join(regressions)}")
+
+    def build_url(self, name, pattern):
+        kwargs = {}
+        for key in pattern.pattern.converters:
+            if key in KWARG_MODELS:
+                model = KWARG_MODELS[key]
+            elif key == "pk":
+                view_class = getattr(pattern.callback, "view_class", None)
+                model = PK_MODELS.get(name) or getattr(view_class, "model", None)
+            else:
+                model = None
+            value = _first_pk(model) if model is not None else None
+            if value is None:
+                return None
+            kwargs[key] = value
+        url = reverse(name, kwargs=kwargs)
+        query = {k: v for k, v in _extra_query(name).items() if v is not None}
+        if query:
+            url += "?" + "&".join(f"{k}={v}" for k, v in query.items())
+        return url
+
+    def measure(self, client, url, options):
+        for _ in range(options["warmup"]):
+            client.get(url)
+        timings, sql_times, queries, size, status = [], [], 0, 0, None
+        for _ in range(options["iterations"]):
+            recorder = QueryRecorder()
+            with connection.execute_wrapper(recorder):
+                start = time.perf_counter()
+                response = client.get(url)
+                if response.streaming:
+                    body = b"".join(response.streaming_content)
+                else:
+                    body = response.content
+                timings.append((time.perf_counter() - start) * 1000)
+            sql_times.append(recorder.total_time * 1000)
+            queries, size, status = recorder.count, len(body), response.status_code
+        return {
+            "url": url,
+            "status": status,
+            "p50_ms": round(percentile(timings, 0.5), 2),
+            "p95_ms": round(percentile(timings, 0.95), 2),
+            "sql_ms": round(percentile(sql_times, 0.5), 2),
+            "queries": queries,
+            "bytes": size,
+        }
+
+    def format_row(self, name, row):
+        return (
+            f"{name:40} {row['status']:>4} p50 {row['p50_ms']:>9.2f}ms "
+            f"p95 {row['p95_ms']:>9.2f}ms {row['queries']:>6} queries {row['bytes']:>9} bytes"
+        )
+
+    def compare(self, results, path, tolerance, min_delta_ms):
+        with open(path) as fh:
+            baseline = json.load(fh)["results"]
+        regressions = []
+        self.stdout.write("")
+        self.stdout.write(f"Compared with {path}:")
+        for name, row in sorted(results.items()):
+            old = baseline.get(name)
+            if old is None:
+                self.stdout.write(f"{name:40} new")
+                continue
+            slower = (
+                row["p95_ms"] > old["p95_ms"] * (1 + tolerance)
+                and row["p95_ms"] - old["p95_ms"] >= min_delta_ms
+            )
+            more_queries = row["queries"] > old["queries"]
+            line = (
+                f"{name:40} p95 {old['p95_ms']:>9.2f} -> {row['p95_ms']:>9.2f}ms  "
+                f"queries {old['queries']:>5} -> {row['queries']:>5}"
+            )
+            if slower or more_queries:
+                regressions.append(name)
+                self.stdout.write(self.style.ERROR(line + "  REGRESSION"))
+            else:
+                self.stdout.write(line)
+        return regressions
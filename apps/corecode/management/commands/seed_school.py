@@ -0,0 +1,363 @@
+import random
+import time
+from datetime import date, timedelta
+from itertools import islice
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from apps.corecode.models import AcademicSession, AcademicTerm, StudentClass, Subject
+from apps.corecode.utils import current_session_and_term
+from apps.finance import ledger, summaries
+from apps.finance.models import Invoice, InvoiceItem, Receipt
+from apps.finance.numbering import number_receipts
+from apps.finance.services import refresh_invoice_totals
+from apps.result.models import Result
+from apps.students import guardians
+from apps.students.models import Student
+from attendance.models import AttendanceEntry, AttendanceRegister
+
+REG_PREFIX = "SEED"
+TERM_NAMES = ["First Term", "Second Term", "Third Term"]
+# (month, day) each term starts and ends on, relative to the session's first year
+TERM_DATES = [
+    ((9, 8), (12, 12), 0),
+    ((1, 6), (3, 28), 1),
+    ((4, 21), (7, 18), 1),
+]
+SURNAMES = [
+    "Adeyemi", "Okafor", "Mwangi", "Otieno", "Kamau", "Bello", "Eze", "Njoroge",
+    "Ibrahim", "Mensah", "Asante", "Banda", "Phiri", "Moyo", "Ndlovu", "Okoro",
+    "Wanjiru", "Achieng", "Abubakar", "Danjuma", "Kiptoo", "Chebet", "Onyango",
+    "Nwosu", "Balogun", "Oduya", "Mutua", "Kariuki", "Ogunleye", "Lawal",
+]
+FIRSTNAMES = [
+    "Amina", "Chinedu", "Wanjiku", "Kofi", "Zainab", "Tunde", "Grace", "Brian",
+    "Faith", "Samuel", "Esther", "David", "Mercy", "Joseph", "Ruth", "Daniel",
+    "Joy", "Peter", "Blessing", "Emmanuel", "Halima", "Musa", "Lydia", "Kevin",
+    "Precious", "Ibrahim", "Naomi", "Victor", "Agnes", "Collins",
+]
+SUBJECTS = [
+    "Mathematics", "English", "Kiswahili", "Science", "Social Studies",
+    "Religious Education", "Agriculture", "Home Science", "Art and Craft",
+    "Music", "Physical Education", "Computer Studies", "French", "Business",
+    "History", "Geography",
+]
+FEE_ITEMS = [("Tuition", 18000), ("Development levy", 2500), ("Activity fee", 1200)]
+ATTENDANCE_STATUSES = [
+    (AttendanceEntry.STATUS_PRESENT, 0.90),
+    (AttendanceEntry.STATUS_ABSENT, 0.05),
+    (AttendanceEntry.STATUS_LATE, 0.04),
+    (AttendanceEntry.STATUS_EXCUSED, 0.01),
+]
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with a deterministic, large school "
+        "(students, results, invoices, receipts and attendance)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--classes", type=int, default=60)
+        parser.add_argument("--students", type=int, default=50000)
+        parser.add_argument("--sessions", type=int, default=5)
+        parser.add_argument("--subjects", type=int, default=12)
+        parser.add_argument(
+            "--start-year", type=int, default=2020, help="First year of the oldest session"
+        )
+        parser.add_argument(
+            "--invoice-sessions",
+            type=int,
+            default=2,
+            help="Number of most recent sessions to bill (3 terms each)",
+        )
+        parser.add_argument(
+            "--attendance-days",
+            type=int,
+            default=190,
+            help="School days of attendance in the current session",
+        )
+        parser.add_argument("--chunk-size", type=int, default=5000)
+        parser.add_argument("--admin-password", default="admin123")
+        parser.add_argument(
+            "--flush",
+            action="store_true",
+            help="Delete previously seeded students (and their records) first",
+        )
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options["seed"])
+        self.chunk_size = options["chunk_size"]
+        self.verbosity = options["verbosity"]
+        started = time.monotonic()
+
+        seeded = Student.objects.filter(registration_number__startswith=REG_PREFIX)
+        if seeded.exists():
+            if not options["flush"]:
+                raise CommandError(
+                    "Seeded students already exist. Re-run with --flush to replace them."
+                )
+            self.step("Removing previous seed", self.flush)
+
+        self.admin = self.step("Admin user", self.seed_admin, options["admin_password"])
+        sessions, terms, classes, subjects = self.step(
+            "Sessions, terms, classes and subjects",
+            self.seed_reference_data,
+            options,
+        )
+        students = self.step(
+            "Students", self.seed_students, options["students"], classes
+        )
+        current_session = sessions[-1]
+        self.step(
+            "Results", self.seed_results, students, current_session, terms, subjects
+        )
+        billed = sessions[-options["invoice_sessions"] :] if options["invoice_sessions"] else []
+        self.step("Invoices and receipts", self.seed_finance, students, billed, terms)
+        self.step(
+            "Attendance",
+            self.seed_attendance,
+            students,
+            classes,
+            current_session,
+            terms,
+            options["attendance_days"],
+        )
+
+        AcademicSession.objects.filter(pk=current_session.pk).update(current=True)
+        AcademicSession.objects.exclude(pk=current_session.pk).update(current=False)
+        AcademicTerm.objects.filter(pk=terms[-1].pk).update(current=True)
+        AcademicTerm.objects.exclude(pk=terms[-1].pk).update(current=False)
+        current_session_and_term.invalidate()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Seeded school in {time.monotonic() - started:.1f}s "
+                f"(login: admin / {options['admin_password']})"
+            )
+        )
+
+    def step(self, label, func, *args):
+        started = time.monotonic()
+        result = func(*args)
+        if self.verbosity:
+            self.stdout.write(f"{label}: {time.monotonic() - started:.1f}s")
+        return result
+
+    def bulk(self, model, objects):
+        """Insert ``objects`` in chunks and return the created instances."""
+        created = []
+        for chunk in chunked(objects, self.chunk_size):
+            with transaction.atomic():
+                created.extend(model.objects.bulk_create(chunk))
+        return created
+
+    def bulk_count(self, model, objects):
+        """Insert ``objects`` in chunks without keeping them in memory."""
+        count = 0
+        for chunk in chunked(objects, self.chunk_size):
+            with transaction.atomic():
+                model.objects.bulk_create(chunk)
+            count += len(chunk)
+        return count
+
+    def flush(self):
+        Student.objects.filter(registration_number__startswith=REG_PREFIX).delete()
+        AttendanceRegister.objects.filter(notes="seed").delete()
+
+    def seed_admin(self, password):
+        admin = User.objects.filter(username="admin").first()
+        if admin is None:
+            admin = User.objects.create_superuser("admin", "admin@example.com", password)
+        return admin
+
+    def seed_reference_data(self, options):
+        sessions = []
+        for i in range(options["sessions"]):
+            year = options["start_year"] + i
+            session, _ = AcademicSession.objects.get_or_create(
+                name=f"{year}-{year + 1}", defaults={"current": False}
+            )
+            sessions.append(session)
+        terms = [
+            AcademicTerm.objects.get_or_create(name=name, defaults={"current": False})[0]
+            for name in TERM_NAMES
+        ]
+        classes = []
+        for i in range(options["classes"]):
+            grade, stream = divmod(i, 5)
+            name = f"Grade {grade + 1}{'ABCDE'[stream]}"
+            classes.append(StudentClass.objects.get_or_create(name=name)[0])
+        subjects = [
+            Subject.objects.get_or_create(name=name)[0]
+            for name in SUBJECTS[: options["subjects"]]
+        ]
+        return sessions, terms, classes, subjects
+
+    def seed_students(self, count, classes):
+        rng = self.rng
+
+        def build():
+            for i in range(count):
+                yield Student(
+                    registration_number=f"{REG_PREFIX}{i + 1:06d}",
+                    surname=rng.choice(SURNAMES),
+                    firstname=rng.choice(FIRSTNAMES),
+                    gender=rng.choice(("male", "female")),
+                    date_of_birth=date(2008, 1, 1) + timedelta(days=rng.randrange(3650)),
+                    date_of_admission=date(2018, 1, 8) + timedelta(days=rng.randrange(2000)),
+                    current_class=classes[i % len(classes)],
+                    parent_mobile_number=f"07{rng.randrange(10**8):08d}",
+                    current_status="active" if rng.random() < 0.97 else "inactive",
+                )
+
+        self.bulk_count(Student, build())
+        guardians.link_all()
+        # Re-read so primary keys are available on every database backend
+        return list(
+            Student.objects.filter(registration_number__startswith=REG_PREFIX)
+            .only("id", "current_class_id", "current_status")
+            .order_by("registration_number")
+        )
+
+    def seed_results(self, students, session, terms, subjects):
+        rng = self.rng
+
+        def build():
+            for term in terms:
+                for student in students:
+                    if student.current_class_id is None:
+                        continue
+                    for subject in subjects:
+                        yield Result(
+                            student_id=student.id,
+                            session=session,
+                            term=term,
+                            current_class_id=student.current_class_id,
+                            subject=subject,
+                            test_score=rng.randint(10, 40),
+                            exam_score=rng.randint(15, 60),
+                        )
+
+        return self.bulk_count(Result, build())
+
+    def term_range(self, session, term_index):
+        first_year = int(session.name.split("-")[0])
+        (sm, sd), (em, ed), offset = TERM_DATES[term_index]
+        return date(first_year + offset, sm, sd), date(first_year + offset, em, ed)
+
+    def seed_finance(self, students, sessions, terms):
+        rng = self.rng
+        periods = [(s, t, i) for s in sessions for i, t in enumerate(terms)]
+        balances = {}
+        for period_index, (session, term, term_index) in enumerate(periods):
+            start, end = self.term_range(session, term_index)
+            last_period = period_index == len(periods) - 1
+            billable = [s for s in students if s.current_class_id is not None]
+            invoices = self.bulk(
+                Invoice,
+                (
+                    Invoice(
+                        student_id=student.id,
+                        session=session,
+                        term=term,
+                        class_for_id=student.current_class_id,
+                        balance_from_previous_term=balances.get(student.id, 0),
+                        issued_on=start,
+                        status="active" if last_period else "closed",
+                    )
+                    for student in billable
+                ),
+            )
+            items, receipts = [], []
+            for invoice in invoices:
+                payable = invoice.balance_from_previous_term
+                for description, amount in FEE_ITEMS:
+                    items.append(
+                        InvoiceItem(invoice=invoice, description=description, amount=amount)
+                    )
+                    payable += amount
+                paid = 0
+                for _ in range(rng.choice((0, 1, 1, 2, 2, 3))):
+                    remaining = payable - paid
+                    if remaining <= 0:
+                        break
+                    amount = min(remaining, rng.randrange(2000, 15000, 500))
+                    receipts.append(
+                        Receipt(
+                            invoice=invoice,
+                            amount_paid=amount,
+                            date_paid=start + timedelta(days=rng.randrange((end - start).days)),
+                        )
+                    )
+                    paid += amount
+                balances[invoice.student_id] = payable - paid
+            self.bulk_count(InvoiceItem, items)
+            number_receipts(receipts)
+            self.bulk_count(Receipt, receipts)
+            with transaction.atomic():
+                refresh_invoice_totals(Invoice.objects.filter(session=session, term=term))
+        # Balances so far become each student's opening ledger entry
+        ledger.open_accounts()
+        summaries.rebuild()
+
+    def seed_attendance(self, students, classes, session, terms, days):
+        rng = self.rng
+        roster = {}
+        for student in students:
+            if student.current_status == "active" and student.current_class_id:
+                roster.setdefault(student.current_class_id, []).append(student.id)
+
+        school_days = []
+        for term_index, term in enumerate(terms):
+            start, end = self.term_range(session, term_index)
+            day = start
+            while day <= end and len(school_days) < days:
+                if day.weekday() < 5:
+                    school_days.append((day, term))
+                day += timedelta(days=1)
+
+        statuses = [status for status, _ in ATTENDANCE_STATUSES]
+        weights = [weight for _, weight in ATTENDANCE_STATUSES]
+        for index, (day, term) in enumerate(school_days):
+            # Past registers are locked; the most recent day is still open
+            is_locked = index < len(school_days) - 1
+            registers = self.bulk(
+                AttendanceRegister,
+                (
+                    AttendanceRegister(
+                        date=day,
+                        student_class=student_class,
+                        term=term,
+                        session=session,
+                        taken_by=self.admin,
+                        is_locked=is_locked,
+                        notes="seed",
+                    )
+                    for student_class in classes
+                ),
+            )
+            self.bulk_count(
+                AttendanceEntry,
+                (
+                    AttendanceEntry(
+                        register=register,
+                        student_id=student_id,
+                        status=rng.choices(statuses, weights)[0],
+                    )
+                    for register in registers
+                    for student_id in roster.get(register.student_class_id, ())
+                ),
+            )
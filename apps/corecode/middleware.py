@@ -1,17 +1,240 @@
-from .models import AcademicSession, AcademicTerm
+import logging
+import time
+import uuid
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.db import connections
+from django.urls import reverse
+from django.utils.functional import SimpleLazyObject
+
+from .audit import audit_log
+from .instrumentation import QueryRecorder, request_stats
+from .log import request_context
+from .models import ProfileCapture
+from .profiling import CProfileCapture, get_sampler, sampling_report, sql_log, store_capture
+from .utils import get_current_session, get_current_term
+
+logger = logging.getLogger(__name__)
+request_logger = logging.getLogger("school_app.requests")
 
 
 class SiteWideConfigs:
+    """Attach the current session and term to the request.
+
+    Both are resolved lazily from a per-process cache, so requests that never
+    touch them (static files, manifest.json, JSON endpoints) cost no queries.
+    """
+
     def __init__(self, get_response):
         self.get_response = get_response
 
     def __call__(self, request):
-        current_session = AcademicSession.objects.get(current=True)
-        current_term = AcademicTerm.objects.get(current=True)
-
-        request.current_session = current_session
-        request.current_term = current_term
+        request.current_session = SimpleLazyObject(get_current_session)
+        request.current_term = SimpleLazyObject(get_current_term)
 
         response = self.get_response(request)
 
         return response
+
+
+class RequestLogMiddleware:
+    """Give each request an id and log one structured line when it ends.
+
+    The id (taken from an incoming ``X-Request-ID`` header when present),
+    user and view name are put in ``apps.corecode.log.request_context`` so
+    every record logged while handling the request carries them. Also
+    writes out buffered audit entries when a batch is due. Must come after
+    AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.id = request.headers.get("X-Request-ID", "")[:64] or uuid.uuid4().hex
+        user = getattr(request, "user", None)
+        context = {
+            "request_id": request.id,
+            "user": user.get_username() if user and user.is_authenticated else "",
+            "view": "",
+        }
+        token = request_context.set(context)
+        try:
+            start = time.perf_counter()
+            response = self.get_response(request)
+            duration_ms = (time.perf_counter() - start) * 1000
+            request_logger.info(
+                "%s %s %s",
+                request.method,
+                request.path,
+                response.status_code,
+                extra={
+                    "method": request.method,
+                    "path": request.path,
+                    "status": response.status_code,
+                    "duration_ms": round(duration_ms, 2),
+                },
+            )
+            response["X-Request-ID"] = request.id
+            if audit_log.flush_due():
+                audit_log.flush()
+        finally:
+            request_context.reset(token)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        context = request_context.get()
+        if context is not None and request.resolver_match:
+            context["view"] = request.resolver_match.view_name
+
+
+class ThrottledSessionMiddleware(SessionMiddleware):
+    """SessionMiddleware that slides the expiry without a write per request.
+
+    A session that was not otherwise modified is saved again (refreshing its
+    expiry and cookie) only once ``SESSION_REFRESH_FRACTION`` of
+    ``SESSION_COOKIE_AGE`` has passed since its last save, instead of on
+    every request as ``SESSION_SAVE_EVERY_REQUEST`` does.
+    """
+
+    REFRESHED_KEY = "_session_refreshed"
+
+    def process_response(self, request, response):
+        session = getattr(request, "session", None)
+        if session is not None and not session.is_empty():
+            now = int(time.time())
+            if session.modified:
+                session[self.REFRESHED_KEY] = now
+            else:
+                fraction = getattr(settings, "SESSION_REFRESH_FRACTION", 0.1)
+                last = session.get(self.REFRESHED_KEY, 0)
+                if now - last >= fraction * session.get_expiry_age():
+                    session[self.REFRESHED_KEY] = now
+        return super().process_response(request, response)
+
+
+class RequestStatsMiddleware:
+    """Record wall time, SQL count and SQL time per resolved URL name.
+
+    Requests that run the same statement shape many times are flagged as
+    likely N+1 patterns. Totals go to the in-memory store in
+    ``apps.corecode.instrumentation`` and are flushed to RequestStat.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, "REQUEST_STATS_ENABLED", True):
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        match = getattr(request, "resolver_match", None)
+        if match is not None and match.view_name:
+            threshold = getattr(settings, "REQUEST_STATS_N_PLUS_ONE_THRESHOLD", 10)
+            repeated = recorder.repeated(threshold)
+            if repeated:
+                logger.warning(
+                    "Possible N+1 on %s: %d queries, %r repeated %d times",
+                    match.view_name,
+                    recorder.count,
+                    repeated[0][0][:200],
+                    repeated[0][1],
+                )
+            request_stats.record(match.view_name, duration, recorder, repeated)
+            if request_stats.flush_due():
+                request_stats.flush()
+
+        return response
+
+
+class ProfilerMiddleware:
+    """Capture a profile and SQL log of a request and store it as a ProfileCapture.
+
+    Staff can ask for one with ``?_profile=1`` (or ``X-Profile: 1``) for a
+    cProfile capture, or ``?_profile=sample`` for the sampling profiler.
+    When ``PROFILE_SLOW_REQUEST_MS`` is set, every request is sampled and
+    the ones slower than that are kept automatically. Must come after
+    AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def requested_kind(self, request):
+        value = request.GET.get("_profile") or request.headers.get("X-Profile")
+        if not value or value == "0":
+            return None
+        user = getattr(request, "user", None)
+        if user is None or not user.is_staff:
+            return None
+        if value in ("sample", "sampling"):
+            return ProfileCapture.KIND_SAMPLING
+        return ProfileCapture.KIND_CPROFILE
+
+    def __call__(self, request):
+        kind = self.requested_kind(request)
+        threshold = getattr(settings, "PROFILE_SLOW_REQUEST_MS", None)
+        if kind is None and threshold is None:
+            return self.get_response(request)
+
+        trigger = ProfileCapture.TRIGGER_MANUAL
+        if kind is None:
+            kind, trigger = ProfileCapture.KIND_SAMPLING, ProfileCapture.TRIGGER_SLOW
+
+        recorder = QueryRecorder()
+        profiler = stacks = None
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            if kind == ProfileCapture.KIND_CPROFILE:
+                profiler = stack.enter_context(CProfileCapture())
+            else:
+                sampler = get_sampler()
+                stacks = sampler.start()
+                stack.callback(sampler.stop)
+            response = self.get_response(request)
+        duration_ms = (time.perf_counter() - start) * 1000
+
+        if trigger == ProfileCapture.TRIGGER_SLOW and duration_ms < threshold:
+            return response
+
+        try:
+            if profiler is not None:
+                report, raw = profiler.report(), profiler.raw()
+            else:
+                report, raw = sampling_report(stacks, get_sampler().interval), None
+            match = getattr(request, "resolver_match", None)
+            user = getattr(request, "user", None)
+            capture = store_capture(
+                kind=kind,
+                trigger=trigger,
+                method=request.method,
+                path=request.get_full_path()[:500],
+                url_name=(match.view_name if match else "")[:200],
+                user=user if user is not None and user.is_authenticated else None,
+                status_code=response.status_code,
+                duration_ms=round(duration_ms, 3),
+                query_count=recorder.count,
+                sql_ms=round(recorder.total_time * 1000, 3),
+                report=report,
+                sql_log=sql_log(recorder),
+                raw_stats=raw,
+            )
+        except Exception:
+            logger.exception("Could not store profile of %s", request.path)
+            return response
+
+        response["X-Profile-Id"] = str(capture.pk)
+        response["X-Profile-Url"] = reverse("profile-detail", args=[capture.pk])
+        return response
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-18 19:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('corecode', '0006_classmanagement'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url_name', models.CharField(db_index=True, max_length=200)),
+                ('window_start', models.DateTimeField()),
+                ('flushed_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('requests', models.PositiveIntegerField(default=0)),
+                ('total_time_ms', models.FloatField(default=0)),
+                ('max_time_ms', models.FloatField(default=0)),
+                ('total_queries', models.PositiveIntegerField(default=0)),
+                ('max_queries', models.PositiveIntegerField(default=0)),
+                ('total_sql_ms', models.FloatField(default=0)),
+                ('n_plus_one_requests', models.PositiveIntegerField(default=0)),
+                ('worst_fingerprint', models.TextField(blank=True)),
+                ('worst_fingerprint_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-flushed_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.7 on 2026-10-18 20:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('corecode', '0008_profilecapture'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField(db_index=True)),
+                ('action', models.CharField(choices=[('create', 'Created'), ('update', 'Updated'), ('delete', 'Deleted')], max_length=10)),
+                ('model', models.CharField(max_length=100)),
+                ('object_id', models.CharField(max_length=64)),
+                ('object_repr', models.CharField(max_length=200)),
+                ('username', models.CharField(blank=True, max_length=150)),
+                ('request_id', models.CharField(blank=True, max_length=64)),
+            ],
+            options={
+                'ordering': ['-timestamp', '-pk'],
+                'indexes': [models.Index(fields=['model', 'object_id'], name='corecode_au_model_9a3f72_idx')],
+            },
+        ),
+    ]
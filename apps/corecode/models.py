@@ -103,4 +103,81 @@ class ClassManagement(models.Model):
         verbose_name_plural = "Class Management"
     
     def __str__(self):
-        return f"{self.teacher.username} - {self.student_class.name}"
\ No newline at end of file
+        return f"{self.teacher.username} - {self.student_class.name}"
+
+
+class RequestStat(models.Model):
+    """Request timings for one URL name, flushed periodically by each worker."""
+
+    url_name = models.CharField(max_length=200, db_index=True)
+    window_start = models.DateTimeField()
+    flushed_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    requests = models.PositiveIntegerField(default=0)
+    total_time_ms = models.FloatField(default=0)
+    max_time_ms = models.FloatField(default=0)
+    total_queries = models.PositiveIntegerField(default=0)
+    max_queries = models.PositiveIntegerField(default=0)
+    total_sql_ms = models.FloatField(default=0)
+    n_plus_one_requests = models.PositiveIntegerField(default=0)
+    worst_fingerprint = models.TextField(blank=True)
+    worst_fingerprint_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ["-flushed_at"]
+
+    def __str__(self):
+        return f"{self.url_name} ({self.requests} requests)"
+
+
+class ProfileCapture(models.Model):
+    """Profile and SQL log of one request, kept for download by staff."""
+
+    KIND_CPROFILE = "cprofile"
+    KIND_SAMPLING = "sampling"
+    KIND_CHOICES = [(KIND_CPROFILE, "cProfile"), (KIND_SAMPLING, "Sampling")]
+
+    TRIGGER_MANUAL = "manual"
+    TRIGGER_SLOW = "slow"
+    TRIGGER_CHOICES = [(TRIGGER_MANUAL, "On demand"), (TRIGGER_SLOW, "Slow request")]
+
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    trigger = models.CharField(max_length=10, choices=TRIGGER_CHOICES)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=500)
+    url_name = models.CharField(max_length=200, blank=True)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    duration_ms = models.FloatField()
+    query_count = models.PositiveIntegerField(default=0)
+    sql_ms = models.FloatField(default=0)
+    report = models.TextField()
+    sql_log = models.TextField(blank=True)
+    raw_stats = models.BinaryField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f}ms)"
+
+
+class AuditLog(models.Model):
+    """Who created, changed or deleted a record, written in batches."""
+
+    ACTION_CHOICES = [("create", "Created"), ("update", "Updated"), ("delete", "Deleted")]
+
+    timestamp = models.DateTimeField(db_index=True)
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    model = models.CharField(max_length=100)
+    object_id = models.CharField(max_length=64)
+    object_repr = models.CharField(max_length=200)
+    username = models.CharField(max_length=150, blank=True)
+    request_id = models.CharField(max_length=64, blank=True)
+
+    class Meta:
+        ordering = ["-timestamp", "-pk"]
+        indexes = [models.Index(fields=["model", "object_id"])]
+
+    def __str__(self):
+        return f"{self.username or 'system'} {self.action} {self.model} {self.object_repr}"
@@ -0,0 +1,161 @@
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+
+
+def _frame_label(code):
+    filename = code.co_filename
+    base = str(settings.BASE_DIR)
+    if filename.startswith(base):
+        filename = os.path.relpath(filename, base)
+    elif "site-packages" in filename:
+        filename = filename.split("site-packages" + os.sep, 1)[1]
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+class Sampler:
+    """One background thread that samples the stacks of registered threads.
+
+    Requests register their thread for the duration of the request; the
+    sampler walks ``sys._current_frames()`` every ``interval`` seconds and
+    counts the stacks it sees. A single sampler serves every request, so
+    leaving it on for slow-request capture costs very little.
+    """
+
+    MAX_DEPTH = 80
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._targets = {}
+        self._thread = None
+
+    def _ensure_running(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._run, name="request-sampler", daemon=True
+            )
+            self._thread.start()
+
+    def start(self, thread_id=None):
+        thread_id = thread_id or threading.get_ident()
+        stacks = Counter()
+        with self._lock:
+            self._targets[thread_id] = stacks
+            self._ensure_running()
+        return stacks
+
+    def stop(self, thread_id=None):
+        with self._lock:
+            return self._targets.pop(thread_id or threading.get_ident(), Counter())
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                targets = list(self._targets.items())
+            if not targets:
+                continue
+            frames = sys._current_frames()
+            for thread_id, stacks in targets:
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None and len(stack) < self.MAX_DEPTH:
+                    stack.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                if stack:
+                    stacks[tuple(reversed(stack))] += 1
+
+
+_sampler = None
+_sampler_lock = threading.Lock()
+
+
+def get_sampler():
+    global _sampler
+    with _sampler_lock:
+        if _sampler is None:
+            _sampler = Sampler(getattr(settings, "PROFILE_SAMPLE_INTERVAL", 0.005))
+        return _sampler
+
+
+def sampling_report(stacks, interval, limit=40):
+    """Summarise sampled stacks: hottest functions, then collapsed stacks.
+
+    The collapsed section ("frame;frame;frame count") can be fed straight to
+    flamegraph tools.
+    """
+    total = sum(stacks.values())
+    own = Counter()
+    inclusive = Counter()
+    for stack, count in stacks.items():
+        own[stack[-1]] += count
+        for label in set(stack):
+            inclusive[label] += count
+
+    out = io.StringIO()
+    out.write(f"{total} samples every {interval * 1000:.1f}ms\n\n")
+    out.write(f"{'self':>7} {'total':>7}  function\n")
+    for label, count in own.most_common(limit):
+        out.write(f"{count:>7} {inclusive[label]:>7}  {label}\n")
+    out.write("\n# collapsed stacks\n")
+    for stack, count in stacks.most_common():
+        out.write(f"{';'.join(stack)} {count}\n")
+    return out.getvalue()
+
+
+class CProfileCapture:
+    """Deterministic profile of one request with ``cProfile``."""
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def __enter__(self):
+        self.profile.enable()
+        return self
+
+    def __exit__(self, *exc):
+        self.profile.disable()
+        return False
+
+    def report(self, limit=60):
+        out = io.StringIO()
+        stats = pstats.Stats(self.profile, stream=out)
+        stats.strip_dirs().sort_stats("cumulative").print_stats(limit)
+        return out.getvalue()
+
+    def raw(self):
+        """Marshalled stats, loadable with ``pstats.Stats(path)`` or snakeviz."""
+        self.profile.create_stats()
+        return marshal.dumps(self.profile.stats)
+
+
+def sql_log(recorder):
+    lines = [
+        f"{duration * 1000:8.2f}ms  {sql}" for sql, duration in recorder.queries
+    ]
+    lines.append(
+        f"\n{recorder.count} queries, {recorder.total_time * 1000:.2f}ms total"
+    )
+    return "\n".join(lines)
+
+
+def store_capture(**fields):
+    """Save a capture and keep only the newest ``PROFILE_MAX_CAPTURES``."""
+    from .models import ProfileCapture
+
+    capture = ProfileCapture.objects.create(**fields)
+    keep = getattr(settings, "PROFILE_MAX_CAPTURES", 50)
+    stale = ProfileCapture.objects.order_by("-created_at", "-pk").values_list(
+        "pk", flat=True
+    )[keep:]
+    ProfileCapture.objects.filter(pk__in=list(stale)).delete()
+    return capture
@@ -1,7 +1,13 @@
-from django.db.models.signals import post_save
+from django.apps import apps
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
+from .audit import audit_log
 from .models import AcademicSession, AcademicTerm
+from .sqlite import configure_connection
+from .utils import current_session_and_term
 
 
 @receiver(post_save, sender=AcademicSession)
@@ -9,6 +15,7 @@ def after_saving_session(sender, created, instance, *args, **kwargs):
     """Change all academic sessions to false if this is true"""
     if instance.current is True:
         AcademicSession.objects.exclude(pk=instance.id).update(current=False)
+    current_session_and_term.invalidate()
 
 
 @receiver(post_save, sender=AcademicTerm)
@@ -16,3 +23,30 @@ def after_saving_term(sender, created, instance, *args, **kwargs):
     """Change all academic terms to false if this is true."""
     if instance.current is True:
         AcademicTerm.objects.exclude(pk=instance.id).update(current=False)
+    current_session_and_term.invalidate()
+
+
+@receiver(post_delete, sender=AcademicSession)
+@receiver(post_delete, sender=AcademicTerm)
+def after_deleting_session_or_term(sender, instance, *args, **kwargs):
+    current_session_and_term.invalidate()
+
+
+@receiver(connection_created)
+def tune_sqlite_connection(sender, connection, **kwargs):
+    configure_connection(connection, getattr(settings, "SQLITE_PRAGMAS", {}))
+
+
+def audit_save(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        audit_log.record("create" if created else "update", instance)
+
+
+def audit_delete(sender, instance, **kwargs):
+    audit_log.record("delete", instance)
+
+
+for label in getattr(settings, "AUDITED_MODELS", []):
+    model = apps.get_model(label)
+    post_save.connect(audit_save, sender=model, dispatch_uid=f"audit-save-{label}")
+    post_delete.connect(audit_delete, sender=model, dispatch_uid=f"audit-delete-{label}")
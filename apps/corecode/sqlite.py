@@ -0,0 +1,32 @@
+"""SQLite settings for single-server installs.
+
+``SQLITE_PRAGMAS`` are applied to every new SQLite connection from the
+``connection_created`` receiver in ``apps.corecode.signals``. Together with
+``transaction_mode = "IMMEDIATE"`` in the database OPTIONS (transactions take
+the write lock up front and wait for it instead of failing with "database is
+locked" when upgrading a read lock), they let a few dozen teachers submit
+attendance at the same time.
+"""
+
+# WAL lets readers carry on while one writer commits, and with
+# synchronous=NORMAL a commit no longer waits for an fsync of the database.
+PRODUCTION_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 20000,  # ms to wait for the write lock
+    "cache_size": -64000,  # KiB (negative), i.e. 64MB of page cache
+    "mmap_size": 268435456,  # 256MB of memory-mapped reads
+    "temp_store": "MEMORY",
+}
+
+
+def apply_pragmas(cursor, pragmas):
+    for name, value in pragmas.items():
+        cursor.execute(f"PRAGMA {name} = {value}")
+
+
+def configure_connection(connection, pragmas):
+    if connection.vendor != "sqlite" or not pragmas:
+        return
+    with connection.cursor() as cursor:
+        apply_pragmas(cursor, pragmas)
@@ -0,0 +1,9 @@
+from django import template
+
+register = template.Library()
+
+
+@register.filter
+def elided_pages(page_obj):
+    """Page numbers around the current page, with "…" for the gaps."""
+    return page_obj.paginator.get_elided_page_range(page_obj.number)
@@ -0,0 +1,85 @@
+import json
+import logging
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import reverse
+
+from apps.corecode.audit import audit_log
+from apps.corecode.log import JsonFormatter, RequestContextFilter, request_context
+from apps.corecode.models import AuditLog
+from apps.students.models import Student
+
+
+class StructuredLoggingTest(TestCase):
+    def test_records_carry_the_request_context(self):
+        token = request_context.set({"request_id": "abc123", "user": "bursar", "view": "home"})
+        try:
+            record = logging.makeLogRecord(
+                {"msg": "saved %s", "args": ("invoice",), "duration_ms": 4.2}
+            )
+            RequestContextFilter().filter(record)
+        finally:
+            request_context.reset(token)
+        line = json.loads(JsonFormatter().format(record))
+        self.assertEqual(line["message"], "saved invoice")
+        self.assertEqual(line["request_id"], "abc123")
+        self.assertEqual(line["user"], "bursar")
+        self.assertEqual(line["view"], "home")
+        self.assertEqual(line["duration_ms"], 4.2)
+
+    def test_request_id_is_returned_and_can_be_supplied(self):
+        user = User.objects.create_user("clerk", password="pass12345")
+        self.client.force_login(user)
+        response = self.client.get(reverse("home"))
+        self.assertEqual(len(response["X-Request-ID"]), 32)
+        response = self.client.get(reverse("home"), HTTP_X_REQUEST_ID="lb-42")
+        self.assertEqual(response["X-Request-ID"], "lb-42")
+
+
+class AuditLogTest(TestCase):
+    def setUp(self):
+        audit_log.flush()
+
+    def test_changes_are_buffered_until_flushed(self):
+        token = request_context.set({"request_id": "r1", "user": "registrar"})
+        try:
+            with self.captureOnCommitCallbacks(execute=True):
+                student = Student.objects.create(
+                    registration_number="AUD1", surname="Otieno", firstname="Amina"
+                )
+                student.firstname = "Aminah"
+                student.save()
+                student.delete()
+        finally:
+            request_context.reset(token)
+
+        self.assertFalse(AuditLog.objects.exists())
+        self.assertEqual(audit_log.flush(), 3)
+        entries = AuditLog.objects.order_by("pk")
+        self.assertEqual([e.action for e in entries], ["create", "update", "delete"])
+        self.assertEqual({e.username for e in entries}, {"registrar"})
+        self.assertEqual(entries[0].model, "students.Student")
+
+    def test_rolled_back_changes_are_not_audited(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            Student.objects.create(
+                registration_number="AUD2", surname="Mensah", firstname="Kofi"
+            )
+        self.assertEqual(audit_log.pending(), 0)
+
+    def test_system_log_page_is_staff_only(self):
+        AuditLog.objects.create(
+            timestamp="2030-01-01T00:00Z",
+            action="create",
+            model="finance.Invoice",
+            object_id="7",
+            object_repr="Invoice 7",
+            username="bursar",
+        )
+        staff = User.objects.create_user("head", password="pass12345", is_staff=True)
+        self.client.force_login(staff)
+        self.assertContains(self.client.get(reverse("system-log")), "Invoice 7")
+        teacher = User.objects.create_user("teacher", password="pass12345")
+        self.client.force_login(teacher)
+        self.assertEqual(self.client.get(reverse("system-log")).status_code, 403)
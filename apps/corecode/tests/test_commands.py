@@ -0,0 +1,103 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import SimpleTestCase, TestCase
+
+from apps.finance.models import Invoice, Receipt
+from apps.result.models import Result
+from apps.students.models import Student
+from attendance.models import AttendanceEntry
+
+SMALL_SCHOOL = {
+    "students": 30,
+    "classes": 3,
+    "sessions": 2,
+    "subjects": 3,
+    "attendance_days": 3,
+    "verbosity": 0,
+}
+
+
+def school_fingerprint():
+    return (
+        list(
+            Student.objects.order_by("registration_number").values_list(
+                "registration_number", "surname", "firstname", "current_class__name"
+            )
+        ),
+        list(
+            Result.objects.order_by("student__registration_number", "term", "subject")
+            .values_list("test_score", "exam_score")
+        ),
+        list(
+            Receipt.objects.order_by("invoice__student__registration_number", "id")
+            .values_list("amount_paid", "date_paid")
+        ),
+        list(AttendanceEntry.objects.order_by("id").values_list("status", flat=True)),
+    )
+
+
+class SeedSchoolTest(TestCase):
+    def test_same_seed_produces_same_data(self):
+        call_command("seed_school", **SMALL_SCHOOL)
+        first = school_fingerprint()
+        self.assertEqual(Student.objects.count(), 30)
+        self.assertEqual(Result.objects.count(), 30 * 3 * 3)
+        self.assertFalse(Invoice.objects.filter(amount_payable=0).exists())
+        # Every term carries the previous term's balance forward
+        invoices = list(
+            Invoice.objects.filter(student__registration_number="SEED000001").order_by("pk")
+        )
+        for previous, invoice in zip(invoices, invoices[1:]):
+            self.assertEqual(invoice.balance_from_previous_term, previous.balance)
+
+        call_command("seed_school", flush=True, **SMALL_SCHOOL)
+        self.assertEqual(school_fingerprint(), first)
+
+    def test_refuses_to_seed_twice_without_flush(self):
+        call_command("seed_school", **SMALL_SCHOOL)
+        with self.assertRaises(CommandError):
+            call_command("seed_school", **SMALL_SCHOOL)
+
+
+class BenchmarkUrlsTest(TestCase):
+    def test_baseline_round_trip(self):
+        call_command("seed_school", **SMALL_SCHOOL)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "baseline.json")
+            out = StringIO()
+            call_command(
+                "benchmark_urls",
+                iterations=2,
+                only=["home", "invoice-list"],
+                save=path,
+                stdout=out,
+            )
+            with open(path) as fh:
+                baseline = json.load(fh)["results"]
+            self.assertEqual(set(baseline), {"home", "invoice-list"})
+            self.assertEqual(baseline["home"]["status"], 200)
+            self.assertGreater(baseline["invoice-list"]["queries"], 0)
+
+            call_command(
+                "benchmark_urls", iterations=1, only=["home"], compare=path, stdout=out
+            )
+            self.assertIn("Compared with", out.getvalue())
+
+
+class BenchmarkSqliteWritesTest(SimpleTestCase):
+    def test_tuned_profile_does_not_fail_writers(self):
+        out = StringIO()
+        call_command(
+            "benchmark_sqlite_writes",
+            writers=3,
+            transactions=10,
+            rows=5,
+            profile="tuned",
+            stdout=out,
+        )
+        self.assertIn("30 committed, 0 failed", out.getvalue())
@@ -0,0 +1,64 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from apps.corecode.instrumentation import fingerprint, request_stats
+from apps.corecode.models import RequestStat
+
+
+class FingerprintTest(TestCase):
+    def test_literals_and_in_lists_are_collapsed(self):
+        self.assertEqual(
+            fingerprint('SELECT * FROM "t" WHERE "id" IN (%s, %s, %s) AND x = 5'),
+            fingerprint('SELECT * FROM "t" WHERE "id" IN (%s) AND x = 12'),
+        )
+
+
+class RequestStatsMiddlewareTest(TestCase):
+    def setUp(self):
+        request_stats.flush()
+        self.staff = User.objects.create_user(
+            "admin2", password="pass12345", is_staff=True
+        )
+        self.client.force_login(self.staff)
+
+    def test_requests_are_recorded_per_url_name(self):
+        self.client.get(reverse("home"))
+        names = [stat.url_name for stat in request_stats.snapshot()]
+        self.assertIn("home", names)
+
+    @override_settings(REQUEST_STATS_FLUSH_INTERVAL=0)
+    def test_stats_are_flushed_to_the_table(self):
+        self.client.get(reverse("home"))
+        self.assertTrue(RequestStat.objects.filter(url_name="home").exists())
+
+    def test_performance_page_is_staff_only(self):
+        self.client.get(reverse("home"))
+        response = self.client.get(reverse("performance"))
+        self.assertContains(response, "home")
+
+        teacher = User.objects.create_user("teacher2", password="pass12345")
+        self.client.force_login(teacher)
+        response = self.client.get(reverse("performance"))
+        self.assertEqual(response.status_code, 302)
+
+    def test_worst_query_comes_from_the_chosen_days(self):
+        old, recent = (
+            RequestStat.objects.create(
+                url_name="report",
+                window_start=timezone.now(),
+                requests=1,
+                worst_fingerprint=fp,
+                worst_fingerprint_count=count,
+            )
+            for fp, count in (("SELECT old", 50), ("SELECT recent", 12))
+        )
+        RequestStat.objects.filter(pk=old.pk).update(
+            flushed_at=timezone.now() - timedelta(days=30)
+        )
+        response = self.client.get(reverse("performance"), {"days": 7})
+        row = next(row for row in response.context["rows"] if row["url_name"] == "report")
+        self.assertEqual((row["requests"], row["fingerprint"]), (1, "SELECT recent"))
@@ -0,0 +1,52 @@
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from apps.corecode.models import ProfileCapture
+
+
+class ProfilerMiddlewareTest(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(
+            "admin3", password="pass12345", is_staff=True
+        )
+        self.client.force_login(self.staff)
+
+    def test_staff_can_capture_a_cprofile(self):
+        response = self.client.get(reverse("home") + "?_profile=1")
+        capture = ProfileCapture.objects.get(pk=response["X-Profile-Id"])
+        self.assertEqual(capture.kind, ProfileCapture.KIND_CPROFILE)
+        self.assertEqual(capture.url_name, "home")
+        self.assertIn("cumulative", capture.report)
+        self.assertIn("queries", capture.sql_log)
+
+        download = self.client.get(
+            reverse("profile-download", args=[capture.pk, "pstats"])
+        )
+        self.assertEqual(download.status_code, 200)
+        self.assertContains(
+            self.client.get(reverse("profile-detail", args=[capture.pk])), "home"
+        )
+
+    def test_header_requests_a_sampling_profile(self):
+        response = self.client.get(reverse("home"), HTTP_X_PROFILE="sample")
+        capture = ProfileCapture.objects.get(pk=response["X-Profile-Id"])
+        self.assertEqual(capture.kind, ProfileCapture.KIND_SAMPLING)
+        self.assertIn("samples every", capture.report)
+
+    def test_non_staff_cannot_profile(self):
+        teacher = User.objects.create_user("teacher3", password="pass12345")
+        self.client.force_login(teacher)
+        response = self.client.get(reverse("home") + "?_profile=1")
+        self.assertNotIn("X-Profile-Id", response)
+        self.assertFalse(ProfileCapture.objects.exists())
+
+    @override_settings(PROFILE_SLOW_REQUEST_MS=0, PROFILE_MAX_CAPTURES=2)
+    def test_slow_requests_are_kept_in_a_bounded_ring(self):
+        for _ in range(4):
+            self.client.get(reverse("home"))
+        captures = ProfileCapture.objects.all()
+        self.assertEqual(captures.count(), 2)
+        self.assertTrue(
+            all(c.trigger == ProfileCapture.TRIGGER_SLOW for c in captures)
+        )
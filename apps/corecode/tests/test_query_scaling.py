@@ -0,0 +1,165 @@
+"""Query counts of list and report views must not grow with the data."""
+
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from apps.corecode.models import AcademicSession, AcademicTerm, StudentClass, Subject
+from apps.finance.models import Invoice, InvoiceItem, Receipt
+from apps.result.models import Result
+from apps.students.models import Student
+from attendance.models import AttendanceEntry, AttendanceRegister
+
+N = 3
+
+
+def build_school(n):
+    """Create a school whose every list grows linearly with ``n``.
+
+    The first class holds ``n`` students, every student takes ``n`` subjects,
+    has an invoice with items and a receipt, and every class has ``n`` days
+    of registers (today included).
+    """
+    session = AcademicSession.objects.create(name=f"scale-{n}", current=True)
+    term = AcademicTerm.objects.create(name=f"scale-{n}", current=True)
+    subjects = [Subject.objects.create(name=f"scale-{n}-{i}") for i in range(n)]
+    classes = [StudentClass.objects.create(name=f"scale-{n}-{i}") for i in range(n)]
+
+    students = []
+    for i in range(2 * n - 1):
+        student_class = classes[0] if i < n else classes[i - n + 1]
+        students.append(
+            Student.objects.create(
+                registration_number=f"scale-{n}-{i}",
+                surname=f"Surname{i}",
+                firstname=f"First{i}",
+                current_class=student_class,
+            )
+        )
+
+    for student in students:
+        for subject in subjects:
+            Result.objects.create(
+                student=student,
+                session=session,
+                term=term,
+                current_class=student.current_class,
+                subject=subject,
+                test_score=20,
+                exam_score=40,
+            )
+        invoice = Invoice.objects.create(
+            student=student, session=session, term=term, class_for=student.current_class
+        )
+        InvoiceItem.objects.create(invoice=invoice, description="Tuition", amount=1000)
+        InvoiceItem.objects.create(invoice=invoice, description="Levy", amount=200)
+        Receipt.objects.create(invoice=invoice, amount_paid=500)
+
+    today = timezone.now().date()
+    for student_class in classes:
+        for day in range(n):
+            register = AttendanceRegister.objects.create(
+                date=today - timedelta(days=day),
+                student_class=student_class,
+                term=term,
+                session=session,
+            )
+            for student in students:
+                if student.current_class_id == student_class.id:
+                    AttendanceEntry.objects.create(register=register, student=student)
+
+    return {
+        "session": session,
+        "term": term,
+        "class": classes[0],
+        "student": students[0],
+    }
+
+
+# A time-based stats or audit flush during the measured request would add
+# queries of its own
+@override_settings(
+    REQUEST_STATS_ENABLED=False, AUDIT_BATCH_SIZE=10**6, AUDIT_FLUSH_INTERVAL=10**6
+)
+class QueryScalingTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_superuser("scaling", "s@example.com", "pass12345")
+        self.client.force_login(self.user)
+
+    def count_queries(self, n, url_for):
+        """Query count of one request against a school of size ``n``."""
+        with transaction.atomic():
+            school = build_school(n)
+            url = url_for(school)
+            response = self.client.get(url)  # warm the per-process caches
+            self.assertEqual(response.status_code, 200, url)
+            with CaptureQueriesContext(connection) as ctx:
+                self.client.get(url)
+            transaction.set_rollback(True)
+        return len(ctx.captured_queries)
+
+    def assertFlat(self, url_for):
+        small = self.count_queries(N, url_for)
+        large = self.count_queries(10 * N, url_for)
+        self.assertEqual(
+            small, large, f"query count grew from {small} to {large} with 10x the data"
+        )
+
+    def test_student_list(self):
+        self.assertFlat(lambda school: reverse("student-list"))
+
+    def test_student_detail(self):
+        self.assertFlat(lambda school: reverse("student-detail", args=[school["student"].pk]))
+
+    def test_invoice_list(self):
+        self.assertFlat(lambda school: reverse("invoice-list"))
+
+    def test_result_list(self):
+        self.assertFlat(lambda school: reverse("view-results"))
+
+    def test_class_report_sheet(self):
+        self.assertFlat(lambda school: reverse("class-report-sheet", args=[school["class"].pk]))
+
+    def test_report_card(self):
+        self.assertFlat(lambda school: reverse("report-card", args=[school["student"].pk]))
+
+    def test_attendance_register_list(self):
+        self.assertFlat(lambda school: reverse("attendance:register_list"))
+
+    def test_daily_attendance_dashboard(self):
+        self.assertFlat(lambda school: reverse("attendance:daily_dashboard"))
+
+    def test_attendance_summary_data(self):
+        self.assertFlat(
+            lambda school: reverse("attendance:attendance_summary_data")
+            + f"?session={school['session'].pk}&term={school['term'].pk}"
+        )
+
+    def test_take_attendance_submission(self):
+        def count(n):
+            with transaction.atomic():
+                school = build_school(n)
+                register = AttendanceRegister.objects.filter(
+                    student_class=school["class"]
+                ).first()
+                # One student has no entry yet, the rest are updated
+                register.entries.filter(student=school["student"]).delete()
+                students = Student.objects.filter(current_class=school["class"])
+                data = {f"status_{s.pk}": AttendanceEntry.STATUS_ABSENT for s in students}
+                url = reverse("attendance:take_attendance", args=[register.pk])
+                with CaptureQueriesContext(connection) as ctx:
+                    response = self.client.post(url, data)
+                self.assertEqual(response.status_code, 302)
+                self.assertEqual(
+                    register.entries.filter(status=AttendanceEntry.STATUS_ABSENT).count(),
+                    n,
+                )
+                transaction.set_rollback(True)
+            return len(ctx.captured_queries)
+
+        self.assertEqual(count(N), count(10 * N))
@@ -0,0 +1,127 @@
+from django.contrib.auth.models import User
+from django.db import connection
+from django.contrib.sessions.models import Session
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from apps.corecode.middleware import ThrottledSessionMiddleware
+from apps.corecode.models import AcademicSession, AcademicTerm, SiteConfig
+from apps.corecode.utils import current_session_and_term, site_settings
+
+
+class CurrentSessionAndTermTest(TestCase):
+    def setUp(self):
+        current_session_and_term.clear()
+        self.session = AcademicSession.objects.create(name="2030-2031", current=True)
+        self.term = AcademicTerm.objects.create(name="Third Term", current=True)
+        self.user = User.objects.create_user("teacher", password="pass12345")
+        self.client.force_login(self.user)
+
+    def assertNoSessionOrTermQueries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(url)
+        sql = " ".join(query["sql"] for query in ctx.captured_queries)
+        self.assertNotIn("corecode_academicsession", sql)
+        self.assertNotIn("corecode_academicterm", sql)
+
+    def test_manifest_does_not_query_session_or_term(self):
+        self.client.get("/manifest.json")
+        self.assertNoSessionOrTermQueries("/manifest.json")
+
+    def test_session_and_term_are_cached_between_requests(self):
+        response = self.client.get(reverse("home"))
+        self.assertContains(response, "2030-2031")
+        self.assertContains(response, "Third Term")
+        self.assertNoSessionOrTermQueries(reverse("home"))
+
+    def test_changing_current_term_refreshes_cache(self):
+        self.client.get(reverse("home"))
+        other = AcademicTerm.objects.create(name="First Term X", current=False)
+        self.client.post(
+            reverse("current-session"),
+            {"current_session": self.session.pk, "current_term": other.pk},
+        )
+        response = self.client.get(reverse("home"))
+        self.assertContains(response, "First Term X")
+
+
+class SiteSettingsTest(TestCase):
+    def setUp(self):
+        site_settings.clear()
+        SiteConfig.objects.create(key="max_students", value="40")
+        self.user = User.objects.create_user("bursar", password="pass12345")
+        self.client.force_login(self.user)
+
+    def test_accessors(self):
+        self.assertEqual(site_settings.get_str("max_students"), "40")
+        self.assertIn("max_students", site_settings)
+        self.assertEqual(site_settings.get_str("missing", "x"), "x")
+        with self.assertRaises(TypeError):
+            site_settings.snapshot()["max_students"] = "1"
+
+    def test_snapshot_is_not_reloaded_per_request(self):
+        self.client.get(reverse("home"))
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse("home"))
+        sql = " ".join(query["sql"] for query in ctx.captured_queries)
+        self.assertNotIn("corecode_siteconfig", sql)
+
+    def test_saving_the_formset_refreshes_the_snapshot(self):
+        configs = list(SiteConfig.objects.order_by("pk"))
+        data = {
+            "form-TOTAL_FORMS": len(configs) + 1,
+            "form-INITIAL_FORMS": len(configs),
+        }
+        for i, config in enumerate(configs):
+            data[f"form-{i}-id"] = config.pk
+            data[f"form-{i}-key"] = config.key
+            data[f"form-{i}-value"] = (
+                "45" if config.key == "max_students" else config.value
+            )
+        data[f"form-{len(configs)}-key"] = "motto"
+        data[f"form-{len(configs)}-value"] = "Knowledge is light"
+        self.client.post(reverse("configs"), data)
+        self.assertEqual(site_settings.get_str("max_students"), "45")
+        self.assertEqual(site_settings.get_str("motto"), "Knowledge is light")
+
+
+class ThrottledSessionTest(TestCase):
+    def setUp(self):
+        User.objects.create_user("clerk", password="pass12345")
+        self.client.login(username="clerk", password="pass12345")
+        self.client.get(reverse("home"))
+
+    def session_writes(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        writes = [
+            q["sql"]
+            for q in ctx.captured_queries
+            if "django_session" in q["sql"] and not q["sql"].startswith("SELECT")
+        ]
+        return response, writes
+
+    def test_recent_session_is_not_rewritten(self):
+        response, writes = self.session_writes(reverse("home"))
+        self.assertEqual(writes, [])
+        self.assertNotIn("sessionid", response.cookies)
+
+    def test_session_is_refreshed_after_the_refresh_interval(self):
+        session = self.client.session
+        session[ThrottledSessionMiddleware.REFRESHED_KEY] = 0
+        session.save()
+        response, writes = self.session_writes(reverse("home"))
+        self.assertEqual(len(writes), 1)
+        self.assertIn("sessionid", response.cookies)
+        self.assertEqual(self.session_writes(reverse("home"))[1], [])
+
+    @override_settings(SESSION_ENGINE="django.contrib.sessions.backends.signed_cookies")
+    def test_signed_cookie_sessions(self):
+        # A new client, as the session middleware binds its engine on load
+        client = Client()
+        stored = Session.objects.count()
+        client.force_login(User.objects.get(username="clerk"))
+        response = client.get(reverse("home"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Session.objects.count(), stored)
@@ -3,6 +3,7 @@ from django.views.generic import TemplateView
 from .views_class_management import teacher_class_list, class_detail
 
 from .views import (
+    AuditLogListView,
     ClassCreateView,
     ClassDeleteView,
     ClassListView,
@@ -25,6 +26,10 @@ from .views import (
     signup_view,
     login_view,
     logout_view,
+    performance_overview,
+    profile_detail,
+    profile_download,
+    profile_list,
 )
 
 urlpatterns = [
@@ -65,6 +70,15 @@ urlpatterns = [
         SubjectDeleteView.as_view(),
         name="subject-delete",
     ),
+    path("performance/", performance_overview, name="performance"),
+    path("performance/profiles/", profile_list, name="profiles"),
+    path("system-log/", AuditLogListView.as_view(), name="system-log"),
+    path("performance/profiles/<int:pk>/", profile_detail, name="profile-detail"),
+    path(
+        "performance/profiles/<int:pk>/<str:part>/",
+        profile_download,
+        name="profile-download",
+    ),
     # Authentication URLs
     path("signup/", signup_view, name="signup"),
     path("login/", login_view, name="login"),
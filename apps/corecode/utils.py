@@ -0,0 +1,60 @@
+from types import MappingProxyType
+
+from .cache import ProcessCache
+from .models import AcademicSession, AcademicTerm, SiteConfig
+
+
+def _load_current_session_and_term():
+    return (
+        AcademicSession.objects.filter(current=True).first(),
+        AcademicTerm.objects.filter(current=True).first(),
+    )
+
+
+current_session_and_term = ProcessCache(
+    "current-session-term", _load_current_session_and_term
+)
+
+
+def get_current_session():
+    """Return the current AcademicSession, or None if none is set."""
+    return current_session_and_term.get()[0]
+
+
+def get_current_term():
+    """Return the current AcademicTerm, or None if none is set."""
+    return current_session_and_term.get()[1]
+
+
+class SiteSettings:
+    """Read-only view over the SiteConfig table.
+
+    The rows are loaded once per process into an immutable snapshot and only
+    reloaded after ``invalidate`` is called (see SiteConfigView.post).
+    """
+
+    def __init__(self):
+        self._cache = ProcessCache("site-config", self._load)
+
+    @staticmethod
+    def _load():
+        return MappingProxyType(dict(SiteConfig.objects.values_list("key", "value")))
+
+    def snapshot(self):
+        """Return every key/value pair as an immutable mapping."""
+        return self._cache.get()
+
+    def invalidate(self):
+        self._cache.invalidate()
+
+    def clear(self):
+        self._cache.clear()
+
+    def __contains__(self, key):
+        return key in self.snapshot()
+
+    def get_str(self, key, default=""):
+        return self.snapshot().get(key, default)
+
+
+site_settings = SiteSettings()
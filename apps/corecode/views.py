@@ -1,13 +1,21 @@
+from datetime import timedelta
+
+from django.conf import settings
 from django.contrib import messages
-from django.contrib.auth.decorators import login_required
-from django.contrib.auth.mixins import LoginRequiredMixin
+from django.contrib.auth.decorators import login_required, user_passes_test
+from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib.messages.views import SuccessMessageMixin
-from django.shortcuts import redirect, render
+from django.http import Http404, HttpResponse
+from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse_lazy
 from django.views.generic import ListView, TemplateView, View
 from django.views.generic.edit import CreateView, DeleteView, UpdateView
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
+from django.db.models import Max, OuterRef, Subquery, Sum
+from django.utils import timezone
+
+from apps.finance.summaries import daily_totals
 
 from .forms import (
     AcademicSessionForm,
@@ -17,18 +25,34 @@ from .forms import (
     StudentClassForm,
     SubjectForm,
 )
+from .instrumentation import request_stats
 from .models import (
     AcademicSession,
     AcademicTerm,
+    AuditLog,
+    ProfileCapture,
+    RequestStat,
     SiteConfig,
     StudentClass,
     Subject,
 )
+from .utils import current_session_and_term, site_settings
 
 
 class IndexView(LoginRequiredMixin, TemplateView):
     template_name = "index.html"
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # Read from the pre-aggregated daily summary, not from receipts
+        collections = daily_totals(days=14)
+        context["collections"] = collections
+        context["collections_total"] = {
+            "amount": sum(day["amount"] for day in collections),
+            "receipt_count": sum(day["receipt_count"] for day in collections),
+        }
+        return context
+
 
 class SiteConfigView(LoginRequiredMixin, View):
     """Site Config View"""
@@ -38,14 +62,16 @@ class SiteConfigView(LoginRequiredMixin, View):
 
     def get(self, request, *args, **kwargs):
         formset = self.form_class(queryset=SiteConfig.objects.all())
-        context = {"formset": formset}
+        context = {"formset": formset, "title": "Configuration"}
         return render(request, self.template_name, context)
 
     def post(self, request, *args, **kwargs):
         formset = self.form_class(request.POST)
         if formset.is_valid():
             formset.save()
+            site_settings.invalidate()
             messages.success(request, "Configurations successfully updated")
+            return redirect("configs")
         context = {"formset": formset, "title": "Configuration"}
         return render(request, self.template_name, context)
 
@@ -271,6 +297,7 @@ class CurrentSessionAndTermView(LoginRequiredMixin, View):
             AcademicSession.objects.exclude(name=session).update(current=False)
             AcademicTerm.objects.filter(name=term).update(current=True)
             AcademicTerm.objects.exclude(name=term).update(current=False)
+            current_session_and_term.invalidate()
             messages.success(request, "Current session and term updated successfully.")
 
         return render(request, self.template_name, {"form": form})
@@ -312,4 +339,161 @@ def login_view(request):
 def logout_view(request):
     logout(request)
     messages.info(request, 'You have been logged out successfully.')
-    return redirect('login')
\ No newline at end of file
+    return redirect('login')
+
+
+PERFORMANCE_SORTS = {
+    "avg": "avg_time_ms",
+    "total": "total_time_ms",
+    "max": "max_time_ms",
+    "queries": "avg_queries",
+    "n1": "n_plus_one_requests",
+}
+
+
+@user_passes_test(lambda user: user.is_staff)
+def performance_overview(request):
+    """Rank endpoints by latency and query count (staff only)."""
+    try:
+        days = max(1, int(request.GET.get("days", 7)))
+    except ValueError:
+        days = 7
+    sort = request.GET.get("sort", "avg")
+    if sort not in PERFORMANCE_SORTS:
+        sort = "avg"
+
+    recent = RequestStat.objects.filter(flushed_at__gte=timezone.now() - timedelta(days=days))
+    worst = recent.filter(url_name=OuterRef("url_name")).order_by("-worst_fingerprint_count")
+    flushed = (
+        recent
+        .values("url_name")
+        .annotate(
+            requests_sum=Sum("requests"),
+            total_time_sum=Sum("total_time_ms"),
+            max_time=Max("max_time_ms"),
+            queries_sum=Sum("total_queries"),
+            max_queries_seen=Max("max_queries"),
+            sql_time_sum=Sum("total_sql_ms"),
+            n_plus_one_sum=Sum("n_plus_one_requests"),
+            fingerprint=Subquery(worst.values("worst_fingerprint")[:1]),
+            fingerprint_count=Subquery(worst.values("worst_fingerprint_count")[:1]),
+        )
+    )
+
+    rows = {}
+    for stat in flushed:
+        rows[stat["url_name"]] = {
+            "url_name": stat["url_name"],
+            "requests": stat["requests_sum"],
+            "total_time_ms": stat["total_time_sum"],
+            "max_time_ms": stat["max_time"],
+            "total_queries": stat["queries_sum"],
+            "max_queries": stat["max_queries_seen"],
+            "total_sql_ms": stat["sql_time_sum"],
+            "n_plus_one_requests": stat["n_plus_one_sum"],
+            "fingerprint": stat["fingerprint"] or "",
+            "fingerprint_count": stat["fingerprint_count"] or 0,
+        }
+
+    # Fold in what this worker has not flushed yet
+    for stat in request_stats.snapshot():
+        row = rows.setdefault(
+            stat.url_name,
+            {
+                "url_name": stat.url_name,
+                "requests": 0,
+                "total_time_ms": 0,
+                "max_time_ms": 0,
+                "total_queries": 0,
+                "max_queries": 0,
+                "total_sql_ms": 0,
+                "n_plus_one_requests": 0,
+                "fingerprint": "",
+                "fingerprint_count": 0,
+            },
+        )
+        row["requests"] += stat.requests
+        row["total_time_ms"] += stat.total_time * 1000
+        row["max_time_ms"] = max(row["max_time_ms"], stat.max_time * 1000)
+        row["total_queries"] += stat.total_queries
+        row["max_queries"] = max(row["max_queries"], stat.max_queries)
+        row["total_sql_ms"] += stat.total_sql_time * 1000
+        row["n_plus_one_requests"] += stat.n_plus_one_requests
+        fp, fp_count = stat.worst_fingerprint
+        if fp_count > row["fingerprint_count"]:
+            row["fingerprint"], row["fingerprint_count"] = fp, fp_count
+
+    for row in rows.values():
+        requests = row["requests"] or 1
+        row["avg_time_ms"] = row["total_time_ms"] / requests
+        row["avg_queries"] = row["total_queries"] / requests
+        row["avg_sql_ms"] = row["total_sql_ms"] / requests
+
+    ranked = sorted(rows.values(), key=lambda r: r[PERFORMANCE_SORTS[sort]], reverse=True)
+    context = {"rows": ranked, "days": days, "sort": sort}
+    return render(request, "corecode/performance.html", context)
+
+
+@user_passes_test(lambda user: user.is_staff)
+def profile_list(request):
+    """Stored request profiles, newest first (staff only)."""
+    captures = ProfileCapture.objects.select_related("user").defer(
+        "report", "sql_log", "raw_stats"
+    )
+    return render(request, "corecode/profile_list.html", {"captures": captures})
+
+
+@user_passes_test(lambda user: user.is_staff)
+def profile_detail(request, pk):
+    capture = get_object_or_404(ProfileCapture.objects.defer("raw_stats"), pk=pk)
+    return render(request, "corecode/profile_detail.html", {"capture": capture})
+
+
+@user_passes_test(lambda user: user.is_staff)
+def profile_download(request, pk, part):
+    """Download the report, SQL log or raw pstats data of a capture."""
+    capture = get_object_or_404(ProfileCapture, pk=pk)
+    if part == "report":
+        response = HttpResponse(capture.report, content_type="text/plain")
+        filename = f"profile-{capture.pk}.txt"
+    elif part == "sql":
+        response = HttpResponse(capture.sql_log, content_type="text/plain")
+        filename = f"profile-{capture.pk}-sql.txt"
+    elif part == "pstats" and capture.raw_stats:
+        response = HttpResponse(
+            bytes(capture.raw_stats), content_type="application/octet-stream"
+        )
+        filename = f"profile-{capture.pk}.prof"
+    else:
+        raise Http404
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+class AuditLogListView(LoginRequiredMixin, UserPassesTestMixin, ListView):
+    """Who created, changed or deleted what (staff only)."""
+
+    model = AuditLog
+    template_name = "corecode/auditlog_list.html"
+    paginate_by = 50
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        model = self.request.GET.get("model")
+        if model:
+            queryset = queryset.filter(model=model)
+        username = self.request.GET.get("user")
+        if username:
+            queryset = queryset.filter(username=username)
+        object_id = self.request.GET.get("object")
+        if object_id:
+            queryset = queryset.filter(object_id=object_id)
+        return queryset
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["models"] = settings.AUDITED_MODELS
+        return context
@@ -0,0 +1,224 @@
+"""Printable invoice and receipt documents, rendered in bulk.
+
+Documents are built from plain data loaded a batch of invoices at a time
+(three queries per batch), looked up in a cache keyed by a hash of that
+data, and only the missing ones are rendered, across a pool of processes
+when there are enough of them. The results are written into a zip as they
+are produced, so a download for the whole school starts straight away and
+never holds every document in memory.
+"""
+
+import hashlib
+import json
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import caches
+from django.template.loader import render_to_string
+from django.utils.text import slugify
+
+from apps.corecode.utils import site_settings
+
+from .models import Invoice
+
+# Bump when the document templates change so cached documents are redone
+DOCUMENT_VERSION = 2
+CACHE_TIMEOUT = 60 * 60 * 24 * 30
+TEMPLATES = {
+    "invoice": "finance/invoice_document.html",
+    "receipt": "finance/receipt_document.html",
+}
+
+
+def available_cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _school():
+    return {key: site_settings.get_str(key) for key in ("school_name", "school_address")}
+
+
+def invoice_data(invoice, school):
+    """Everything an invoice document shows, as JSON-friendly values."""
+    return {
+        "kind": "invoice",
+        "pk": invoice.pk,
+        "school": school,
+        "student": str(invoice.student),
+        "registration_number": invoice.student.registration_number,
+        "session": str(invoice.session),
+        "term": str(invoice.term),
+        "class_for": str(invoice.class_for),
+        "status": invoice.get_status_display(),
+        "issued_on": invoice.issued_on.isoformat(),
+        "items": [[item.description, item.amount] for item in invoice.invoiceitem_set.all()],
+        "receipts": [
+            [receipt.number, receipt.date_paid.isoformat(), receipt.amount_paid, receipt.comment]
+            for receipt in invoice.receipt_set.all()
+        ],
+        "amount_payable": invoice.amount_payable,
+        "balance_from_previous_term": invoice.balance_from_previous_term,
+        "total_amount_payable": invoice.total_amount_payable(),
+        "amount_paid": invoice.amount_paid,
+        "balance": invoice.balance,
+    }
+
+
+def receipt_data(invoice, school):
+    """One document per receipt of ``invoice``, each with the balance after it."""
+    balance = invoice.total_amount_payable()
+    documents = []
+    for receipt in sorted(invoice.receipt_set.all(), key=lambda r: (r.date_paid, r.pk)):
+        balance -= receipt.amount_paid
+        documents.append(
+            {
+                "kind": "receipt",
+                "pk": receipt.pk,
+                "number": receipt.number,
+                "school": school,
+                "student": str(invoice.student),
+                "registration_number": invoice.student.registration_number,
+                "session": str(invoice.session),
+                "term": str(invoice.term),
+                "class_for": str(invoice.class_for),
+                "invoice": invoice.pk,
+                "date_paid": receipt.date_paid.isoformat(),
+                "amount_paid": receipt.amount_paid,
+                "comment": receipt.comment,
+                "total_amount_payable": invoice.total_amount_payable(),
+                "balance": balance,
+            }
+        )
+    return documents
+
+
+def digest(data):
+    payload = json.dumps(data, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(f"{DOCUMENT_VERSION}:{payload}".encode()).hexdigest()
+
+
+def filename(data):
+    folder = slugify(data["class_for"]) or "no-class"
+    reg = slugify(data["registration_number"])
+    return f"{folder}/{reg}-{data['kind']}-{data['pk']}.html"
+
+
+def render_document(data):
+    return render_to_string(TEMPLATES[data["kind"]], data)
+
+
+def _init_worker():
+    # Processes started with "spawn" (the default outside Linux) begin empty
+    if not apps.ready:
+        import django
+
+        django.setup()
+
+
+class DocumentRenderer:
+    """Render documents through the cache, sharing one process pool.
+
+    Use as a context manager; the pool is only started if a batch has more
+    missing documents than ``min_parallel``.
+    """
+
+    def __init__(self, workers=None, min_parallel=20):
+        workers = workers or getattr(settings, "FINANCE_DOCUMENT_WORKERS", None)
+        self.workers = workers or available_cores()
+        self.min_parallel = min_parallel
+        self.cache = caches[getattr(settings, "FINANCE_DOCUMENT_CACHE", "shared")]
+        self.pool = None
+        self.rendered = self.cached = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+
+    def _render(self, documents):
+        if self.workers < 2 or len(documents) < max(self.min_parallel, 2):
+            return [render_document(data) for data in documents]
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(self.workers, initializer=_init_worker)
+        chunksize = max(1, len(documents) // (self.workers * 4))
+        return list(self.pool.map(render_document, documents, chunksize=chunksize))
+
+    def render(self, documents):
+        """Return the HTML of each of ``documents`` (data dicts), in order."""
+        keys = [f"finance-document:{digest(data)}" for data in documents]
+        found = self.cache.get_many(keys)
+        missing = [i for i, key in enumerate(keys) if key not in found]
+        if missing:
+            html = self._render([documents[i] for i in missing])
+            fresh = {keys[i]: text for i, text in zip(missing, html)}
+            self.cache.set_many(fresh, CACHE_TIMEOUT)
+            found.update(fresh)
+        self.rendered += len(missing)
+        self.cached += len(documents) - len(missing)
+        return [found[key] for key in keys]
+
+
+def iter_documents(kind, invoices, batch_size=200):
+    """Yield batches of document data for ``invoices`` (a queryset)."""
+    school = _school()
+    invoices = (
+        invoices.select_related("student", "session", "term", "class_for")
+        .prefetch_related("invoiceitem_set", "receipt_set")
+        .order_by("class_for__name", "student__surname", "student__firstname", "pk")
+        .iterator(chunk_size=batch_size)
+    )
+    while True:
+        batch = list(islice(invoices, batch_size))
+        if not batch:
+            return
+        if kind == "invoice":
+            yield [invoice_data(invoice, school) for invoice in batch]
+        else:
+            yield [data for invoice in batch for data in receipt_data(invoice, school)]
+
+
+class _ZipStream:
+    """A write-only file whose contents are taken as they are written."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def stream_zip(kind, invoices, batch_size=200, workers=None):
+    """Yield a zip of the ``kind`` documents of ``invoices``, batch by batch."""
+    stream = _ZipStream()
+    with DocumentRenderer(workers) as renderer:
+        with zipfile.ZipFile(stream, "w", zipfile.ZIP_DEFLATED) as archive:
+            for documents in iter_documents(kind, invoices, batch_size):
+                for data, html in zip(documents, renderer.render(documents)):
+                    archive.writestr(filename(data), html)
+                yield stream.take()
+        yield stream.take()
+
+
+def render_invoice(pk):
+    """The printable document of a single invoice."""
+    documents = next(iter_documents("invoice", Invoice.objects.filter(pk=pk)))
+    with DocumentRenderer(workers=1) as renderer:
+        return renderer.render(documents)[0]
@@ -1,6 +1,18 @@
+from django import forms
+from django.db.models import Q
 from django.forms import inlineformset_factory, modelformset_factory
 
-from .models import Invoice, InvoiceItem, Receipt
+from apps.corecode.models import AcademicSession, AcademicTerm, StudentClass
+
+from .models import (
+    BankStatement,
+    FeeStructure,
+    FeeStructureItem,
+    Invoice,
+    InvoiceImport,
+    InvoiceItem,
+    Receipt,
+)
 
 InvoiceItemFormset = inlineformset_factory(
     Invoice, InvoiceItem, fields=["description", "amount"], extra=1, can_delete=True
@@ -15,3 +27,160 @@ InvoiceReceiptFormSet = inlineformset_factory(
 )
 
 Invoices = modelformset_factory(Invoice, exclude=(), extra=4)
+
+FeeStructureItemFormset = inlineformset_factory(
+    FeeStructure,
+    FeeStructureItem,
+    fields=["description", "amount"],
+    extra=1,
+    can_delete=True,
+)
+
+
+class BulkInvoiceForm(forms.Form):
+    session = forms.ModelChoiceField(AcademicSession.objects.all())
+    term = forms.ModelChoiceField(AcademicTerm.objects.all())
+    classes = forms.ModelMultipleChoiceField(
+        StudentClass.objects.all(), widget=forms.CheckboxSelectMultiple
+    )
+    dry_run = forms.BooleanField(
+        required=False, initial=True, label="Preview only (nothing is saved)"
+    )
+
+
+class TermRolloverForm(forms.Form):
+    session = forms.ModelChoiceField(AcademicSession.objects.all(), label="Close session")
+    term = forms.ModelChoiceField(AcademicTerm.objects.all(), label="Close term")
+    next_session = forms.ModelChoiceField(
+        AcademicSession.objects.all(), label="Carry balances to session"
+    )
+    next_term = forms.ModelChoiceField(AcademicTerm.objects.all(), label="Carry balances to term")
+    dry_run = forms.BooleanField(
+        required=False, initial=True, label="Preview only (nothing is saved)"
+    )
+
+    def clean(self):
+        data = super().clean()
+        if (data.get("session"), data.get("term")) == (
+            data.get("next_session"),
+            data.get("next_term"),
+        ):
+            raise forms.ValidationError("Choose a different session or term to carry to.")
+        return data
+
+
+class DocumentBatchForm(forms.Form):
+    kind = forms.ChoiceField(
+        choices=[("invoice", "Invoices"), ("receipt", "Receipts")], label="Documents"
+    )
+    session = forms.ModelChoiceField(AcademicSession.objects.all())
+    term = forms.ModelChoiceField(AcademicTerm.objects.all())
+    student_class = forms.ModelChoiceField(
+        StudentClass.objects.all(), required=False, empty_label="Whole school", label="Class"
+    )
+
+
+class ReportFilterForm(forms.Form):
+    session = forms.ModelChoiceField(
+        AcademicSession.objects.all(), required=False, empty_label="All sessions"
+    )
+    term = forms.ModelChoiceField(
+        AcademicTerm.objects.all(), required=False, empty_label="All terms"
+    )
+    student_class = forms.ModelChoiceField(
+        StudentClass.objects.all(), required=False, empty_label="All classes"
+    )
+    limit = forms.IntegerField(
+        required=False, min_value=1, max_value=10000, label="Debtors to list"
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for field in self.fields.values():
+            field.widget.attrs.update(
+                {"class": "form-control form-control-sm", "placeholder": field.label}
+            )
+
+
+class InvoiceFilterForm(forms.Form):
+    q = forms.CharField(required=False, label="Student name or reg. number")
+    session = forms.ModelChoiceField(
+        AcademicSession.objects.all(), required=False, empty_label="All sessions"
+    )
+    term = forms.ModelChoiceField(
+        AcademicTerm.objects.all(), required=False, empty_label="All terms"
+    )
+    student_class = forms.ModelChoiceField(
+        StudentClass.objects.all(), required=False, empty_label="All classes"
+    )
+    status = forms.ChoiceField(
+        choices=[("", "Any status"), ("active", "Active"), ("closed", "Closed")],
+        required=False,
+    )
+    min_balance = forms.IntegerField(required=False, label="Balance from")
+    max_balance = forms.IntegerField(required=False, label="Balance to")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for field in self.fields.values():
+            field.widget.attrs.update(
+                {"class": "form-control form-control-sm", "placeholder": field.label}
+            )
+
+    def filter(self, queryset):
+        """Narrow ``queryset`` by the valid filters (all of them must match).
+
+        A field that doesn't validate is left out; the others still apply.
+        """
+        if not self.is_bound:
+            return queryset
+        self.is_valid()
+        data = self.cleaned_data
+        for word in data.get("q", "").split():
+            queryset = queryset.filter(
+                Q(student__registration_number__istartswith=word)
+                | Q(student__surname__icontains=word)
+                | Q(student__firstname__icontains=word)
+                | Q(student__other_name__icontains=word)
+            )
+        if data.get("session"):
+            queryset = queryset.filter(session=data["session"])
+        if data.get("term"):
+            queryset = queryset.filter(term=data["term"])
+        if data.get("student_class"):
+            queryset = queryset.filter(class_for=data["student_class"])
+        if data.get("status"):
+            queryset = queryset.filter(status=data["status"])
+        if data.get("min_balance") is not None:
+            queryset = queryset.filter(balance__gte=data["min_balance"])
+        if data.get("max_balance") is not None:
+            queryset = queryset.filter(balance__lte=data["max_balance"])
+        return queryset
+
+
+class SpreadsheetUploadMixin:
+    def clean_file(self):
+        file = self.cleaned_data["file"]
+        if not file.name.lower().endswith((".csv", ".xlsx", ".xlsm")):
+            raise forms.ValidationError("Upload a .csv or .xlsx file.")
+        return file
+
+
+class InvoiceImportForm(SpreadsheetUploadMixin, forms.ModelForm):
+    class Meta:
+        model = InvoiceImport
+        fields = ["file", "session", "term"]
+        help_texts = {
+            "file": "CSV or XLSX with columns registration_number, description, "
+            "amount and optionally class",
+        }
+
+
+class BankStatementForm(SpreadsheetUploadMixin, forms.ModelForm):
+    class Meta:
+        model = BankStatement
+        fields = ["file"]
+        help_texts = {
+            "file": "CSV or XLSX with an amount column and a reference, description "
+            "or registration number column; a date column is optional",
+        }
@@ -0,0 +1,416 @@
+"""Import invoice lines from a CSV or XLSX file.
+
+The file is read row by row (never loaded whole), every row is validated
+against lookup maps of students and classes built with one query each, and
+valid rows are upserted in chunks: one invoice per student for the import's
+session and term, one item per description on that invoice. Rows that fail
+validation are written to a per-row CSV error report.
+"""
+
+import codecs
+import csv
+import io
+import logging
+import os
+import threading
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from apps.corecode.audit import audit_log
+from apps.corecode.models import StudentClass
+from apps.students.models import Student
+
+from . import ledger
+from .models import Invoice, InvoiceImport, InvoiceItem
+from .services import refresh_invoice_totals
+
+logger = logging.getLogger(__name__)
+
+# Accepted spellings of each column header
+COLUMNS = {
+    "registration_number": {
+        "registration_number",
+        "registration number",
+        "reg",
+        "reg_no",
+        "reg no",
+        "admission number",
+    },
+    "description": {"description", "item", "fee", "fee type"},
+    "amount": {"amount", "fee amount"},
+    "class": {"class", "current_class", "class_for"},
+}
+REQUIRED_COLUMNS = ["registration_number", "description", "amount"]
+ERROR_REPORT_HEADER = ["line", "registration_number", "description", "amount", "error"]
+
+
+class ImportFormatError(ValueError):
+    """The file can't be imported at all (wrong type, missing columns)."""
+
+
+def _is_xlsx(name):
+    return os.path.splitext(name)[1].lower() in (".xlsx", ".xlsm")
+
+
+def _load_workbook(fileobj):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ImportFormatError("Install openpyxl to import .xlsx files, or upload a CSV.")
+    return load_workbook(fileobj, read_only=True, data_only=True)
+
+
+def iter_rows(fileobj, name):
+    """Yield each row of the file as a list of cell values, header first."""
+    if _is_xlsx(name):
+        workbook = _load_workbook(fileobj)
+        try:
+            yield from workbook.active.iter_rows(values_only=True)
+        finally:
+            workbook.close()
+    else:
+        yield from csv.reader(codecs.iterdecode(fileobj, "utf-8-sig"))
+
+
+def count_rows(fileobj, name):
+    """Number of data rows, read without holding the file in memory."""
+    if _is_xlsx(name):
+        workbook = _load_workbook(fileobj)
+        try:
+            max_row = workbook.active.max_row
+        finally:
+            workbook.close()
+        return max(0, max_row - 1) if max_row else None
+    lines = 0
+    last = b"\n"
+    for block in iter(lambda: fileobj.read(1 << 20), b""):
+        lines += block.count(b"\n")
+        last = block[-1:]
+    if last != b"\n":
+        lines += 1
+    return max(0, lines - 1)
+
+
+def iter_records(rows, columns=COLUMNS, required=REQUIRED_COLUMNS):
+    """Turn rows into ``(line_number, {column: value})`` using the header.
+
+    ``columns`` maps each column to the header spellings it accepts.
+    """
+    rows = iter(rows)
+    header = next(rows, None)
+    if header is None:
+        raise ImportFormatError("The file is empty.")
+    positions = {}
+    for index, title in enumerate(header):
+        title = str(title or "").strip().lower()
+        for column, spellings in columns.items():
+            if title in spellings:
+                positions.setdefault(column, index)
+    missing = [column for column in required if column not in positions]
+    if missing:
+        raise ImportFormatError(f"Missing column(s): {', '.join(missing)}")
+    for line, row in enumerate(rows, start=2):
+        if not any(cell not in (None, "") for cell in row):
+            continue
+        yield line, {
+            column: row[index] if index < len(row) else None
+            for column, index in positions.items()
+        }
+
+
+def cell_text(value):
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def _amount(value):
+    if isinstance(value, (int, float)):
+        if float(value).is_integer():
+            return int(value)
+        raise ValueError
+    return int(cell_text(value).replace(",", ""))
+
+
+class RowValidator:
+    """Check rows against students and classes loaded once up front."""
+
+    def __init__(self):
+        self.students = {
+            reg: (pk, class_id)
+            for pk, reg, class_id in Student.objects.values_list(
+                "pk", "registration_number", "current_class_id"
+            )
+        }
+        self.classes = {
+            name.strip().lower(): pk
+            for pk, name in StudentClass.objects.values_list("pk", "name")
+        }
+
+    def __call__(self, record):
+        """Return ``(student_id, class_id, description, amount)`` or raise ValueError."""
+        reg = cell_text(record["registration_number"])
+        if not reg:
+            raise ValueError("Registration number is required")
+        if reg not in self.students:
+            raise ValueError(f"Unknown registration number {reg!r}")
+        student_id, class_id = self.students[reg]
+
+        description = cell_text(record["description"])
+        if not description:
+            raise ValueError("Description is required")
+        if len(description) > 200:
+            raise ValueError("Description is longer than 200 characters")
+
+        try:
+            amount = _amount(record["amount"])
+        except (TypeError, ValueError):
+            raise ValueError(f"Amount {cell_text(record['amount'])!r} is not a whole number")
+
+        class_name = cell_text(record.get("class"))
+        if class_name:
+            class_id = self.classes.get(class_name.lower())
+            if class_id is None:
+                raise ValueError(f"Unknown class {class_name!r}")
+        elif class_id is None:
+            raise ValueError("Student has no class; add a class column")
+        return student_id, class_id, description, amount
+
+
+def upsert_lines(session, term, lines):
+    """Write validated ``(student_id, class_id, description, amount)`` lines.
+
+    Returns ``(created_invoices, created_items, updated_items)``. A later line
+    for the same student and description replaces an earlier one.
+    """
+    latest = {}
+    for student_id, class_id, description, amount in lines:
+        latest[(student_id, description.lower())] = (class_id, description, amount)
+    if not latest:
+        return 0, 0, 0
+    student_ids = {student_id for student_id, _ in latest}
+
+    with transaction.atomic():
+        invoices = dict(
+            Invoice.objects.filter(session=session, term=term, student_id__in=student_ids)
+            .order_by("pk")
+            .values_list("student_id", "pk")
+        )
+        new_students = student_ids - set(invoices)
+        new_invoices = []
+        if new_students:
+            # Carry forward each student's latest earlier invoice, like a
+            # manually created invoice does
+            previous = Invoice.objects.filter(student=OuterRef("pk")).exclude(
+                session=session, term=term
+            ).order_by("-pk")
+            carried = {
+                pk: (previous_id, balance)
+                for pk, previous_id, balance in Student.objects.filter(pk__in=new_students)
+                .annotate(
+                    previous_id=Subquery(previous.values("pk")[:1]),
+                    previous_balance=Subquery(previous.values("balance")[:1]),
+                )
+                .values_list("pk", "previous_id", "previous_balance")
+            }
+            class_for = {}
+            for (student_id, _), (class_id, _, _) in latest.items():
+                class_for.setdefault(student_id, class_id)
+            new_invoices = Invoice.objects.bulk_create(
+                Invoice(
+                    student_id=student_id,
+                    session=session,
+                    term=term,
+                    class_for_id=class_for[student_id],
+                    balance_from_previous_term=carried[student_id][1] or 0,
+                )
+                for student_id in sorted(new_students)
+            )
+            audit_log.record_many("create", new_invoices, related=["student"])
+            invoices.update((invoice.student_id, invoice.pk) for invoice in new_invoices)
+            Invoice.objects.filter(
+                pk__in=[pk for pk, _ in carried.values() if pk]
+            ).update(status="closed")
+
+        existing = {
+            (invoice_id, description.lower()): (pk, amount)
+            for pk, invoice_id, description, amount in InvoiceItem.objects.filter(
+                invoice_id__in=invoices.values()
+            ).values_list("pk", "invoice_id", "description", "amount")
+        }
+        to_create, to_update, charged = [], [], {}
+        for (student_id, key), (_, description, amount) in latest.items():
+            invoice_id = invoices[student_id]
+            item = InvoiceItem(invoice_id=invoice_id, description=description, amount=amount)
+            item.pk, old_amount = existing.get((invoice_id, key), (None, 0))
+            (to_update if item.pk else to_create).append(item)
+            charged[student_id, invoice_id] = (
+                charged.get((student_id, invoice_id), 0) + amount - old_amount
+            )
+        InvoiceItem.objects.bulk_create(to_create)
+        InvoiceItem.objects.bulk_update(to_update, ["description", "amount"])
+        refresh_invoice_totals(set(invoices.values()))
+        ledger.post(
+            ledger.entry(
+                student_id, invoice_id, amount, "charge", f"Imported fees ({session} {term})"
+            )
+            for (student_id, invoice_id), amount in charged.items()
+        )
+    return len(new_invoices), len(to_create), len(to_update)
+
+
+class _ClaimLost(Exception):
+    """The import was put back while this runner still had it."""
+
+
+def _save_owned(job, claim, **fields):
+    """Write ``fields`` of ``job`` and refresh its heartbeat if the runner that
+    claimed it at ``claim`` still owns it; raises _ClaimLost otherwise."""
+    owned = InvoiceImport.objects.filter(
+        pk=job.pk, status="running", started_at=claim
+    ).update(heartbeat_at=timezone.now(), **fields)
+    if not owned:
+        raise _ClaimLost
+
+
+def run_import(import_id):
+    """Process one pending InvoiceImport; safe to call from any thread or process.
+
+    Every write is made only while this runner still owns the job, so once
+    ``requeue_stale_imports`` has handed it to another runner this one stops
+    without touching it again.
+    """
+    claim = timezone.now()
+    claimed = InvoiceImport.objects.filter(pk=import_id, status="pending").update(
+        status="running", started_at=claim, heartbeat_at=claim
+    )
+    if not claimed:
+        return
+    job = InvoiceImport.objects.select_related("session", "term").get(pk=import_id)
+    chunk_size = getattr(settings, "INVOICE_IMPORT_CHUNK_SIZE", 1000)
+    errors = []
+    try:
+        with job.file.open("rb") as fh:
+            total = count_rows(fh, job.file.name)
+        _save_owned(job, claim, total_rows=total)
+
+        validate = RowValidator()
+        with job.file.open("rb") as fh:
+            records = iter_records(iter_rows(fh, job.file.name))
+            while True:
+                chunk = list(islice(records, chunk_size))
+                if not chunk:
+                    break
+                lines = []
+                for line, record in chunk:
+                    try:
+                        lines.append(validate(record))
+                    except ValueError as exc:
+                        errors.append(
+                            [line]
+                            + [cell_text(record.get(c)) for c in ERROR_REPORT_HEADER[1:4]]
+                            + [str(exc)]
+                        )
+                # The chunk is rolled back if the job was taken away meanwhile
+                with transaction.atomic():
+                    invoices, created, updated = upsert_lines(job.session, job.term, lines)
+                    job.processed_rows += len(chunk)
+                    job.error_rows = len(errors)
+                    job.created_invoices += invoices
+                    job.created_items += created
+                    job.updated_items += updated
+                    _save_owned(
+                        job,
+                        claim,
+                        processed_rows=job.processed_rows,
+                        error_rows=job.error_rows,
+                        created_invoices=job.created_invoices,
+                        created_items=job.created_items,
+                        updated_items=job.updated_items,
+                    )
+        job.status = "done"
+    except _ClaimLost:
+        logger.warning("Invoice import %s was restarted elsewhere; stopping", job.pk)
+        return
+    except Exception as exc:
+        logger.exception("Invoice import %s failed", job.pk)
+        job.status = "failed"
+        job.message = str(exc)
+
+    if errors:
+        report = io.StringIO()
+        writer = csv.writer(report)
+        writer.writerow(ERROR_REPORT_HEADER)
+        writer.writerows(errors)
+        job.error_report.save(
+            f"invoice-import-{job.pk}-errors.csv",
+            ContentFile(report.getvalue().encode()),
+            save=False,
+        )
+    try:
+        _save_owned(
+            job,
+            claim,
+            status=job.status,
+            message=job.message,
+            error_report=job.error_report.name,
+            finished_at=timezone.now(),
+        )
+    except _ClaimLost:
+        if job.error_report:
+            job.error_report.delete(save=False)
+
+
+def requeue_stale_imports():
+    """Put back imports left "running" by a runner that stopped; returns how many.
+
+    An import is stale once its runner hasn't reported progress for
+    ``INVOICE_IMPORT_STALE_AFTER`` seconds. Rows are upserted, so running it
+    again from the start doesn't duplicate anything, and the old runner
+    stops at its next write.
+    """
+    stale_after = getattr(settings, "INVOICE_IMPORT_STALE_AFTER", 600)
+    return InvoiceImport.objects.filter(
+        status="running", heartbeat_at__lt=timezone.now() - timedelta(seconds=stale_after)
+    ).update(
+        status="pending",
+        started_at=None,
+        heartbeat_at=None,
+        message="Restarted after its runner stopped",
+        total_rows=None,
+        processed_rows=0,
+        error_rows=0,
+        created_invoices=0,
+        created_items=0,
+        updated_items=0,
+    )
+
+
+def _run_in_thread(import_id):
+    try:
+        run_import(import_id)
+    finally:
+        connections.close_all()
+
+
+def start_import(job):
+    """Run ``job`` according to ``INVOICE_IMPORT_RUNNER``.
+
+    "worker" (the default) leaves it for ``manage.py process_invoice_imports``;
+    "thread" starts it in a background thread once the upload is committed.
+    """
+    if getattr(settings, "INVOICE_IMPORT_RUNNER", "worker") != "thread":
+        return
+    transaction.on_commit(
+        lambda: threading.Thread(
+            target=_run_in_thread, args=(job.pk,), name=f"invoice-import-{job.pk}", daemon=True
+        ).start()
+    )
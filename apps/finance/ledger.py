@@ -0,0 +1,231 @@
+"""Append-only student fee ledger.
+
+Every change to what a student owes is posted as a LedgerEntry carrying the
+student's running balance, and the current balance is kept on their
+StudentAccount. The current balance is a single row read, and a balance as
+of a past date (counting entries by their date) a daily snapshot or one
+indexed sum, instead of a walk over invoices, items and receipts.
+"""
+
+from datetime import datetime
+
+from django.db import transaction
+from django.db.models import F, OuterRef, Q, Subquery, Sum
+from django.utils import timezone
+
+from apps.students.models import Student
+
+from .models import Invoice, LedgerEntry, LedgerSnapshot, StudentAccount
+
+
+def entry(student_id, invoice_id, amount, kind, description, date=None):
+    """An unsaved entry; a positive ``amount`` is owed, a negative one paid."""
+    if isinstance(date, datetime):  # e.g. a DateField defaulting to timezone.now
+        date = timezone.localdate(date)
+    return LedgerEntry(
+        student_id=student_id,
+        invoice_id=invoice_id,
+        kind=kind,
+        description=description[:200],
+        debit=max(amount, 0),
+        credit=max(-amount, 0),
+        date=date or timezone.localdate(),
+    )
+
+
+def post(entries):
+    """Write ``entries`` with their running balances; returns those written.
+
+    The students' accounts are locked for the duration, so concurrent
+    postings for one student queue up and the running balance stays exact.
+    Snapshots an entry dated in the past makes stale are deleted.
+    """
+    entries = [e for e in entries if e.debit or e.credit]
+    if not entries:
+        return []
+    student_ids = {e.student_id for e in entries}
+    with transaction.atomic():
+        StudentAccount.objects.bulk_create(
+            [StudentAccount(student_id=pk) for pk in student_ids], ignore_conflicts=True
+        )
+        accounts = {
+            account.student_id: account
+            for account in StudentAccount.objects.select_for_update().filter(
+                student_id__in=student_ids
+            )
+        }
+        now = timezone.now()
+        for e in entries:
+            account = accounts[e.student_id]
+            account.balance += e.debit - e.credit
+            account.updated_at = now
+            e.balance = account.balance
+            e.created_at = now
+        LedgerEntry.objects.bulk_create(entries, batch_size=1000)
+        today, backdated = timezone.localdate(), {}
+        for e in entries:
+            if e.date < today:
+                backdated[e.student_id] = min(e.date, backdated.get(e.student_id, e.date))
+        if backdated:
+            LedgerSnapshot.objects.filter(
+                Q.create(
+                    [Q(student_id=pk, date__gte=day) for pk, day in backdated.items()],
+                    connector=Q.OR,
+                )
+            ).delete()
+        StudentAccount.objects.bulk_update(
+            accounts.values(), ["balance", "updated_at"], batch_size=1000
+        )
+    return entries
+
+
+def _describe(row):
+    if row.LEDGER_SIGN < 0:
+        return f"Payment: {row.comment}" if getattr(row, "comment", "") else "Payment"
+    return row.description
+
+
+def _students(invoice_ids):
+    return dict(
+        Invoice.objects.filter(pk__in=[pk for pk in invoice_ids if pk])
+        .order_by()
+        .values_list("pk", "student_id")
+    )
+
+
+def post_change(row, loaded_invoice_id, loaded_amount):
+    """Post a saved invoice item or receipt, given its values when loaded."""
+    amount = row.ledger_amount
+    description = _describe(row)
+    date = getattr(row, "date_paid", None)
+    students = _students({row.invoice_id, loaded_invoice_id})
+    if loaded_invoice_id is None:
+        kind = "charge" if row.LEDGER_SIGN > 0 else "payment"
+        entries = [
+            entry(students[row.invoice_id], row.invoice_id, amount, kind, description, date)
+        ]
+    elif loaded_invoice_id == row.invoice_id:
+        entries = [
+            entry(
+                students[row.invoice_id],
+                row.invoice_id,
+                amount - row.LEDGER_SIGN * loaded_amount,
+                "adjustment",
+                f"{description} (changed)",
+            )
+        ]
+    else:
+        entries = [
+            entry(
+                students[loaded_invoice_id],
+                loaded_invoice_id,
+                -row.LEDGER_SIGN * loaded_amount,
+                "adjustment",
+                f"{description} (moved to invoice {row.invoice_id})",
+            ),
+            entry(
+                students[row.invoice_id],
+                row.invoice_id,
+                amount,
+                "adjustment",
+                f"{description} (moved from invoice {loaded_invoice_id})",
+            ),
+        ]
+    post(entries)
+
+
+def post_removal(row):
+    """Reverse a deleted invoice item or receipt."""
+    students = _students([row.invoice_id])
+    if row.invoice_id in students:
+        post(
+            [
+                entry(
+                    students[row.invoice_id],
+                    row.invoice_id,
+                    -row.ledger_amount,
+                    "adjustment",
+                    f"{_describe(row)} (removed)",
+                )
+            ]
+        )
+
+
+def open_accounts():
+    """Give every invoiced student without an account an opening entry.
+
+    The opening balance is the balance of the student's latest invoice, the
+    figure the invoice pages show. Returns the number of accounts opened.
+    """
+    latest = Invoice.objects.filter(student=OuterRef("pk")).order_by("-pk")
+    rows = (
+        Student.objects.filter(account__isnull=True)
+        .annotate(
+            invoice_id=Subquery(latest.values("pk")[:1]),
+            opening=Subquery(latest.values("balance")[:1]),
+        )
+        .filter(invoice_id__isnull=False)
+        .values_list("pk", "invoice_id", "opening")
+    )
+    with transaction.atomic():
+        rows = list(rows)
+        StudentAccount.objects.bulk_create(
+            [StudentAccount(student_id=pk) for pk, _, _ in rows],
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+        post(
+            entry(pk, invoice_id, opening, "opening", "Opening balance")
+            for pk, invoice_id, opening in rows
+        )
+    return len(rows)
+
+
+def current_balance(student):
+    account = StudentAccount.objects.filter(student=student).only("balance").first()
+    return account.balance if account else 0
+
+
+def balance_as_of(student, day):
+    """The student's balance at the end of ``day``.
+
+    Starts from the latest snapshot up to ``day`` and adds only the entries
+    dated after it. Entries count by their date, so a payment recorded late
+    with the day it was made counts on that day.
+    """
+    snapshot = (
+        LedgerSnapshot.objects.filter(student=student, date__lte=day)
+        .order_by("-date")
+        .values_list("date", "balance")
+        .first()
+    )
+    entries = LedgerEntry.objects.filter(student=student, date__lte=day)
+    if snapshot is not None:
+        since, opening = snapshot
+        if since == day:
+            return opening
+        entries = entries.filter(date__gt=since)
+    else:
+        opening = 0
+    return opening + entries.aggregate(
+        balance=Sum(F("debit") - F("credit"), default=0)
+    )["balance"]
+
+
+def take_snapshots(day):
+    """Store every account's balance at the end of ``day``; safe to re-run."""
+    rows = (
+        LedgerEntry.objects.filter(date__lte=day)
+        .order_by()
+        .values("student")
+        .annotate(closing=Sum(F("debit") - F("credit")))
+        .values_list("student", "closing")
+    )
+    snapshots = LedgerSnapshot.objects.bulk_create(
+        [LedgerSnapshot(student_id=pk, date=day, balance=closing) for pk, closing in rows],
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=["student", "date"],
+        update_fields=["balance"],
+    )
+    return len(snapshots)
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.finance.payments import drain
+
+
+class Command(BaseCommand):
+    help = "Receipt pending payment notifications from the webhook inbox"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, help="Notifications receipted per transaction"
+        )
+        parser.add_argument(
+            "--loop", action="store_true", help="Keep waiting for new notifications"
+        )
+        parser.add_argument(
+            "--interval", type=float, default=1, help="Seconds between checks with --loop"
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            counts = drain(options["batch_size"])
+            if counts:
+                self.stdout.write(
+                    f"{counts.get('receipted', 0)} receipted, "
+                    f"{counts.get('unmatched', 0)} need review"
+                )
+                continue
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.finance.imports import requeue_stale_imports, run_import
+from apps.finance.models import InvoiceImport
+
+
+class Command(BaseCommand):
+    help = (
+        "Run pending invoice imports, oldest first, after putting back "
+        "those a stopped runner left half done"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop", action="store_true", help="Keep waiting for new uploads"
+        )
+        parser.add_argument(
+            "--interval", type=float, default=5, help="Seconds between checks with --loop"
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            requeued = requeue_stale_imports()
+            if requeued:
+                self.stdout.write(f"Restarting {requeued} stalled imports")
+            pending = list(
+                InvoiceImport.objects.filter(status="pending")
+                .order_by("created_at", "pk")
+                .values_list("pk", flat=True)
+            )
+            for import_id in pending:
+                run_import(import_id)
+                job = InvoiceImport.objects.get(pk=import_id)
+                self.stdout.write(
+                    f"Import {job.pk}: {job.get_status_display()}, "
+                    f"{job.processed_rows} rows, {job.error_rows} errors"
+                )
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
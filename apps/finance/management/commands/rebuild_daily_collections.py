@@ -0,0 +1,20 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from apps.finance.summaries import rebuild
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the daily collections summary from receipts, for every day "
+        "or a range of days"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="start", type=date.fromisoformat, help="YYYY-MM-DD")
+        parser.add_argument("--to", dest="end", type=date.fromisoformat, help="YYYY-MM-DD")
+
+    def handle(self, *args, **options):
+        count = rebuild(options["start"], options["end"])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {count} daily collection rows"))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.finance.models import Invoice
+from apps.finance.services import refresh_invoice_totals
+
+
+class Command(BaseCommand):
+    help = "Rebuild the stored payable, paid and balance totals of invoices"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--session", type=int, help="Only invoices of this session id")
+        parser.add_argument("--term", type=int, help="Only invoices of this term id")
+
+    def handle(self, *args, **options):
+        invoices = Invoice.objects.all()
+        if options["session"]:
+            invoices = invoices.filter(session_id=options["session"])
+        if options["term"]:
+            invoices = invoices.filter(term_id=options["term"])
+        with transaction.atomic():
+            updated = refresh_invoice_totals(invoices)
+        self.stdout.write(self.style.SUCCESS(f"Recomputed totals of {updated} invoices"))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.corecode.models import AcademicSession, AcademicTerm
+from apps.finance.services import rollover_term
+
+
+class Command(BaseCommand):
+    help = "Close a term's invoices and carry each student's balance to the next term"
+
+    def add_arguments(self, parser):
+        parser.add_argument("session", help="Session name to close, e.g. 2024-2025")
+        parser.add_argument("term", help="Term name to close")
+        parser.add_argument("next_session", help="Session name to carry balances to")
+        parser.add_argument("next_term", help="Term name to carry balances to")
+        parser.add_argument(
+            "--dry-run", action="store_true", help="Only report what would change"
+        )
+
+    def handle(self, *args, **options):
+        try:
+            periods = [
+                AcademicSession.objects.get(name=options["session"]),
+                AcademicTerm.objects.get(name=options["term"]),
+                AcademicSession.objects.get(name=options["next_session"]),
+                AcademicTerm.objects.get(name=options["next_term"]),
+            ]
+        except (AcademicSession.DoesNotExist, AcademicTerm.DoesNotExist) as exc:
+            raise CommandError(exc)
+        if periods[:2] == periods[2:]:
+            raise CommandError("The next session and term must differ from the closed one")
+        result = rollover_term(*periods, dry_run=options["dry_run"])
+        prefix = "Would close" if options["dry_run"] else "Closed"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{prefix} {result.closed} invoices; {result.students} students owe "
+                f"{result.carried_forward}; {result.updated} carried balances updated; "
+                f"{result.not_invoiced} students not invoiced for the next term yet"
+            )
+        )
@@ -0,0 +1,117 @@
+import statistics
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, Sum
+
+from apps.finance import payments
+from apps.finance.models import PaymentNotification
+
+
+class Command(BaseCommand):
+    help = (
+        "Act as a payment gateway: post signed notifications for open invoices, "
+        "resends included, to a running server's webhook"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=2000)
+        parser.add_argument(
+            "--duplicates", type=float, default=0.1, help="Fraction of resent notifications"
+        )
+        parser.add_argument(
+            "--unmatched", type=float, default=0.02, help="Fraction quoting unknown accounts"
+        )
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument(
+            "--url",
+            default="http://127.0.0.1:8000/finance/payments/simulator/",
+            help="Webhook of the server under test",
+        )
+        parser.add_argument("--seed", type=int)
+        parser.add_argument(
+            "--drain",
+            action="store_true",
+            help="Drain the inbox afterwards and check every payment was receipted once",
+        )
+
+    def post(self, item):
+        reference, body = item
+        request = urllib.request.Request(
+            self.url,
+            data=body,
+            headers={
+                "Content-Type": "application/json",
+                payments.SIGNATURE_HEADER: payments.signature(self.secret, body),
+            },
+        )
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                status = response.status
+        except urllib.error.HTTPError as exc:
+            status = exc.code
+        return reference, status, (time.perf_counter() - start) * 1000
+
+    def handle(self, *args, **options):
+        self.url = options["url"]
+        self.secret = payments.provider_secret("simulator")
+        if not self.secret:
+            raise CommandError('PAYMENT_WEBHOOK_SECRETS has no "simulator" secret')
+        notifications = list(
+            payments.simulated_notifications(
+                options["count"], options["duplicates"], options["unmatched"], options["seed"]
+            )
+        )
+        try:
+            urllib.request.urlopen(self.url, timeout=5)
+        except urllib.error.HTTPError:
+            pass  # the webhook answers GET with 405
+        except OSError as exc:
+            raise CommandError(f"Can't reach {self.url}: {exc}")
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(options["concurrency"]) as pool:
+            results = list(pool.map(self.post, notifications))
+        elapsed = time.perf_counter() - start
+
+        statuses = {}
+        for _, status, _ in results:
+            statuses[status] = statuses.get(status, 0) + 1
+        latencies = sorted(ms for _, _, ms in results)
+        references = {reference for reference, _ in notifications}
+        self.stdout.write(
+            f"Sent {len(results)} notifications ({len(references)} payments) in "
+            f"{elapsed:.2f}s: {len(results) / elapsed:.0f}/s, "
+            f"median {statistics.median(latencies):.1f}ms, "
+            f"p99 {latencies[int(len(latencies) * 0.99) - 1]:.1f}ms, statuses {statuses}"
+        )
+
+        inbox = PaymentNotification.objects.filter(
+            provider="simulator", reference__in=references
+        )
+        stored = inbox.count()
+        self.stdout.write(f"{stored} stored in the inbox for {len(references)} payments")
+        if not options["drain"]:
+            return
+        counts = payments.drain_all()
+        self.stdout.write(f"Drained: {counts}")
+        receipted = inbox.filter(status="receipted").aggregate(
+            notifications=Count("pk"),
+            receipts=Count("receipt", distinct=True),
+            amount=Sum("amount"),
+            receipted=Sum("receipt__amount_paid"),
+        )
+        if stored != len(references) or receipted["notifications"] != receipted["receipts"]:
+            raise CommandError(f"Not exactly once: {stored} stored, {receipted}")
+        if receipted["amount"] != receipted["receipted"]:
+            raise CommandError(f"Receipted amounts differ: {receipted}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Exactly once: {receipted['receipts']} receipts for "
+                f"{receipted['amount'] or 0} in total"
+            )
+        )
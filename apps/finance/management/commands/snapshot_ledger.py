@@ -0,0 +1,29 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.finance.ledger import open_accounts, take_snapshots
+
+
+class Command(BaseCommand):
+    help = (
+        "Store every student's ledger balance at the end of a day "
+        "(yesterday by default); run it daily from cron"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--date", type=date.fromisoformat, help="YYYY-MM-DD")
+        parser.add_argument(
+            "--open-accounts",
+            action="store_true",
+            help="First give invoiced students without a ledger an opening balance",
+        )
+
+    def handle(self, *args, **options):
+        if options["open_accounts"]:
+            opened = open_accounts()
+            self.stdout.write(f"Opened {opened} accounts")
+        day = options["date"] or timezone.localdate() - timedelta(days=1)
+        count = take_snapshots(day)
+        self.stdout.write(self.style.SUCCESS(f"Stored {count} balances as of {day}"))
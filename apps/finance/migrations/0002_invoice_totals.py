@@ -0,0 +1,55 @@
+# Generated by Django 5.2.7 on 2026-10-18 20:17
+
+import django.db.models.expressions
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_totals(apps, schema_editor):
+    Invoice = apps.get_model("finance", "Invoice")
+    InvoiceItem = apps.get_model("finance", "InvoiceItem")
+    Receipt = apps.get_model("finance", "Receipt")
+
+    def total(model, field):
+        return Coalesce(
+            Subquery(
+                model.objects.filter(invoice=OuterRef("pk"))
+                .order_by()
+                .values("invoice")
+                .annotate(total=Sum(field))
+                .values("total")
+            ),
+            0,
+        )
+
+    Invoice.objects.update(
+        amount_payable=total(InvoiceItem, "amount"),
+        amount_paid=total(Receipt, "amount_paid"),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='amount_paid',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='amount_payable',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='balance',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(models.F('balance_from_previous_term'), '+', models.F('amount_payable')), '-', models.F('amount_paid')), output_field=models.IntegerField()),
+        ),
+        migrations.RunPython(backfill_totals, migrations.RunPython.noop),
+    ]
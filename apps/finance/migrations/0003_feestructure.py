@@ -0,0 +1,43 @@
+# Generated by Django 5.2.7 on 2026-10-18 20:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('corecode', '0009_auditlog'),
+        ('finance', '0002_invoice_totals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeeStructure',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='corecode.academicsession')),
+                ('student_class', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='corecode.studentclass')),
+                ('term', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='corecode.academicterm')),
+            ],
+            options={
+                'ordering': ['-session__name', 'term__name', 'student_class__name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='FeeStructureItem',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('description', models.CharField(max_length=200)),
+                ('amount', models.IntegerField()),
+                ('fee_structure', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='finance.feestructure')),
+            ],
+            options={
+                'ordering': ['pk'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='feestructure',
+            constraint=models.UniqueConstraint(fields=('student_class', 'session', 'term'), name='unique_fee_structure'),
+        ),
+    ]
@@ -0,0 +1,100 @@
+# Generated by Django 5.2.7 on 2026-10-18 20:37
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def open_accounts(apps, schema_editor):
+    # Each invoiced student starts with their latest invoice's balance
+    Invoice = apps.get_model("finance", "Invoice")
+    Student = apps.get_model("students", "Student")
+    StudentAccount = apps.get_model("finance", "StudentAccount")
+    LedgerEntry = apps.get_model("finance", "LedgerEntry")
+
+    latest = Invoice.objects.filter(student=OuterRef("pk")).order_by("-pk")
+    rows = list(
+        Student.objects.annotate(
+            invoice_id=Subquery(latest.values("pk")[:1]),
+            opening=Subquery(latest.values("balance")[:1]),
+        )
+        .filter(invoice_id__isnull=False)
+        .values_list("pk", "invoice_id", "opening")
+    )
+    now = django.utils.timezone.now()
+    StudentAccount.objects.bulk_create(
+        [StudentAccount(student_id=pk, balance=opening, updated_at=now) for pk, _, opening in rows],
+        batch_size=1000,
+    )
+    LedgerEntry.objects.bulk_create(
+        [
+            LedgerEntry(
+                student_id=pk,
+                invoice_id=invoice_id,
+                created_at=now,
+                date=now.date(),
+                kind="opening",
+                description="Opening balance",
+                debit=max(opening, 0),
+                credit=max(-opening, 0),
+                balance=opening,
+            )
+            for pk, invoice_id, opening in rows
+            if opening
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0004_invoiceimport'),
+        ('students', '0003_student_allergies_student_emergency_contact_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentAccount',
+            fields=[
+                ('student', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='account', serialize=False, to='students.student')),
+                ('balance', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('date', models.DateField(default=django.utils.timezone.now)),
+                ('kind', models.CharField(choices=[('opening', 'Opening balance'), ('charge', 'Charge'), ('payment', 'Payment'), ('adjustment', 'Adjustment')], max_length=10)),
+                ('description', models.CharField(max_length=200)),
+                ('debit', models.IntegerField(default=0)),
+                ('credit', models.IntegerField(default=0)),
+                ('balance', models.IntegerField()),
+                ('invoice', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='finance.invoice')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='students.student')),
+            ],
+            options={
+                'verbose_name_plural': 'ledger entries',
+                'ordering': ['student', 'pk'],
+                'indexes': [models.Index(fields=['student', 'created_at'], name='finance_led_student_22330e_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='LedgerSnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('balance', models.IntegerField()),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_snapshots', to='students.student')),
+            ],
+            options={
+                'ordering': ['-date'],
+                'constraints': [models.UniqueConstraint(fields=('student', 'date'), name='unique_ledger_snapshot')],
+            },
+        ),
+        migrations.RunPython(open_accounts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2026-10-18 20:40
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_issued_on(apps, schema_editor):
+    # Invoices had no date; the first payment is the best evidence there is
+    Invoice = apps.get_model("finance", "Invoice")
+    Receipt = apps.get_model("finance", "Receipt")
+    first_payment = (
+        Receipt.objects.filter(invoice=OuterRef("pk"))
+        .order_by()
+        .values("invoice")
+        .annotate(first=Min("date_paid"))
+        .values("first")
+    )
+    Invoice.objects.update(issued_on=Coalesce(Subquery(first_payment), F("issued_on")))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0005_ledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='issued_on',
+            field=models.DateField(default=django.utils.timezone.localdate),
+        ),
+        migrations.RunPython(backfill_issued_on, migrations.RunPython.noop),
+    ]
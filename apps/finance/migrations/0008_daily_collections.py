@@ -0,0 +1,57 @@
+# Generated by Django 5.2.7 on 2026-10-18 21:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill(apps, schema_editor):
+    Receipt = apps.get_model("finance", "Receipt")
+    DailyCollection = apps.get_model("finance", "DailyCollection")
+    totals = (
+        Receipt.objects.order_by()
+        .values("date_paid", "invoice__session_id", "invoice__term_id", "invoice__class_for_id")
+        .annotate(amount=Sum("amount_paid"), count=Count("pk"))
+    )
+    DailyCollection.objects.bulk_create(
+        (
+            DailyCollection(
+                date=row["date_paid"],
+                session_id=row["invoice__session_id"],
+                term_id=row["invoice__term_id"],
+                student_class_id=row["invoice__class_for_id"],
+                amount=row["amount"],
+                receipt_count=row["count"],
+            )
+            for row in totals.iterator(chunk_size=2000)
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('corecode', '0009_auditlog'),
+        ('finance', '0007_bank_statements'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyCollection',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('amount', models.BigIntegerField(default=0)),
+                ('receipt_count', models.IntegerField(default=0)),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='corecode.academicsession')),
+                ('student_class', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='corecode.studentclass')),
+                ('term', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='corecode.academicterm')),
+            ],
+            options={
+                'ordering': ['-date'],
+                'constraints': [models.UniqueConstraint(fields=('date', 'session', 'term', 'student_class'), name='unique_daily_collection')],
+            },
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
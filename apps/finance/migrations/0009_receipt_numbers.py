@@ -0,0 +1,52 @@
+# Generated by Django 5.2.7 on 2026-10-18 21:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def number_receipts(apps, schema_editor):
+    # Existing receipts are numbered per session in the order they were paid
+    Receipt = apps.get_model("finance", "Receipt")
+    ReceiptSequence = apps.get_model("finance", "ReceiptSequence")
+    receipts = Receipt.objects.order_by("invoice__session_id", "date_paid", "pk").values_list(
+        "pk", "invoice__session_id"
+    )
+    numbered, next_numbers = [], {}
+    for pk, session_id in receipts.iterator(chunk_size=2000):
+        number = next_numbers.get(session_id, 1)
+        next_numbers[session_id] = number + 1
+        numbered.append(Receipt(pk=pk, session_id=session_id, number=number))
+    Receipt.objects.bulk_update(numbered, ["session", "number"], batch_size=1000)
+    ReceiptSequence.objects.bulk_create(
+        ReceiptSequence(session_id=session_id, next_number=number)
+        for session_id, number in next_numbers.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('corecode', '0009_auditlog'),
+        ('finance', '0008_daily_collections'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReceiptSequence',
+            fields=[
+                ('session', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='corecode.academicsession')),
+                ('next_number', models.PositiveIntegerField(default=1)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='receipt',
+            name='number',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='receipt',
+            name='session',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='corecode.academicsession'),
+        ),
+        migrations.RunPython(number_receipts, migrations.RunPython.noop),
+    ]
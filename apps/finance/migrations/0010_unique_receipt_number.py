@@ -0,0 +1,17 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Separate from 0009: on PostgreSQL the table can't be altered in the
+    # transaction that filled in its new foreign key (pending trigger events)
+
+    dependencies = [
+        ('finance', '0009_receipt_numbers'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='receipt',
+            constraint=models.UniqueConstraint(fields=('session', 'number'), name='unique_receipt_number'),
+        ),
+    ]
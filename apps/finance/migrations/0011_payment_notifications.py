@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2026-10-18 21:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0010_unique_receipt_number'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentNotification',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('provider', models.CharField(max_length=30)),
+                ('reference', models.CharField(max_length=100)),
+                ('account', models.CharField(max_length=100)),
+                ('amount', models.IntegerField()),
+                ('paid_at', models.DateTimeField()),
+                ('payload', models.JSONField(default=dict)),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('receipted', 'Receipted'), ('unmatched', 'Needs review')], default='pending', max_length=10)),
+                ('note', models.CharField(blank=True, max_length=200)),
+                ('invoice', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='finance.invoice')),
+                ('receipt', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='finance.receipt')),
+            ],
+            options={
+                'ordering': ['-received_at'],
+                'indexes': [models.Index(fields=['status', 'id'], name='finance_pay_status_4e16e8_idx')],
+                'constraints': [models.UniqueConstraint(fields=('provider', 'reference'), name='unique_payment_notification')],
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.7 on 2026-10-18 21:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0011_payment_notifications'),
+        ('students', '0004_guardians'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='ledgerentry',
+            name='finance_led_student_22330e_idx',
+        ),
+        migrations.AddIndex(
+            model_name='ledgerentry',
+            index=models.Index(fields=['student', 'date'], name='finance_led_student_abcd8c_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 21:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0012_ledger_entry_date_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoiceimport',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
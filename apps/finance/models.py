@@ -1,4 +1,8 @@
-from django.db import models
+import os
+
+from django.contrib.auth.models import User
+from django.db import models, transaction
+from django.db.models import F
 from django.urls import reverse
 from django.utils import timezone
 
@@ -12,55 +16,456 @@ class Invoice(models.Model):
     term = models.ForeignKey(AcademicTerm, on_delete=models.CASCADE)
     class_for = models.ForeignKey(StudentClass, on_delete=models.CASCADE)
     balance_from_previous_term = models.IntegerField(default=0)
+    issued_on = models.DateField(default=timezone.localdate)
     status = models.CharField(
         max_length=20,
         choices=[("active", "Active"), ("closed", "Closed")],
         default="active",
     )
 
+    # Kept up to date by refresh_invoice_totals() whenever an item or receipt
+    # of this invoice is saved or deleted
+    amount_payable = models.IntegerField(default=0, editable=False)
+    amount_paid = models.IntegerField(default=0, editable=False)
+    balance = models.GeneratedField(
+        expression=F("balance_from_previous_term") + F("amount_payable") - F("amount_paid"),
+        output_field=models.IntegerField(),
+        db_persist=True,
+    )
+
+    TOTAL_FIELDS = ("amount_payable", "amount_paid")
+
     class Meta:
         ordering = ["student", "term"]
 
     def __str__(self):
         return f"{self.student}"
 
-    def balance(self):
-        payable = self.total_amount_payable()
-        paid = self.total_amount_paid()
-        return payable - paid
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_opening_balance = instance.__dict__.get(
+            "balance_from_previous_term", 0
+        )
+        instance._loaded_summary_key = instance.summary_key
+        return instance
 
-    def amount_payable(self):
-        items = InvoiceItem.objects.filter(invoice=self)
-        total = 0
-        for item in items:
-            total += item.amount
-        return total
+    @property
+    def summary_key(self):
+        """What the invoice's receipts are totalled under in DailyCollection."""
+        return (
+            self.__dict__.get("session_id"),
+            self.__dict__.get("term_id"),
+            self.__dict__.get("class_for_id"),
+        )
+
+    def save(self, *args, **kwargs):
+        # The stored totals belong to refresh_invoice_totals(); never write
+        # back the (possibly stale) in-memory copies
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key
+                and not field.generated
+                and field.name not in self.TOTAL_FIELDS
+            ]
+        super().save(*args, **kwargs)
 
     def total_amount_payable(self):
-        return self.balance_from_previous_term + self.amount_payable()
+        return self.balance_from_previous_term + self.amount_payable
 
     def total_amount_paid(self):
-        receipts = Receipt.objects.filter(invoice=self)
-        amount = 0
-        for receipt in receipts:
-            amount += receipt.amount_paid
-        return amount
+        return self.amount_paid
 
     def get_absolute_url(self):
         return reverse("invoice-detail", kwargs={"pk": self.pk})
 
 
-class InvoiceItem(models.Model):
+class InvoiceTotalsMixin(models.Model):
+    """Refresh the invoice's stored totals and post the change to the ledger
+    in the same transaction as a save.
+
+    ``LEDGER_FIELD`` is the amount the row adds to (or, with a negative
+    ``LEDGER_SIGN``, takes off) what the student owes. Deletes are handled
+    by the post_delete receiver in ``signals.py``.
+    """
+
+    LEDGER_FIELD = "amount"
+    LEDGER_SIGN = 1
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_invoice_id = instance.__dict__.get("invoice_id")
+        instance._loaded_amount = instance.__dict__.get(cls.LEDGER_FIELD)
+        return instance
+
+    @property
+    def ledger_amount(self):
+        return self.LEDGER_SIGN * getattr(self, self.LEDGER_FIELD)
+
+    def save(self, *args, **kwargs):
+        from .ledger import post_change
+        from .services import refresh_invoice_totals
+
+        loaded_invoice_id = getattr(self, "_loaded_invoice_id", None)
+        loaded_amount = getattr(self, "_loaded_amount", None)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            # Moving a row to another invoice changes both invoices
+            refresh_invoice_totals({self.invoice_id, loaded_invoice_id})
+            post_change(self, loaded_invoice_id, loaded_amount)
+        self._loaded_invoice_id = self.invoice_id
+        self._loaded_amount = getattr(self, self.LEDGER_FIELD)
+
+
+class InvoiceItem(InvoiceTotalsMixin):
     invoice = models.ForeignKey(Invoice, on_delete=models.CASCADE)
     description = models.CharField(max_length=200)
     amount = models.IntegerField()
 
 
-class Receipt(models.Model):
+class Receipt(InvoiceTotalsMixin):
     invoice = models.ForeignKey(Invoice, on_delete=models.CASCADE)
     amount_paid = models.IntegerField()
     date_paid = models.DateField(default=timezone.now)
     comment = models.CharField(max_length=200, blank=True)
+    # Numbered per session when first saved (see numbering.py); numbers are
+    # unique but may have gaps
+    session = models.ForeignKey(
+        AcademicSession,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name="+",
+    )
+    number = models.PositiveIntegerField(null=True, blank=True, editable=False)
+
+    LEDGER_FIELD = "amount_paid"
+    LEDGER_SIGN = -1
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["session", "number"], name="unique_receipt_number")
+        ]
 
     def __str__(self):
+        if self.number:
+            return f"Receipt {self.number} on {self.date_paid}"
         return f"Receipt on {self.date_paid}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_date_paid = instance.__dict__.get("date_paid")
+        return instance
+
+    def save(self, *args, **kwargs):
+        from .numbering import number_receipts
+        from .summaries import record_change
+
+        loaded = (
+            getattr(self, "_loaded_invoice_id", None),
+            getattr(self, "_loaded_date_paid", None),
+            getattr(self, "_loaded_amount", None),
+        )
+        with transaction.atomic():
+            if self.number is None:
+                number_receipts([self])
+            super().save(*args, **kwargs)
+            # Keep the daily collections summary in step
+            record_change(self, *loaded)
+        self._loaded_date_paid = self.date_paid
+
+
+class FeeStructure(models.Model):
+    """The fees every student of a class pays in one session and term."""
+
+    student_class = models.ForeignKey(StudentClass, on_delete=models.CASCADE)
+    session = models.ForeignKey(AcademicSession, on_delete=models.CASCADE)
+    term = models.ForeignKey(AcademicTerm, on_delete=models.CASCADE)
+
+    class Meta:
+        ordering = ["-session__name", "term__name", "student_class__name"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["student_class", "session", "term"], name="unique_fee_structure"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.student_class} {self.session} {self.term}"
+
+    def get_absolute_url(self):
+        return reverse("fee-structure-update", kwargs={"pk": self.pk})
+
+
+class FeeStructureItem(models.Model):
+    fee_structure = models.ForeignKey(
+        FeeStructure, on_delete=models.CASCADE, related_name="items"
+    )
+    description = models.CharField(max_length=200)
+    amount = models.IntegerField()
+
+    class Meta:
+        ordering = ["pk"]
+
+
+class InvoiceImport(models.Model):
+    """An uploaded CSV/XLSX of invoice lines and the progress of its import."""
+
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("running", "Running"),
+        ("done", "Done"),
+        ("failed", "Failed"),
+    ]
+
+    file = models.FileField(upload_to="finance/imports/")
+    session = models.ForeignKey(AcademicSession, on_delete=models.CASCADE)
+    term = models.ForeignKey(AcademicTerm, on_delete=models.CASCADE)
+    uploaded_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Refreshed by the runner after every chunk; see imports.requeue_stale_imports
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="pending")
+    message = models.TextField(blank=True)
+    total_rows = models.PositiveIntegerField(null=True, blank=True)
+    processed_rows = models.PositiveIntegerField(default=0)
+    error_rows = models.PositiveIntegerField(default=0)
+    created_invoices = models.PositiveIntegerField(default=0)
+    created_items = models.PositiveIntegerField(default=0)
+    updated_items = models.PositiveIntegerField(default=0)
+    error_report = models.FileField(upload_to="finance/imports/", blank=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"{self.file.name} ({self.get_status_display()})"
+
+    def get_absolute_url(self):
+        return reverse("invoice-import-detail", kwargs={"pk": self.pk})
+
+    @property
+    def filename(self):
+        return os.path.basename(self.file.name)
+
+    @property
+    def percent(self):
+        if self.status == "done":
+            return 100
+        if not self.total_rows:
+            return 0
+        return min(99, int(self.processed_rows * 100 / self.total_rows))
+
+
+class StudentAccount(models.Model):
+    """A student's current ledger balance: what they owe right now."""
+
+    student = models.OneToOneField(
+        Student, on_delete=models.CASCADE, primary_key=True, related_name="account"
+    )
+    balance = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.student}: {self.balance}"
+
+
+class LedgerEntry(models.Model):
+    """One debit or credit on a student's account. Entries are never changed;
+    a correction is a new entry.
+
+    ``balance`` is the student's running balance after this entry. The
+    invoice is kept as a plain reference so entries outlive deleted invoices.
+    """
+
+    KIND_CHOICES = [
+        ("opening", "Opening balance"),
+        ("charge", "Charge"),
+        ("payment", "Payment"),
+        ("adjustment", "Adjustment"),
+    ]
+
+    student = models.ForeignKey(
+        Student, on_delete=models.CASCADE, related_name="ledger_entries"
+    )
+    invoice = models.ForeignKey(
+        Invoice,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        blank=True,
+        related_name="+",
+    )
+    created_at = models.DateTimeField(default=timezone.now)
+    date = models.DateField(default=timezone.now)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    description = models.CharField(max_length=200)
+    debit = models.IntegerField(default=0)
+    credit = models.IntegerField(default=0)
+    balance = models.IntegerField()
+
+    class Meta:
+        ordering = ["student", "pk"]
+        indexes = [models.Index(fields=["student", "date"])]
+        verbose_name_plural = "ledger entries"
+
+    def __str__(self):
+        return f"{self.student} {self.description} {self.debit - self.credit:+}"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Ledger entries can't be changed; post a correcting entry.")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValueError("Ledger entries can't be deleted; post a correcting entry.")
+
+
+class LedgerSnapshot(models.Model):
+    """A student's ledger balance at the end of ``date``."""
+
+    student = models.ForeignKey(
+        Student, on_delete=models.CASCADE, related_name="ledger_snapshots"
+    )
+    date = models.DateField()
+    balance = models.IntegerField()
+
+    class Meta:
+        ordering = ["-date"]
+        constraints = [
+            models.UniqueConstraint(fields=["student", "date"], name="unique_ledger_snapshot")
+        ]
+
+
+class ReceiptSequence(models.Model):
+    """The next receipt number of a session not yet handed to any process."""
+
+    session = models.OneToOneField(
+        AcademicSession, on_delete=models.CASCADE, primary_key=True, related_name="+"
+    )
+    next_number = models.PositiveIntegerField(default=1)
+
+    def __str__(self):
+        return f"{self.session}: {self.next_number}"
+
+
+class DailyCollection(models.Model):
+    """Receipts of one day for one session, term and class, kept up to date as
+    receipts change (see ``summaries.py``)."""
+
+    date = models.DateField()
+    session = models.ForeignKey(AcademicSession, on_delete=models.CASCADE, related_name="+")
+    term = models.ForeignKey(AcademicTerm, on_delete=models.CASCADE, related_name="+")
+    student_class = models.ForeignKey(StudentClass, on_delete=models.CASCADE, related_name="+")
+    amount = models.BigIntegerField(default=0)
+    receipt_count = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ["-date"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["date", "session", "term", "student_class"],
+                name="unique_daily_collection",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.student_class}: {self.amount}"
+
+
+class BankStatement(models.Model):
+    """An uploaded bank or mobile-money statement of fee payments."""
+
+    file = models.FileField(upload_to="finance/statements/")
+    uploaded_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return os.path.basename(self.file.name)
+
+    def get_absolute_url(self):
+        return reverse("statement-detail", kwargs={"pk": self.pk})
+
+
+class StatementLine(models.Model):
+    """One payment on a statement and the invoice it was matched to."""
+
+    STATUS_CHOICES = [
+        ("matched", "Matched"),
+        ("unmatched", "Needs review"),
+        ("duplicate", "Duplicate"),
+        ("confirmed", "Receipted"),
+        ("ignored", "Ignored"),
+    ]
+
+    statement = models.ForeignKey(BankStatement, on_delete=models.CASCADE, related_name="lines")
+    line_number = models.PositiveIntegerField()
+    date = models.DateField(null=True, blank=True)
+    reference = models.CharField(max_length=100, blank=True)
+    description = models.CharField(max_length=255, blank=True)
+    amount = models.IntegerField(null=True, blank=True)
+    # Identifies the same payment in a later statement
+    fingerprint = models.CharField(max_length=64, db_index=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES)
+    note = models.CharField(max_length=200, blank=True)
+    invoice = models.ForeignKey(Invoice, on_delete=models.SET_NULL, null=True, blank=True)
+    receipt = models.OneToOneField(Receipt, on_delete=models.SET_NULL, null=True, blank=True)
+
+    class Meta:
+        ordering = ["statement", "line_number"]
+        indexes = [models.Index(fields=["status", "statement"])]
+
+    def __str__(self):
+        return f"{self.reference or self.description} {self.amount}"
+
+
+class PaymentNotification(models.Model):
+    """A payment a gateway told us about, waiting in the inbox to be receipted.
+
+    The gateway's reference is unique per provider, so a notification sent
+    again (gateways retry until they get a 2xx) is stored only once.
+    """
+
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("receipted", "Receipted"),
+        ("unmatched", "Needs review"),
+    ]
+
+    provider = models.CharField(max_length=30)
+    reference = models.CharField(max_length=100)
+    # Registration number or invoice number the payer quoted
+    account = models.CharField(max_length=100)
+    amount = models.IntegerField()
+    paid_at = models.DateTimeField()
+    payload = models.JSONField(default=dict)
+    received_at = models.DateTimeField(auto_now_add=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="pending")
+    note = models.CharField(max_length=200, blank=True)
+    invoice = models.ForeignKey(Invoice, on_delete=models.SET_NULL, null=True, blank=True)
+    receipt = models.OneToOneField(Receipt, on_delete=models.SET_NULL, null=True, blank=True)
+
+    class Meta:
+        ordering = ["-received_at"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["provider", "reference"], name="unique_payment_notification"
+            )
+        ]
+        indexes = [models.Index(fields=["status", "id"])]
+
+    def __str__(self):
+        return f"{self.provider} {self.reference} {self.amount}"
@@ -0,0 +1,117 @@
+"""Receipt numbers, sequential per session.
+
+Each session's next free number lives in one ReceiptSequence row. Rather
+than lock that row for every receipt, a process reserves a block of
+``RECEIPT_NUMBER_BLOCK_SIZE`` numbers with a single UPDATE and hands them out
+from memory until the block runs out, so cashiers and statement imports in
+different workers only meet on the counter once per block. Blocks are
+reserved on the ``RECEIPT_NUMBER_DATABASE`` connection, which commits at
+once, so the counter is not locked for the rest of the caller's transaction
+(a whole statement or webhook batch). Numbers are unique but not gapless:
+whatever is left of a block when a worker stops, and the numbers of
+receipts whose transaction rolled back, are never used.
+"""
+
+import os
+import threading
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, transaction
+from django.db.models import F
+
+from .models import Invoice, ReceiptSequence
+
+
+class ReceiptNumberAllocator:
+    """Hands out receipt numbers from blocks reserved by this process.
+
+    A block reserved inside the caller's transaction (on the default
+    connection) only becomes available to other callers once that
+    transaction commits: if it rolls back, so does the reservation, and the
+    numbers must not be used again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._blocks = {}
+        self._pid = os.getpid()
+
+    def clear(self):
+        with self._lock:
+            self._blocks = {}
+
+    def _take(self, session_id, count):
+        if self._pid != os.getpid():
+            # A forked worker must not hand out its parent's numbers
+            self._blocks, self._pid = {}, os.getpid()
+        start, end = self._blocks.get(session_id, (0, 0))
+        taken = min(count, end - start)
+        self._blocks[session_id] = (start + taken, end)
+        return list(range(start, start + taken))
+
+    def _keep(self, session_id, start, end):
+        with self._lock:
+            current, current_end = self._blocks.get(session_id, (0, 0))
+            if current_end - current < end - start:
+                self._blocks[session_id] = (start, end)
+
+    def reserve(self, session_id, size, using=DEFAULT_DB_ALIAS):
+        """Reserve ``size`` numbers from the session's sequence; returns the first."""
+        sequence = ReceiptSequence.objects.using(using).filter(session_id=session_id)
+        with transaction.atomic(using=using):
+            if not sequence.update(next_number=F("next_number") + size):
+                try:
+                    with transaction.atomic(using=using):
+                        ReceiptSequence.objects.using(using).create(session_id=session_id)
+                except IntegrityError:
+                    pass  # created by another process meanwhile
+                sequence.update(next_number=F("next_number") + size)
+            # The row stays locked until commit, so this is our own update
+            return sequence.values_list("next_number", flat=True).get() - size
+
+    def allocate(self, session_id, count=1):
+        """Return ``count`` unused receipt numbers of the session, ascending."""
+        with self._lock:
+            numbers = self._take(session_id, count)
+        missing = count - len(numbers)
+        if missing:
+            block = max(missing, getattr(settings, "RECEIPT_NUMBER_BLOCK_SIZE", 20))
+            using = getattr(settings, "RECEIPT_NUMBER_DATABASE", DEFAULT_DB_ALIAS)
+            if using != DEFAULT_DB_ALIAS:
+                try:
+                    start = self.reserve(session_id, block, using)
+                except (IntegrityError, ReceiptSequence.DoesNotExist):
+                    # The session was created in the caller's transaction,
+                    # so only the default connection can see it yet
+                    using = DEFAULT_DB_ALIAS
+            if using == DEFAULT_DB_ALIAS:
+                start = self.reserve(session_id, block)
+            numbers += range(start, start + missing)
+            if block > missing:
+                keep = lambda: self._keep(session_id, start + missing, start + block)
+                if using == DEFAULT_DB_ALIAS:
+                    transaction.on_commit(keep)
+                else:
+                    keep()  # already committed
+        return numbers
+
+
+allocator = ReceiptNumberAllocator()
+
+
+def number_receipts(receipts):
+    """Give unnumbered ``receipts`` (unsaved or not) their session and number."""
+    receipts = [receipt for receipt in receipts if receipt.number is None]
+    sessions = dict(
+        Invoice.objects.filter(pk__in={receipt.invoice_id for receipt in receipts})
+        .order_by()
+        .values_list("pk", "session_id")
+    )
+    by_session = {}
+    for receipt in receipts:
+        receipt.session_id = sessions[receipt.invoice_id]
+        by_session.setdefault(receipt.session_id, []).append(receipt)
+    for session_id, numbered in by_session.items():
+        for receipt, number in zip(numbered, allocator.allocate(session_id, len(numbered))):
+            receipt.number = number
+    return receipts
@@ -0,0 +1,202 @@
+"""Payment notifications pushed by a payment gateway.
+
+The webhook only checks a notification's signature and fields and appends
+it to the PaymentNotification inbox with a single INSERT that is skipped
+when the provider's reference is already there, so the gateway gets its
+answer within milliseconds and retries are harmless. ``drain`` (run by
+``manage.py drain_payments``) then takes pending notifications a batch at a
+time, matches them to open invoices the way bank statements are matched
+and receipts them in bulk, in the same transaction that marks them done:
+each payment is receipted exactly once however often it was sent.
+
+Notifications are JSON objects signed with the provider's secret from
+``PAYMENT_WEBHOOK_SECRETS``; see ``simulated_notifications`` for the fields.
+"""
+
+import hashlib
+import hmac
+import json
+import random
+import uuid
+from datetime import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Invoice, PaymentNotification, Receipt
+from .reconcile import InvoiceIndex, match
+from .services import create_receipts
+
+SIGNATURE_HEADER = "X-Signature"
+
+
+class InvalidNotification(ValueError):
+    """A notification that can't be accepted (bad signature or fields)."""
+
+
+def provider_secret(provider):
+    return getattr(settings, "PAYMENT_WEBHOOK_SECRETS", {}).get(provider)
+
+
+def signature(secret, body):
+    return "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def parse(provider, body, signed):
+    """Check a notification body and its signature; returns it unsaved."""
+    secret = provider_secret(provider)
+    if not secret or not hmac.compare_digest(signature(secret, body), signed or ""):
+        raise InvalidNotification("Bad signature")
+    try:
+        data = json.loads(body)
+    except ValueError:
+        raise InvalidNotification("Body is not JSON")
+    if not isinstance(data, dict):
+        raise InvalidNotification("Body is not a JSON object")
+    reference = str(data.get("reference") or "").strip()
+    account = str(data.get("account") or "").strip()
+    amount = data.get("amount")
+    if not reference or len(reference) > 100:
+        raise InvalidNotification("Missing or too long reference")
+    if not account or len(account) > 100:
+        raise InvalidNotification("Missing or too long account")
+    if type(amount) is not int or amount <= 0:
+        raise InvalidNotification("Amount must be a positive whole number")
+    paid_at = timezone.now()
+    if data.get("paid_at"):
+        try:
+            paid_at = parse_datetime(str(data["paid_at"]))
+        except ValueError:  # well formed but impossible, e.g. February 30th
+            paid_at = None
+        if paid_at is None:
+            raise InvalidNotification("Unrecognised paid_at")
+        if timezone.is_naive(paid_at):
+            paid_at = timezone.make_aware(paid_at)
+    return PaymentNotification(
+        provider=provider,
+        reference=reference,
+        account=account,
+        amount=amount,
+        paid_at=paid_at,
+        payload=data,
+    )
+
+
+def receive(notification):
+    """Add ``notification`` to the inbox unless its reference is already there."""
+    PaymentNotification.objects.bulk_create([notification], ignore_conflicts=True)
+
+
+def drain(batch_size=None):
+    """Receipt one batch of pending notifications; returns status counts.
+
+    Other workers draining at the same time skip the rows this one has
+    locked (on databases that can), so they never receipt them twice.
+    """
+    batch_size = batch_size or getattr(settings, "PAYMENT_DRAIN_BATCH_SIZE", 500)
+    tolerance = getattr(settings, "RECONCILE_AMOUNT_TOLERANCE", 0)
+    with transaction.atomic():
+        notifications = list(
+            PaymentNotification.objects.filter(status="pending")
+            .select_for_update(skip_locked=True)
+            .order_by("pk")[:batch_size]
+        )
+        if not notifications:
+            return {}
+        index = InvoiceIndex()
+        matched = []
+        for notification in notifications:
+            status, notification.invoice_id, notification.note = match(
+                index,
+                {
+                    "amount": notification.amount,
+                    "registration_number": "",
+                    "reference": notification.account,
+                    "description": "",
+                },
+                tolerance,
+            )
+            if status == "matched":
+                matched.append(notification)
+            else:
+                notification.status = status
+        receipts = create_receipts(
+            Receipt(
+                invoice_id=notification.invoice_id,
+                amount_paid=notification.amount,
+                date_paid=timezone.localtime(notification.paid_at).date(),
+                comment=f"{notification.provider} ref {notification.reference}"[:200],
+            )
+            for notification in matched
+        )
+        for notification, receipt in zip(matched, receipts):
+            notification.receipt = receipt
+            notification.status = "receipted"
+        PaymentNotification.objects.bulk_update(
+            notifications, ["status", "note", "invoice", "receipt"], batch_size=1000
+        )
+    counts = {}
+    for notification in notifications:
+        counts[notification.status] = counts.get(notification.status, 0) + 1
+    return counts
+
+
+def drain_all(batch_size=None):
+    """Drain until the inbox is empty; returns the total status counts."""
+    totals = {}
+    while True:
+        counts = drain(batch_size)
+        if not counts:
+            return totals
+        for status, count in counts.items():
+            totals[status] = totals.get(status, 0) + count
+
+
+def simulated_notifications(count, duplicates=0.1, unmatched=0.02, seed=None):
+    """Notification bodies a gateway could send for today's open invoices.
+
+    Each payment pays part of what an open invoice still owes, quoting the
+    student's registration number or the invoice number; ``unmatched`` of
+    them quote an account nobody has. A ``duplicates`` fraction of the
+    bodies are resends of an earlier one. Yields ``(reference, body)``.
+    """
+    rng = random.Random(seed)
+    owed = {
+        pk: [registration_number, balance]
+        for pk, registration_number, balance in Invoice.objects.filter(
+            status="active", balance__gt=0
+        ).values_list("pk", "student__registration_number", "balance")
+    }
+    open_invoices = list(owed)
+    run = uuid.uuid4().hex[:8].upper()
+    sent = []
+    for n in range(count):
+        if sent and rng.random() < duplicates:
+            yield rng.choice(sent)
+            continue
+        if not open_invoices or rng.random() < unmatched:
+            account, amount = f"NOBODY-{n}", rng.randint(100, 5000)
+        else:
+            i = rng.randrange(len(open_invoices))
+            pk = open_invoices[i]
+            registration_number, balance = owed[pk]
+            amount = rng.randint(1, balance)
+            owed[pk][1] -= amount
+            if amount == balance:
+                open_invoices[i] = open_invoices[-1]
+                open_invoices.pop()
+            account = rng.choice([registration_number, f"INV-{pk}"])
+        reference = f"SIM{run}{n:07d}"
+        body = json.dumps(
+            {
+                "reference": reference,
+                "account": account,
+                "amount": amount,
+                "paid_at": datetime.now().isoformat(timespec="seconds"),
+                "payer": "Simulated payer",
+            }
+        ).encode()
+        sent.append((reference, body))
+        yield reference, body
@@ -0,0 +1,268 @@
+"""Match bank and mobile-money statement payments to open invoices.
+
+Every open (active) invoice is loaded once into an in-memory index keyed by
+the student's registration number and the invoice number, so matching a
+statement costs one query however long it is. A payment is matched by its
+registration number column, an invoice reference such as ``INV-123`` or a
+registration number mentioned in the reference or description, and only if
+it doesn't exceed what is still owed by more than
+``RECONCILE_AMOUNT_TOLERANCE``. Confirmed matches become receipts in bulk;
+everything else waits in the review queue.
+"""
+
+import hashlib
+import re
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q, Sum
+
+from .imports import cell_text, iter_records, iter_rows
+from .models import Invoice, Receipt, StatementLine
+from .services import create_receipts
+
+STATEMENT_COLUMNS = {
+    "date": {"date", "transaction date", "value date", "completion time", "paid on"},
+    "amount": {"amount", "credit", "paid in", "deposit", "amount paid"},
+    "reference": {"reference", "ref", "receipt no", "receipt no.", "transaction id"},
+    "description": {"description", "narration", "details", "particulars"},
+    "registration_number": {
+        "registration_number",
+        "registration number",
+        "reg no",
+        "account",
+        "account no",
+        "account number",
+    },
+}
+DATE_FORMATS = [
+    "%Y-%m-%d",
+    "%d/%m/%Y",
+    "%d-%m-%Y",
+    "%d.%m.%Y",
+    "%d %b %Y",
+    "%Y-%m-%d %H:%M:%S",
+]
+# Things in a reference or description that could be a registration number
+TOKEN = re.compile(r"[A-Za-z0-9][A-Za-z0-9/_-]*")
+
+
+def parse_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    text = cell_text(value)
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Unrecognised date {text!r}")
+
+
+def parse_amount(value):
+    text = cell_text(value).replace(",", "")
+    try:
+        amount = Decimal(text)
+    except InvalidOperation:
+        raise ValueError(f"Amount {text!r} is not a number")
+    if amount != amount.to_integral_value():
+        raise ValueError(f"Amount {text} has a fractional part")
+    return int(amount)
+
+
+def fingerprint(day, reference, amount, description, registration_number=""):
+    """Identifies a payment listed again on a later statement.
+
+    Generic references such as "CASH DEPOSIT" repeat, so the description and
+    account are part of the key as well.
+    """
+    key = "|".join(
+        str(part).upper() for part in (day, reference, description, registration_number, amount)
+    )
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+class InvoiceIndex:
+    """Open invoices by registration number and invoice number, from one query.
+
+    Tracks what is still owed on each invoice as payments are matched, so two
+    payments can't both settle the same balance: what is owed already leaves
+    out statement lines matched earlier but not yet confirmed.
+    """
+
+    def __init__(self):
+        self.by_registration = {}
+        self.owed = {}
+        pending = Q(statementline__status="matched", statementline__receipt__isnull=True)
+        rows = (
+            Invoice.objects.filter(status="active")
+            .annotate(
+                owed=F("balance")
+                - Sum("statementline__amount", filter=pending, default=0)
+            )
+            .order_by("pk")
+            .values_list("pk", "student__registration_number", "owed")
+        )
+        for pk, registration_number, balance in rows:
+            # A student's latest open invoice wins
+            self.by_registration[registration_number.upper()] = pk
+            self.owed[pk] = balance
+        self.reference = re.compile(
+            getattr(settings, "RECONCILE_REFERENCE_PATTERN", r"\bINV[-\s#]?(\d+)\b"),
+            re.IGNORECASE,
+        )
+
+    def find(self, registration_number, text):
+        if registration_number:
+            return self.by_registration.get(registration_number.upper())
+        for match in self.reference.finditer(text):
+            pk = int(match.group(1))
+            if pk in self.owed:
+                return pk
+        for token in TOKEN.findall(text):
+            pk = self.by_registration.get(token.upper())
+            if pk:
+                return pk
+        return None
+
+
+def match(index, record, tolerance):
+    """Return ``(status, invoice_id, note)`` for a parsed statement record."""
+    if record["amount"] <= 0:
+        return "unmatched", None, "Not a payment"
+    invoice_id = index.find(
+        record["registration_number"], f"{record['reference']} {record['description']}"
+    )
+    if invoice_id is None:
+        return "unmatched", None, "No open invoice found"
+    owed = index.owed[invoice_id]
+    if record["amount"] > owed + tolerance:
+        return "unmatched", invoice_id, f"Pays {record['amount']} but {owed} is owed"
+    index.owed[invoice_id] = owed - record["amount"]
+    return "matched", invoice_id, ""
+
+
+def _existing_fingerprints(fingerprints, chunk=1000):
+    fingerprints = list(fingerprints)
+    seen = set()
+    for start in range(0, len(fingerprints), chunk):
+        seen.update(
+            StatementLine.objects.filter(
+                fingerprint__in=fingerprints[start : start + chunk],
+                status__in=["matched", "confirmed"],
+            ).values_list("fingerprint", flat=True)
+        )
+    return seen
+
+
+def match_statement(statement):
+    """Read ``statement``'s file into StatementLines; returns status counts."""
+    tolerance = getattr(settings, "RECONCILE_AMOUNT_TOLERANCE", 0)
+    parsed = []
+    with statement.file.open("rb") as fh:
+        records = iter_records(
+            iter_rows(fh, statement.file.name), STATEMENT_COLUMNS, required=["amount"]
+        )
+        for line_number, record in records:
+            line = StatementLine(
+                statement=statement,
+                line_number=line_number,
+                reference=cell_text(record.get("reference"))[:100],
+                description=cell_text(record.get("description"))[:255],
+            )
+            try:
+                line.amount = parse_amount(record["amount"])
+                line.date = parse_date(record["date"]) if record.get("date") else None
+            except ValueError as exc:
+                line.status, line.note = "unmatched", str(exc)
+            registration_number = cell_text(record.get("registration_number"))
+            line.fingerprint = fingerprint(
+                line.date, line.reference, line.amount, line.description, registration_number
+            )
+            parsed.append((line, registration_number))
+
+    index = InvoiceIndex()
+    # Only earlier statements count: identical lines on one statement are
+    # separate payments
+    seen = _existing_fingerprints(line.fingerprint for line, _ in parsed)
+    for line, registration_number in parsed:
+        if line.status:
+            continue
+        if line.fingerprint in seen:
+            line.status, line.note = "duplicate", "This payment was already listed"
+            continue
+        line.status, line.invoice_id, line.note = match(
+            index,
+            {
+                "amount": line.amount,
+                "registration_number": registration_number,
+                "reference": line.reference,
+                "description": line.description,
+            },
+            tolerance,
+        )
+    lines = StatementLine.objects.bulk_create([line for line, _ in parsed], batch_size=1000)
+    counts = {}
+    for line in lines:
+        counts[line.status] = counts.get(line.status, 0) + 1
+    return counts
+
+
+def confirm(lines):
+    """Turn matched ``lines`` (a queryset) into receipts; returns how many.
+
+    What each invoice owes is checked again first: a line paying more than
+    is left goes back to review instead of being receipted.
+    """
+    tolerance = getattr(settings, "RECONCILE_AMOUNT_TOLERANCE", 0)
+    with transaction.atomic():
+        lines = list(
+            lines.filter(status="matched", receipt__isnull=True, invoice__isnull=False)
+            .select_related("statement")
+            .select_for_update()
+            .order_by("pk")
+        )
+        owed = dict(
+            Invoice.objects.filter(pk__in={line.invoice_id for line in lines})
+            .select_for_update()
+            .values_list("pk", "balance")
+        )
+        accepted = []
+        for line in lines:
+            if line.amount > owed[line.invoice_id] + tolerance:
+                line.status = "unmatched"
+                line.note = f"Pays {line.amount} but {owed[line.invoice_id]} is owed"
+            else:
+                owed[line.invoice_id] -= line.amount
+                accepted.append(line)
+        receipts = create_receipts(
+            Receipt(
+                invoice_id=line.invoice_id,
+                amount_paid=line.amount,
+                date_paid=line.date or line.statement.created_at.date(),
+                comment=f"Bank ref {line.reference}"[:200] if line.reference else "Bank",
+            )
+            for line in accepted
+        )
+        for line, receipt in zip(accepted, receipts):
+            line.receipt = receipt
+            line.status = "confirmed"
+        StatementLine.objects.bulk_update(
+            lines, ["receipt", "status", "note"], batch_size=1000
+        )
+    return len(accepted)
+
+
+def find_invoice(reference):
+    """The open invoice a reviewer means by an invoice number or reg. number."""
+    reference = reference.strip()
+    invoices = Invoice.objects.filter(status="active").order_by("-pk")
+    if reference.isdigit():
+        invoice = invoices.filter(pk=int(reference)).first()
+        if invoice:
+            return invoice
+    return invoices.filter(student__registration_number__iexact=reference).first()
@@ -0,0 +1,173 @@
+"""Finance reports, each a single aggregate query.
+
+A report is a list of ``(key, label)`` columns and a ``values()`` queryset
+producing one dict per row, so the same report renders as a table or
+streams as CSV without loading every row.
+"""
+
+import csv
+from collections import namedtuple
+from datetime import timedelta
+
+from django.db.models import Count, F, FloatField, Q, Sum, Value
+from django.db.models.functions import Cast, Concat, NullIf, Round
+from django.utils import timezone
+
+from .models import Invoice
+
+Report = namedtuple("Report", ["title", "description", "columns", "build"])
+
+
+def _total_due():
+    return Sum(F("balance_from_previous_term") + F("amount_payable"))
+
+
+def outstanding(invoices, **options):
+    return (
+        invoices.values("session__name", "term__name", "class_for__name")
+        .annotate(
+            invoice_count=Count("pk"),
+            due=_total_due(),
+            paid=Sum("amount_paid"),
+            outstanding=Sum("balance"),
+        )
+        .order_by("-session__name", "term__name", "class_for__name")
+    )
+
+
+def aging(invoices, **options):
+    today = timezone.localdate()
+    days_30, days_60 = today - timedelta(days=30), today - timedelta(days=60)
+    owing = invoices.filter(status="active", balance__gt=0)
+    return (
+        owing.values("class_for__name")
+        .annotate(
+            invoice_count=Count("pk"),
+            current=Sum("balance", filter=Q(issued_on__gte=days_30), default=0),
+            days_31_60=Sum(
+                "balance", filter=Q(issued_on__lt=days_30, issued_on__gte=days_60), default=0
+            ),
+            over_60=Sum("balance", filter=Q(issued_on__lt=days_60), default=0),
+            outstanding=Sum("balance"),
+        )
+        .order_by("class_for__name")
+    )
+
+
+def collection(invoices, term=None, **options):
+    # A balance brought forward was already due on the previous term's
+    # invoice, so it only counts when the rows are limited to one term
+    due = _total_due() if term else Sum("amount_payable")
+    return (
+        invoices.values("class_for__name")
+        .annotate(
+            invoice_count=Count("pk"),
+            due=due,
+            paid=Sum("amount_paid"),
+        )
+        .annotate(
+            rate=Round(
+                Cast("paid", FloatField()) * 100.0 / NullIf(Cast("due", FloatField()), 0.0),
+                1,
+            )
+        )
+        .order_by("class_for__name")
+    )
+
+
+def debtors(invoices, limit=50, **options):
+    # Closed invoices' balances were carried into the student's next invoice
+    return (
+        invoices.filter(status="active", balance__gt=0)
+        .values("student__registration_number")
+        .annotate(
+            name=Concat("student__surname", Value(" "), "student__firstname"),
+            student_class=F("student__current_class__name"),
+            phone=F("student__parent_mobile_number"),
+            invoice_count=Count("pk"),
+            outstanding=Sum("balance"),
+        )
+        .order_by("-outstanding", "student__registration_number")[:limit]
+    )
+
+
+REPORTS = {
+    "outstanding": Report(
+        "Outstanding by class",
+        "Amount due, paid and outstanding per session, term and class.",
+        [
+            ("session__name", "Session"),
+            ("term__name", "Term"),
+            ("class_for__name", "Class"),
+            ("invoice_count", "Invoices"),
+            ("due", "Due"),
+            ("paid", "Paid"),
+            ("outstanding", "Outstanding"),
+        ],
+        outstanding,
+    ),
+    "aging": Report(
+        "Arrears aging",
+        "Unpaid balances of open invoices by days since the invoice was issued.",
+        [
+            ("class_for__name", "Class"),
+            ("invoice_count", "Invoices"),
+            ("current", "0-30 days"),
+            ("days_31_60", "31-60 days"),
+            ("over_60", "Over 60 days"),
+            ("outstanding", "Total"),
+        ],
+        aging,
+    ),
+    "collection": Report(
+        "Collection rate",
+        "Share of the amount due that has been paid; balances brought forward "
+        "count only when a term is chosen.",
+        [
+            ("class_for__name", "Class"),
+            ("invoice_count", "Invoices"),
+            ("due", "Due"),
+            ("paid", "Paid"),
+            ("rate", "Collected %"),
+        ],
+        collection,
+    ),
+    "debtors": Report(
+        "Top debtors",
+        "Students with the largest unpaid balances on open invoices.",
+        [
+            ("student__registration_number", "Reg. number"),
+            ("name", "Name"),
+            ("student_class", "Class"),
+            ("phone", "Parent phone"),
+            ("invoice_count", "Invoices"),
+            ("outstanding", "Outstanding"),
+        ],
+        debtors,
+    ),
+}
+
+
+def run(name, session=None, term=None, student_class=None, **options):
+    """Return the rows queryset of report ``name`` for the given filters."""
+    invoices = Invoice.objects.order_by()
+    if session:
+        invoices = invoices.filter(session=session)
+    if term:
+        invoices = invoices.filter(term=term)
+    if student_class:
+        invoices = invoices.filter(class_for=student_class)
+    return REPORTS[name].build(invoices, session=session, term=term, **options)
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def stream_csv(columns, rows):
+    """Yield CSV lines for ``rows`` (dicts), reading them in chunks."""
+    writer = csv.writer(_Echo())
+    yield writer.writerow([label for _, label in columns])
+    for row in rows.iterator(chunk_size=2000):
+        yield writer.writerow([row[key] for key, _ in columns])
@@ -0,0 +1,273 @@
+import logging
+from collections import namedtuple
+
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from apps.corecode.audit import audit_log
+from apps.students.models import Student
+
+from . import ledger, summaries
+from .models import FeeStructure, Invoice, InvoiceItem, Receipt
+from .numbering import number_receipts
+
+logger = logging.getLogger(__name__)
+
+BillingResult = namedtuple(
+    "BillingResult",
+    ["invoices", "items", "amount", "carried_forward", "skipped", "unbilled_classes"],
+)
+RolloverResult = namedtuple(
+    "RolloverResult", ["closed", "students", "carried_forward", "updated", "not_invoiced"]
+)
+
+
+def _sum_for_invoice(model, field):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(invoice=OuterRef("pk"))
+            .order_by()
+            .values("invoice")
+            .annotate(total=Sum(field))
+            .values("total")
+        ),
+        0,
+    )
+
+
+def refresh_invoice_totals(invoices=None):
+    """Recompute the stored totals of ``invoices`` in one UPDATE.
+
+    ``invoices`` is a queryset or an iterable of invoice ids; ``None`` means
+    every invoice. Returns the number of invoices updated.
+    """
+    if invoices is None:
+        queryset = Invoice.objects.all()
+    elif hasattr(invoices, "values"):
+        queryset = invoices
+    else:
+        ids = [pk for pk in invoices if pk is not None]
+        if not ids:
+            return 0
+        queryset = Invoice.objects.filter(pk__in=ids)
+    return queryset.order_by().update(
+        amount_payable=_sum_for_invoice(InvoiceItem, "amount"),
+        amount_paid=_sum_for_invoice(Receipt, "amount_paid"),
+    )
+
+
+def create_receipts(receipts, batch_size=1000):
+    """Write unsaved ``receipts`` in bulk and bring their invoices up to date.
+
+    The receipts, the stored totals of their invoices, the ledger payments
+    and the daily collections are written in one transaction, and the
+    receipts are audited. Returns the saved receipts.
+    """
+    receipts = list(receipts)
+    if not receipts:
+        return receipts
+    with transaction.atomic():
+        number_receipts(receipts)
+        Receipt.objects.bulk_create(receipts, batch_size=batch_size)
+        invoice_ids = {receipt.invoice_id for receipt in receipts}
+        refresh_invoice_totals(invoice_ids)
+        students = dict(
+            Invoice.objects.filter(pk__in=invoice_ids)
+            .order_by()
+            .values_list("pk", "student_id")
+        )
+        ledger.post(
+            ledger.entry(
+                students[receipt.invoice_id],
+                receipt.invoice_id,
+                -receipt.amount_paid,
+                "payment",
+                f"Payment: {receipt.comment}" if receipt.comment else "Payment",
+                receipt.date_paid,
+            )
+            for receipt in receipts
+        )
+        summaries.record_receipts(receipts)
+        audit_log.record_many("create", receipts)
+    return receipts
+
+
+def generate_invoices(session, term, classes, dry_run=False, batch_size=1000):
+    """Invoice every active student of ``classes`` from their fee structure.
+
+    Runs in one transaction and writes with ``bulk_create``, so the per-row
+    ``after_creating_invoice`` signal is not involved: each student's latest
+    earlier invoice is looked up for every student in the same query, its
+    balance is carried forward and it is closed in a single UPDATE.
+    Students who already have an invoice for ``session`` and ``term`` are
+    skipped, so running it again only bills newly added students; runs for
+    the same classes at the same time wait on each other's fee structure
+    locks, so none of them bills a student twice. With
+    ``dry_run`` nothing is written. Returns a ``BillingResult``.
+    """
+    structures = {
+        fs.student_class_id: fs
+        for fs in FeeStructure.objects.filter(
+            session=session, term=term, student_class__in=classes
+        )
+        .order_by()
+        .prefetch_related("items")
+    }
+    unbilled_classes = [c for c in classes if c.pk not in structures]
+
+    previous = Invoice.objects.filter(student=OuterRef("pk")).exclude(
+        session=session, term=term
+    ).order_by("-pk")
+    students = (
+        Student.objects.filter(current_status="active", current_class__in=list(structures))
+        .annotate(
+            previous_invoice=Subquery(previous.values("pk")[:1]),
+            previous_balance=Subquery(previous.values("balance")[:1]),
+        )
+        .values_list("pk", "current_class_id", "previous_invoice", "previous_balance")
+        .order_by("pk")
+    )
+
+    with transaction.atomic():
+        # A run billing the same classes waits here, then sees what this one billed
+        list(
+            FeeStructure.objects.filter(pk__in=[fs.pk for fs in structures.values()])
+            .select_for_update()
+            .order_by("pk")
+            .values_list("pk", flat=True)
+        )
+        billed = set(
+            Invoice.objects.filter(
+                session=session, term=term, student__current_class__in=list(structures)
+            )
+            .order_by()
+            .values_list("student_id", flat=True)
+        )
+        invoices, previous_ids, skipped, carried = [], [], 0, 0
+        for student_id, class_id, previous_id, previous_balance in students:
+            if student_id in billed:
+                skipped += 1
+                continue
+            structure = structures[class_id]
+            invoices.append(
+                Invoice(
+                    student_id=student_id,
+                    session=session,
+                    term=term,
+                    class_for_id=class_id,
+                    balance_from_previous_term=previous_balance or 0,
+                    amount_payable=sum(item.amount for item in structure.items.all()),
+                )
+            )
+            carried += previous_balance or 0
+            if previous_id:
+                previous_ids.append(previous_id)
+
+        item_count = sum(len(structures[i.class_for_id].items.all()) for i in invoices)
+        amount = sum(i.amount_payable for i in invoices)
+        result = BillingResult(
+            len(invoices), item_count, amount, carried, skipped, unbilled_classes
+        )
+        if dry_run or not invoices:
+            return result
+
+        Invoice.objects.bulk_create(invoices, batch_size=batch_size)
+        audit_log.record_many("create", invoices, related=["student"])
+        InvoiceItem.objects.bulk_create(
+            (
+                InvoiceItem(invoice=invoice, description=item.description, amount=item.amount)
+                for invoice in invoices
+                for item in structures[invoice.class_for_id].items.all()
+            ),
+            batch_size=batch_size,
+        )
+        for start in range(0, len(previous_ids), batch_size):
+            Invoice.objects.filter(
+                pk__in=previous_ids[start : start + batch_size]
+            ).update(status="closed")
+        ledger.post(
+            ledger.entry(
+                invoice.student_id,
+                invoice.pk,
+                invoice.amount_payable,
+                "charge",
+                f"Fees for {session} {term}",
+            )
+            for invoice in invoices
+        )
+    logger.info(
+        "Generated %d invoices for %s %s (%d skipped)", len(invoices), session, term, skipped
+    )
+    return result
+
+
+def rollover_term(session, term, next_session, next_term, dry_run=False):
+    """Close the invoices of ``session``/``term`` and carry their balances.
+
+    Each student's balances for the period are summed in one aggregate and
+    written as ``balance_from_previous_term`` of their invoice for
+    ``next_session``/``next_term`` in a single UPDATE; every active invoice
+    of the period is then closed with another. Only invoices whose carried
+    balance changes are written, so running it again is a no-op unless
+    something was paid or billed in the meantime. Students without a
+    next-period invoice get their balance carried when they are invoiced.
+    With ``dry_run`` nothing is written. Returns a ``RolloverResult``.
+    """
+    period = Invoice.objects.filter(session=session, term=term).order_by()
+    carried = Subquery(
+        period.filter(student=OuterRef("student"))
+        .values("student")
+        .annotate(total=Sum("balance"))
+        .values("total")
+    )
+    changed = (
+        Invoice.objects.filter(
+            session=next_session, term=next_term, student__in=period.values("student")
+        )
+        .annotate(carried=carried)
+        .exclude(balance_from_previous_term=F("carried"))
+    )
+
+    with transaction.atomic():
+        totals = period.aggregate(
+            carried_forward=Coalesce(Sum("balance"), 0),
+            students=Count("student", distinct=True),
+            closed=Count("pk", filter=Q(status="active")),
+        )
+        not_invoiced = (
+            period.exclude(
+                student__in=Invoice.objects.filter(
+                    session=next_session, term=next_term
+                ).values("student")
+            )
+            .values("student")
+            .distinct()
+            .count()
+        )
+        updated = changed.count()
+        result = RolloverResult(
+            totals["closed"],
+            totals["students"],
+            totals["carried_forward"],
+            updated,
+            not_invoiced,
+        )
+        if dry_run:
+            return result
+
+        if updated:
+            Invoice.objects.filter(pk__in=changed.values("pk")).update(
+                balance_from_previous_term=carried
+            )
+        period.filter(status="active").update(status="closed")
+    logger.info(
+        "Rolled over %s %s to %s %s: %d invoices closed, %d carried balances updated",
+        session,
+        term,
+        next_session,
+        next_term,
+        result.closed,
+        result.updated,
+    )
+    return result
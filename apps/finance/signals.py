@@ -1,19 +1,78 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 
-from .models import Invoice
+from apps.students.models import Student
 
+from . import ledger, summaries
+from .models import Invoice, InvoiceItem, Receipt
+from .services import refresh_invoice_totals
 
-@receiver(post_save, sender=Invoice)
-def after_creating_invoice(sender, instance, created, **kwargs):
-    if created:
+
+@receiver(pre_save, sender=Invoice)
+def before_creating_invoice(sender, instance, raw=False, **kwargs):
+    # Carry the balance of the student's latest invoice (latest by creation,
+    # as in generate_invoices) so the new invoice is written only once
+    if instance._state.adding and not raw:
         previous_inv = (
-            Invoice.objects.filter(student=instance.student)
-            .exclude(id=instance.id)
-            .last()
+            Invoice.objects.filter(student_id=instance.student_id)
+            .order_by("-pk")
+            .values("pk", "balance")
+            .first()
         )
         if previous_inv:
-            previous_inv.status = "closed"
-            previous_inv.save()
-            instance.balance_from_previous_term = previous_inv.balance()
-            instance.save()
+            instance.balance_from_previous_term = previous_inv["balance"]
+            instance._previous_invoice_id = previous_inv["pk"]
+
+
+@receiver(post_save, sender=Invoice)
+def after_creating_invoice(sender, instance, created, raw=False, **kwargs):
+    previous_id = instance.__dict__.pop("_previous_invoice_id", None)
+    loaded_opening = instance.__dict__.get("_loaded_opening_balance", 0)
+    instance._loaded_opening_balance = instance.balance_from_previous_term
+    if raw:
+        return
+    if created and previous_id:
+        Invoice.objects.filter(pk=previous_id).update(status="closed")
+        return
+    # A student's first invoice brings in their opening balance; on later
+    # invoices the balance brought forward is already in the ledger
+    change = instance.balance_from_previous_term - loaded_opening
+    if not change:
+        return
+    earlier = Invoice.objects.filter(student_id=instance.student_id, pk__lt=instance.pk)
+    if created or not earlier.exists():
+        ledger.post(
+            [
+                ledger.entry(
+                    instance.student_id,
+                    instance.pk,
+                    change,
+                    "opening" if created else "adjustment",
+                    "Opening balance" if created else "Opening balance (changed)",
+                )
+            ]
+        )
+
+
+@receiver(post_save, sender=Invoice)
+def after_moving_invoice(sender, instance, created, raw=False, **kwargs):
+    # Receipts are totalled by their invoice's session, term and class
+    loaded_key = instance.__dict__.get("_loaded_summary_key")
+    instance._loaded_summary_key = instance.summary_key
+    if not raw and not created and loaded_key and loaded_key != instance.summary_key:
+        summaries.move_invoice(instance.pk, loaded_key, instance.summary_key)
+
+
+@receiver(post_delete, sender=InvoiceItem)
+@receiver(post_delete, sender=Receipt)
+def after_deleting_item_or_receipt(sender, instance, origin=None, **kwargs):
+    # Runs inside the deletion's transaction. When the invoice itself (or its
+    # student) is being deleted there is nothing left to update.
+    origin_model = getattr(origin, "model", type(origin))
+    if origin_model in (InvoiceItem, Receipt):
+        refresh_invoice_totals([instance.invoice_id])
+    # The ledger keeps the history, unless the student's ledger is going too
+    if origin_model is not Student:
+        ledger.post_removal(instance)
+    if sender is Receipt:
+        summaries.record_receipts([instance], sign=-1)
@@ -0,0 +1,186 @@
+"""Daily collections per session, term and class.
+
+DailyCollection holds what receipts add up to for each day, session, term
+and class. It is kept up to date incrementally: every receipt saved,
+created in bulk or deleted adds its amount and count to (or takes them off)
+its row, so charts over a term read a few hundred rows instead of every
+receipt. ``rebuild`` recomputes the table from receipts.
+"""
+
+from datetime import datetime, timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from .models import DailyCollection, Invoice, Receipt
+
+
+def _day(value):
+    # A receipt created with the default date_paid holds a datetime until saved
+    if isinstance(value, datetime):
+        return timezone.localtime(value).date() if timezone.is_aware(value) else value.date()
+    return value
+
+
+def _invoice_keys(invoice_ids):
+    return {
+        pk: (session_id, term_id, class_id)
+        for pk, session_id, term_id, class_id in Invoice.objects.filter(
+            pk__in=[pk for pk in invoice_ids if pk]
+        )
+        .order_by()
+        .values_list("pk", "session_id", "term_id", "class_for_id")
+    }
+
+
+def apply(changes):
+    """Add ``{(date, session_id, term_id, class_id): (amount, count)}`` changes."""
+    changes = {key: change for key, change in changes.items() if any(change)}
+    if not changes:
+        return
+    with transaction.atomic():
+        for (day, session_id, term_id, class_id), (amount, count) in changes.items():
+            row = DailyCollection.objects.filter(
+                date=day, session_id=session_id, term_id=term_id, student_class_id=class_id
+            )
+            increment = {
+                "amount": F("amount") + amount,
+                "receipt_count": F("receipt_count") + count,
+            }
+            if row.update(**increment):
+                if count < 0:
+                    # The day's last receipt for the class was removed
+                    row.filter(receipt_count__lte=0).delete()
+                continue
+            try:
+                with transaction.atomic():
+                    DailyCollection.objects.create(
+                        date=day,
+                        session_id=session_id,
+                        term_id=term_id,
+                        student_class_id=class_id,
+                        amount=amount,
+                        receipt_count=count,
+                    )
+            except IntegrityError:
+                # Another transaction created the row first
+                row.update(**increment)
+
+
+def _add(changes, key, amount, count):
+    total, receipts = changes.get(key, (0, 0))
+    changes[key] = (total + amount, receipts + count)
+
+
+def record_receipts(receipts, sign=1):
+    """Add new (or, with ``sign=-1``, deleted) ``receipts`` to the summary."""
+    receipts = list(receipts)
+    keys = _invoice_keys({receipt.invoice_id for receipt in receipts})
+    changes = {}
+    for receipt in receipts:
+        if receipt.invoice_id in keys:
+            key = (_day(receipt.date_paid), *keys[receipt.invoice_id])
+            _add(changes, key, sign * receipt.amount_paid, sign)
+    apply(changes)
+
+
+def record_change(receipt, loaded_invoice_id, loaded_date_paid, loaded_amount):
+    """Move a saved receipt from its values when loaded to its current ones."""
+    keys = _invoice_keys({receipt.invoice_id, loaded_invoice_id})
+    changes = {}
+    if loaded_invoice_id in keys:
+        key = (_day(loaded_date_paid), *keys[loaded_invoice_id])
+        _add(changes, key, -loaded_amount, -1)
+    if receipt.invoice_id in keys:
+        key = (_day(receipt.date_paid), *keys[receipt.invoice_id])
+        _add(changes, key, receipt.amount_paid, 1)
+    apply(changes)
+
+
+def move_invoice(invoice_id, old_key, new_key):
+    """Move an invoice's receipts after its session, term or class changed."""
+    changes = {}
+    days = (
+        Receipt.objects.filter(invoice_id=invoice_id)
+        .order_by()
+        .values("date_paid")
+        .annotate(amount=Sum("amount_paid"), count=Count("pk"))
+    )
+    for row in days:
+        _add(changes, (row["date_paid"], *old_key), -row["amount"], -row["count"])
+        _add(changes, (row["date_paid"], *new_key), row["amount"], row["count"])
+    apply(changes)
+
+
+def rebuild(start=None, end=None):
+    """Recompute the summary from receipts, for all days or ``start``..``end``.
+
+    Returns the number of rows written.
+    """
+    receipts = Receipt.objects.order_by()
+    rows = DailyCollection.objects.all()
+    if start:
+        receipts = receipts.filter(date_paid__gte=start)
+        rows = rows.filter(date__gte=start)
+    if end:
+        receipts = receipts.filter(date_paid__lte=end)
+        rows = rows.filter(date__lte=end)
+    totals = receipts.values(
+        "date_paid", "invoice__session_id", "invoice__term_id", "invoice__class_for_id"
+    ).annotate(amount=Sum("amount_paid"), count=Count("pk"))
+    with transaction.atomic():
+        rows.delete()
+        created = DailyCollection.objects.bulk_create(
+            (
+                DailyCollection(
+                    date=row["date_paid"],
+                    session_id=row["invoice__session_id"],
+                    term_id=row["invoice__term_id"],
+                    student_class_id=row["invoice__class_for_id"],
+                    amount=row["amount"],
+                    receipt_count=row["count"],
+                )
+                for row in totals.iterator(chunk_size=2000)
+            ),
+            batch_size=1000,
+        )
+    return len(created)
+
+
+def daily_totals(days=30, session=None, term=None, student_class=None):
+    """Collections per day over the last ``days`` days, oldest first.
+
+    Each row is ``{"date", "amount", "receipt_count", "percent"}``, with
+    ``percent`` relative to the best day, for drawing bars. Days without
+    receipts are included with zeros.
+    """
+    end = timezone.localdate()
+    start = end - timedelta(days=days - 1)
+    rows = DailyCollection.objects.filter(date__gte=start, date__lte=end)
+    if session:
+        rows = rows.filter(session=session)
+    if term:
+        rows = rows.filter(term=term)
+    if student_class:
+        rows = rows.filter(student_class=student_class)
+    by_day = {
+        row["date"]: row
+        for row in rows.order_by()
+        .values("date")
+        .annotate(amount=Sum("amount"), receipt_count=Sum("receipt_count"))
+    }
+    totals = [
+        by_day.get(start + timedelta(days=n), {"amount": 0, "receipt_count": 0})
+        for n in range(days)
+    ]
+    best = max((row["amount"] for row in totals), default=0)
+    return [
+        {
+            "date": start + timedelta(days=n),
+            "amount": row["amount"],
+            "receipt_count": row["receipt_count"],
+            "percent": round(row["amount"] * 100 / best) if best > 0 else 0,
+        }
+        for n, row in enumerate(totals)
+    ]
@@ -1,3 +1,932 @@
-from django.test import TestCase
+import json
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import zipfile
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection, connections, transaction
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from apps.corecode.audit import audit_log
+from apps.corecode.models import AcademicSession, AcademicTerm, AuditLog, StudentClass
+from apps.students.models import Student
+
+from .models import (
+    BankStatement,
+    DailyCollection,
+    FeeStructure,
+    Invoice,
+    InvoiceImport,
+    InvoiceItem,
+    LedgerEntry,
+    LedgerSnapshot,
+    PaymentNotification,
+    Receipt,
+    ReceiptSequence,
+    StatementLine,
+)
+from . import documents, imports, ledger, payments, reports
+from .numbering import allocator
+from .services import create_receipts, generate_invoices, rollover_term
+
+
+def make_invoice(reg="FIN1", previous=0):
+    student = Student.objects.create(
+        registration_number=reg, surname="Banda", firstname="Grace"
+    )
+    return Invoice.objects.create(
+        student=student,
+        session=AcademicSession.objects.get_or_create(name="2030-2031")[0],
+        term=AcademicTerm.objects.get_or_create(name="First Term")[0],
+        class_for=StudentClass.objects.get_or_create(name="Grade 1A")[0],
+        balance_from_previous_term=previous,
+    )
+
+
+class InvoiceTotalsTest(TestCase):
+    def assertTotals(self, invoice, payable, paid, balance):
+        invoice.refresh_from_db()
+        self.assertEqual(
+            (invoice.amount_payable, invoice.amount_paid, invoice.balance),
+            (payable, paid, balance),
+        )
+
+    def test_items_and_receipts_keep_totals_current(self):
+        invoice = make_invoice(previous=300)
+        item = InvoiceItem.objects.create(invoice=invoice, description="Tuition", amount=1000)
+        InvoiceItem.objects.create(invoice=invoice, description="Levy", amount=200)
+        receipt = Receipt.objects.create(invoice=invoice, amount_paid=500)
+        self.assertTotals(invoice, 1200, 500, 1000)
+
+        item.amount = 1500
+        item.save()
+        receipt.amount_paid = 700
+        receipt.save()
+        self.assertTotals(invoice, 1700, 700, 1300)
+
+        receipt.delete()
+        InvoiceItem.objects.filter(description="Levy").delete()
+        self.assertTotals(invoice, 1500, 0, 1800)
+
+    def test_moving_a_receipt_updates_both_invoices(self):
+        first, second = make_invoice("FIN1"), make_invoice("FIN2")
+        receipt = Receipt.objects.create(invoice=first, amount_paid=400)
+        receipt = Receipt.objects.get(pk=receipt.pk)
+        receipt.invoice = second
+        receipt.save()
+        self.assertTotals(first, 0, 0, 0)
+        self.assertTotals(second, 0, 400, -400)
+
+    def test_saving_a_stale_invoice_keeps_the_stored_totals(self):
+        invoice = make_invoice()
+        InvoiceItem.objects.create(invoice=invoice, description="Tuition", amount=1000)
+        invoice.status = "closed"
+        invoice.save()
+        self.assertTotals(invoice, 1000, 0, 1000)
+
+    def test_update_view_formsets(self):
+        user = User.objects.create_user("bursar", password="pass12345")
+        self.client.force_login(user)
+        invoice = make_invoice()
+        item = InvoiceItem.objects.create(invoice=invoice, description="Tuition", amount=1000)
+        receipt = Receipt.objects.create(invoice=invoice, amount_paid=100)
+        data = {
+            "student": invoice.student_id,
+            "session": invoice.session_id,
+            "term": invoice.term_id,
+            "class_for": invoice.class_for_id,
+            "balance_from_previous_term": 50,
+            "issued_on": "2030-09-01",
+            "receipt_set-TOTAL_FORMS": 1,
+            "receipt_set-INITIAL_FORMS": 1,
+            "receipt_set-0-id": receipt.pk,
+            "receipt_set-0-amount_paid": 600,
+            "receipt_set-0-date_paid": "2030-10-01",
+            "invoiceitem_set-TOTAL_FORMS": 2,
+            "invoiceitem_set-INITIAL_FORMS": 1,
+            "invoiceitem_set-0-id": item.pk,
+            "invoiceitem_set-0-description": "Tuition",
+            "invoiceitem_set-0-amount": 1000,
+            "invoiceitem_set-1-description": "Bus",
+            "invoiceitem_set-1-amount": 250,
+        }
+        response = self.client.post(reverse("invoice-update", args=[invoice.pk]), data)
+        self.assertEqual(response.status_code, 302)
+        self.assertTotals(invoice, 1250, 600, 700)
+
+    def test_recompute_command(self):
+        invoice = make_invoice()
+        InvoiceItem.objects.create(invoice=invoice, description="Tuition", amount=1000)
+        Invoice.objects.update(amount_payable=0, amount_paid=99)
+        out = StringIO()
+        call_command("recompute_invoice_totals", stdout=out)
+        self.assertIn("1 invoices", out.getvalue())
+        self.assertTotals(invoice, 1000, 0, 1000)
+
+
+class LedgerTest(TestCase):
+    def entries(self, invoice):
+        return list(
+            LedgerEntry.objects.filter(student=invoice.student).values_list(
+                "kind", "debit", "credit", "balance"
+            )
+        )
+
+    def test_changes_are_posted_with_a_running_balance(self):
+        invoice = make_invoice(previous=300)
+        item = InvoiceItem.objects.create(invoice=invoice, description="Tuition", amount=1000)
+        receipt = Receipt.objects.create(invoice=invoice, amount_paid=500)
+        item = InvoiceItem.objects.get(pk=item.pk)
+        item.amount = 1200
+        item.save()
+        receipt.delete()
+        self.assertEqual(
+            self.entries(invoice),
+            [
+                ("opening", 300, 0, 300),
+                ("charge", 1000, 0, 1300),
+                ("payment", 0, 500, 800),
+                ("adjustment", 200, 0, 1000),
+                ("adjustment", 500, 0, 1500),
+            ],
+        )
+        invoice.refresh_from_db()
+        self.assertEqual(ledger.current_balance(invoice.student), invoice.balance)
+        with self.assertRaises(ValueError):
+            LedgerEntry.objects.first().save()
+
+        # Deleting the invoice reverses its charges but keeps the history
+        invoice.delete()
+        self.assertEqual(LedgerEntry.objects.count(), 6)
+        self.assertEqual(ledger.current_balance(invoice.student), 300)
+
+    def test_balance_as_of_and_snapshots(self):
+        invoice = make_invoice()
+        InvoiceItem.objects.create(invoice=invoice, description="Tuition", amount=1000)
+        today = timezone.localdate()
+        yesterday = today - timedelta(days=1)
+        LedgerEntry.objects.update(date=yesterday)
+        Receipt.objects.create(invoice=invoice, amount_paid=400)
+
+        self.assertEqual(ledger.balance_as_of(invoice.student, yesterday), 1000)
+        self.assertEqual(ledger.balance_as_of(invoice.student, today), 600)
+        call_command("snapshot_ledger", stdout=StringIO())
+        call_command("snapshot_ledger", stdout=StringIO())
+        snapshot = LedgerSnapshot.objects.get()
+        self.assertEqual((snapshot.date, snapshot.balance), (yesterday, 1000))
+        with self.assertNumQueries(1):
+            ledger.balance_as_of(invoice.student, yesterday)
+
+        # Later days start from yesterday's snapshot
+        with self.assertNumQueries(2):
+            self.assertEqual(ledger.balance_as_of(invoice.student, today), 600)
+        LedgerSnapshot.objects.update(balance=999)
+        self.assertEqual(ledger.balance_as_of(invoice.student, today + timedelta(days=3)), 599)
+        LedgerSnapshot.objects.update(balance=1000)
+
+        # A payment recorded today but made yesterday counts yesterday
+        Receipt.objects.create(invoice=invoice, amount_paid=100, date_paid=yesterday)
+        self.assertFalse(LedgerSnapshot.objects.exists())
+        self.assertEqual(ledger.balance_as_of(invoice.student, yesterday), 900)
+        self.assertEqual(ledger.balance_as_of(invoice.student, today), 500)
+
+    def test_student_page_reads_the_ledger(self):
+        invoice = make_invoice()
+        InvoiceItem.objects.create(invoice=invoice, description="Tuition", amount=1000)
+        self.client.force_login(User.objects.create_user("clerk", password="pw"))
+        response = self.client.get(reverse("student-detail", args=[invoice.student_id]))
+        self.assertEqual(response.context["balance"], 1000)
+        self.assertContains(response, "Tuition")
+
+
+class FinanceReportsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("bursar", password="pw")
+        today = timezone.localdate()
+        rows = [("R1", 1000, 1000, 5), ("R2", 1000, 200, 45), ("R3", 600, 0, 90)]
+        for reg, fees, paid, age in rows:
+            invoice = make_invoice(reg)
+            Invoice.objects.filter(pk=invoice.pk).update(issued_on=today - timedelta(days=age))
+            InvoiceItem.objects.create(invoice=invoice, description="Tuition", amount=fees)
+            if paid:
+                Receipt.objects.create(invoice=invoice, amount_paid=paid)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def report(self, name, **params):
+        response = self.client.get(reverse("finance-report", args=[name]), params)
+        self.assertEqual(response.status_code, 200)
+        return response.context["rows"]
+
+    def test_reports_aggregate_in_the_database(self):
+        with self.assertNumQueries(1):
+            list(reports.run("debtors"))
+        self.assertEqual(
+            self.report("outstanding"),
+            [["2030-2031", "First Term", "Grade 1A", 3, 2600, 1200, 1400]],
+        )
+        self.assertEqual(self.report("aging"), [["Grade 1A", 2, 0, 800, 600, 1400]])
+        self.assertEqual(self.report("collection"), [["Grade 1A", 3, 2600, 1200, 46.2]])
+        debtors = self.report("debtors", limit=1)
+        self.assertEqual(debtors, [["R2", "Banda Grace", None, "", 1, 800]])
+
+    def test_collection_counts_carried_balances_once(self):
+        # R2's 800 is carried into a second term, where 300 more is charged
+        first = AcademicTerm.objects.get(name="First Term")
+        second = AcademicTerm.objects.create(name="Second Term")
+        Invoice.objects.filter(student__registration_number="R2").update(status="closed")
+        invoice = Invoice.objects.create(
+            student=Student.objects.get(registration_number="R2"),
+            session=AcademicSession.objects.get(name="2030-2031"),
+            term=second,
+            class_for=StudentClass.objects.get(name="Grade 1A"),
+            balance_from_previous_term=800,
+        )
+        InvoiceItem.objects.create(invoice=invoice, description="Tuition", amount=300)
+        self.assertEqual(self.report("collection"), [["Grade 1A", 4, 2900, 1200, 41.4]])
+        self.assertEqual(
+            self.report("collection", term=second.pk), [["Grade 1A", 1, 1100, 0, 0.0]]
+        )
+        self.assertEqual(
+            self.report("collection", term=first.pk), [["Grade 1A", 3, 2600, 1200, 46.2]]
+        )
+
+    def test_csv_export_streams(self):
+        response = self.client.get(
+            reverse("finance-report", args=["debtors"]), {"format": "csv"}
+        )
+        self.assertTrue(response.streaming)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], "Reg. number,Name,Class,Parent phone,Invoices,Outstanding")
+        self.assertEqual(lines[1:], ["R2,Banda Grace,,,1,800", "R3,Banda Grace,,,1,600"])
+
+
+class InvoiceListViewTest(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user("bursar", password="pass12345"))
+        self.paid_up = make_invoice("FIN1")
+        self.owing = make_invoice("FIN2", previous=900)
+        Student.objects.filter(pk=self.owing.student_id).update(surname="Kariuki")
+
+    def list(self, **params):
+        return self.client.get(reverse("invoice-list"), params)
+
+    def test_filters_by_balance_and_search(self):
+        response = self.list(min_balance=500)
+        self.assertEqual(list(response.context["object_list"]), [self.owing])
+        self.assertEqual(response.context["totals"]["balance"], 900)
+        response = self.list(q="kari")
+        self.assertEqual(list(response.context["object_list"]), [self.owing])
+        response = self.list(q="FIN1", status="active")
+        self.assertEqual(list(response.context["object_list"]), [self.paid_up])
+
+    def test_invalid_field_does_not_drop_the_others(self):
+        response = self.list(q="kari", max_balance="lots")
+        self.assertEqual(list(response.context["object_list"]), [self.owing])
+
+    def test_pages_keep_the_filters(self):
+        for i in range(60):
+            make_invoice(f"PAGE{i:02d}")
+        response = self.list(q="PAGE", page=2)
+        self.assertEqual(len(response.context["object_list"]), 10)
+        self.assertContains(response, "?q=PAGE&amp;page=1")
+
+
+class GenerateInvoicesTest(TestCase):
+    def setUp(self):
+        self.session = AcademicSession.objects.create(name="2031-2032")
+        self.term = AcademicTerm.objects.create(name="Second Term")
+        self.grade = StudentClass.objects.create(name="Grade 2B")
+        structure = FeeStructure.objects.create(
+            student_class=self.grade, session=self.session, term=self.term
+        )
+        structure.items.create(description="Tuition", amount=1000)
+        structure.items.create(description="Meals", amount=300)
+        self.owing = make_invoice("GEN1", previous=250)
+        Student.objects.filter(pk=self.owing.student_id).update(current_class=self.grade)
+        Student.objects.create(
+            registration_number="GEN2", surname="Eze", firstname="Joy", current_class=self.grade
+        )
+        Student.objects.create(
+            registration_number="GEN3",
+            surname="Moyo",
+            firstname="Ruth",
+            current_class=self.grade,
+            current_status="inactive",
+        )
+
+    def generate(self, **kwargs):
+        return generate_invoices(self.session, self.term, [self.grade], **kwargs)
+
+    def test_dry_run_writes_nothing(self):
+        result = self.generate(dry_run=True)
+        self.assertEqual((result.invoices, result.items, result.amount), (2, 4, 2600))
+        self.assertEqual(result.carried_forward, 250)
+        self.assertFalse(Invoice.objects.filter(session=self.session).exists())
+
+    def test_generates_once_and_carries_balances(self):
+        audit_log.flush()
+        # Same number of queries whatever the number of students
+        with self.assertNumQueries(17), self.captureOnCommitCallbacks(execute=True):
+            result = self.generate()
+        self.assertEqual(result.invoices, 2)
+        audit_log.flush()
+        self.assertEqual(
+            AuditLog.objects.filter(model="finance.Invoice", action="create").count(), 2
+        )
+        invoice = Invoice.objects.get(session=self.session, student=self.owing.student)
+        self.assertEqual(invoice.balance_from_previous_term, 250)
+        self.assertEqual((invoice.amount_payable, invoice.balance), (1300, 1550))
+        self.assertEqual(invoice.invoiceitem_set.count(), 2)
+        self.owing.refresh_from_db()
+        self.assertEqual(self.owing.status, "closed")
+        self.assertEqual(ledger.current_balance(self.owing.student), 1550)
+
+        again = self.generate()
+        self.assertEqual((again.invoices, again.skipped), (0, 2))
+        self.assertEqual(Invoice.objects.filter(session=self.session).count(), 2)
+
+    def test_bulk_invoice_page(self):
+        self.client.force_login(User.objects.create_user("bursar", password="pass12345"))
+        data = {"session": self.session.pk, "term": self.term.pk, "classes": [self.grade.pk]}
+        response = self.client.post(reverse("bulk-invoice"), {**data, "dry_run": "on"})
+        self.assertContains(response, "2 new invoices")
+        response = self.client.post(reverse("bulk-invoice"), data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Invoice.objects.filter(session=self.session).count(), 2)
+
+
+class TermRolloverTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.session = AcademicSession.objects.create(name="2030-2031")
+        cls.first = AcademicTerm.objects.create(name="First Term")
+        cls.second = AcademicTerm.objects.create(name="Second Term")
+        cls.grade = StudentClass.objects.create(name="Grade 1A")
+
+    def invoice(self, student, term, fees=0, paid=0):
+        invoice = Invoice.objects.create(
+            student=student, session=self.session, term=term, class_for=self.grade
+        )
+        if fees:
+            InvoiceItem.objects.create(invoice=invoice, description="Tuition", amount=fees)
+        if paid:
+            Receipt.objects.create(invoice=invoice, amount_paid=paid)
+        return invoice
+
+    def test_new_invoice_carries_the_latest_invoice_not_the_alphabetical_last(self):
+        student = Student.objects.create(registration_number="R1", surname="A", firstname="B")
+        # Created last but sorts first by term name
+        self.invoice(student, self.second, fees=100)
+        latest = self.invoice(student, self.first, fees=700)
+        new = Invoice.objects.create(
+            student=student,
+            session=AcademicSession.objects.create(name="2031-2032"),
+            term=self.first,
+            class_for=self.grade,
+        )
+        new.refresh_from_db()
+        latest.refresh_from_db()
+        self.assertEqual(new.balance_from_previous_term, 800)
+        self.assertEqual(latest.status, "closed")
+
+    def test_rollover_closes_and_carries_and_is_idempotent(self):
+        owing, settled, late = (
+            Student.objects.create(registration_number=f"R{i}", surname="A", firstname="B")
+            for i in range(3)
+        )
+        self.invoice(owing, self.first, fees=1000, paid=400)
+        self.invoice(settled, self.first, fees=500, paid=500)
+        self.invoice(late, self.first, fees=300)
+        # Invoiced for the next term before the first term's receipts were in
+        next_owing = self.invoice(owing, self.second)
+        Invoice.objects.filter(pk=next_owing.pk).update(balance_from_previous_term=1000)
+        Invoice.objects.filter(term=self.first).update(status="active")
+
+        preview = rollover_term(self.session, self.first, self.session, self.second, dry_run=True)
+        self.assertEqual(tuple(preview), (3, 3, 900, 1, 2))
+        self.assertEqual(Invoice.objects.filter(status="active").count(), 4)
+
+        with self.assertNumQueries(7):
+            result = rollover_term(self.session, self.first, self.session, self.second)
+        self.assertEqual(result, preview)
+        next_owing.refresh_from_db()
+        self.assertEqual(next_owing.balance, 600)
+        self.assertFalse(Invoice.objects.filter(term=self.first, status="active").exists())
+
+        again = rollover_term(self.session, self.first, self.session, self.second)
+        self.assertEqual((again.closed, again.updated), (0, 0))
+        next_owing.refresh_from_db()
+        self.assertEqual(next_owing.balance, 600)
+
+
+@override_settings(INVOICE_IMPORT_RUNNER="worker", INVOICE_IMPORT_CHUNK_SIZE=2)
+class InvoiceImportTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.session = AcademicSession.objects.create(name="2030-2031")
+        cls.term = AcademicTerm.objects.create(name="First Term")
+        grade = StudentClass.objects.create(name="Grade 1A")
+        StudentClass.objects.create(name="Grade 2A")
+        for reg in ("IMP1", "IMP2"):
+            Student.objects.create(
+                registration_number=reg, surname="Phiri", firstname="Ada", current_class=grade
+            )
+        cls.user = User.objects.create_user("bursar", password="pw")
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        settings = override_settings(MEDIA_ROOT=media)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.client.force_login(self.user)
+
+    def upload(self, name, content):
+        response = self.client.post(
+            reverse("invoice-import"),
+            {
+                "file": SimpleUploadedFile(name, content),
+                "session": self.session.pk,
+                "term": self.term.pk,
+            },
+        )
+        job = InvoiceImport.objects.latest("pk")
+        self.assertRedirects(response, job.get_absolute_url())
+        call_command("process_invoice_imports", stdout=StringIO())
+        job.refresh_from_db()
+        return job
+
+    def test_csv_import_reports_errors_and_upserts_on_reimport(self):
+        job = self.upload(
+            "fees.csv",
+            b"Reg No,Description,Amount,Class\n"
+            b"IMP1,Tuition,1000,\n"
+            b"IMP1,Levy,200,\n"
+            b"IMP2,Tuition,\"1,500\",Grade 2A\n"
+            b"NOPE,Tuition,1000,\n"
+            b"IMP2,Levy,lots,\n",
+        )
+        self.assertEqual(job.status, "done")
+        self.assertEqual((job.total_rows, job.processed_rows, job.error_rows), (5, 5, 2))
+        self.assertEqual((job.created_invoices, job.created_items), (2, 3))
+        report = self.client.get(reverse("invoice-import-errors", args=[job.pk]))
+        body = b"".join(report.streaming_content).decode()
+        self.assertIn("5,NOPE,Tuition,1000,Unknown registration number 'NOPE'", body)
+        self.assertIn("6,IMP2,Levy,lots,", body)
+
+        second = Invoice.objects.get(student__registration_number="IMP2")
+        self.assertEqual(second.class_for.name, "Grade 2A")
+        self.assertEqual((second.amount_payable, second.balance), (1500, 1500))
+
+        job = self.upload("fees.csv", b"reg,item,amount\nIMP2,tuition,1800\n")
+        self.assertEqual((job.created_invoices, job.created_items, job.updated_items), (0, 0, 1))
+        self.assertFalse(job.error_report)
+        second.refresh_from_db()
+        self.assertEqual(second.amount_payable, 1800)
+        self.assertEqual(Invoice.objects.count(), 2)
+
+        progress = self.client.get(reverse("invoice-import-progress", args=[job.pk]))
+        self.assertEqual(progress.json()["percent"], 100)
+
+    def test_xlsx_import_and_missing_columns(self):
+        from openpyxl import Workbook
+
+        workbook = Workbook()
+        workbook.active.append(["registration_number", "description", "amount"])
+        workbook.active.append(["IMP1", "Tuition", 1200])
+        content = BytesIO()
+        workbook.save(content)
+        job = self.upload("fees.xlsx", content.getvalue())
+        self.assertEqual((job.status, job.created_items), ("done", 1))
+        invoice = Invoice.objects.get(student__registration_number="IMP1")
+        self.assertEqual(invoice.amount_payable, 1200)
+
+        job = self.upload("bad.csv", b"reg,amount\nIMP1,10\n")
+        self.assertEqual(job.status, "failed")
+        self.assertIn("description", job.message)
+
+    def test_worker_restarts_imports_a_stopped_runner_left(self):
+        audit_log.flush()
+        job = InvoiceImport.objects.create(
+            file=SimpleUploadedFile("fees.csv", b"reg,item,amount\nIMP1,Tuition,900\n"),
+            session=self.session,
+            term=self.term,
+            status="running",
+            started_at=timezone.now() - timedelta(hours=2),
+            heartbeat_at=timezone.now() - timedelta(minutes=5),
+            processed_rows=1,
+        )
+        # Still making progress: left alone
+        self.assertEqual(imports.requeue_stale_imports(), 0)
+        InvoiceImport.objects.filter(pk=job.pk).update(
+            heartbeat_at=timezone.now() - timedelta(hours=1)
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("process_invoice_imports", stdout=StringIO())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed_rows, job.created_items), ("done", 1, 1))
+        audit_log.flush()
+        invoice = Invoice.objects.get(student__registration_number="IMP1")
+        self.assertTrue(
+            AuditLog.objects.filter(
+                model="finance.Invoice", action="create", object_id=str(invoice.pk)
+            ).exists()
+        )
+
+    def test_runner_stops_once_its_import_is_restarted(self):
+        job = InvoiceImport.objects.create(
+            file=SimpleUploadedFile("fees.csv", b"reg,item,amount\nIMP1,Tuition,900\n"),
+            session=self.session,
+            term=self.term,
+        )
+        iter_records = imports.iter_records
+
+        def restarted_meanwhile(rows):
+            InvoiceImport.objects.filter(pk=job.pk).update(
+                status="pending", started_at=None, heartbeat_at=None
+            )
+            return iter_records(rows)
+
+        with mock.patch.object(imports, "iter_records", restarted_meanwhile):
+            imports.run_import(job.pk)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed_rows, job.finished_at), ("pending", 0, None))
+        self.assertFalse(InvoiceItem.objects.exists())
+
+
+class BankReconciliationTest(TestCase):
+    STATEMENT = (
+        b"Date,Reference,Description,Amount\n"
+        b"01/02/2031,TX1,School fees REC1,400\n"
+        b"2031-02-01,TX2,Fees for INV-{invoice},600\n"
+        b"2031-02-02,TX3,Unknown payer,250\n"
+        b"2031-02-02,TX4,REC1 too much,5000\n"
+    )
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        settings = override_settings(MEDIA_ROOT=media)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.client.force_login(User.objects.create_user("bursar", password="pw"))
+        self.first = make_invoice("REC1")
+        self.second = make_invoice("REC2")
+        for invoice in (self.first, self.second):
+            InvoiceItem.objects.create(invoice=invoice, description="Tuition", amount=1000)
+
+    def upload(self):
+        content = self.STATEMENT.replace(b"{invoice}", str(self.second.pk).encode())
+        response = self.client.post(
+            reverse("statement-list"), {"file": SimpleUploadedFile("bank.csv", content)}
+        )
+        statement = BankStatement.objects.latest("pk")
+        self.assertRedirects(response, statement.get_absolute_url())
+        return statement
+
+    def test_match_confirm_and_review(self):
+        statement = self.upload()
+        lines = dict(statement.lines.values_list("reference", "status"))
+        self.assertEqual(
+            lines,
+            {"TX1": "matched", "TX2": "matched", "TX3": "unmatched", "TX4": "unmatched"},
+        )
+        self.assertEqual(statement.lines.get(reference="TX2").invoice, self.second)
+
+        # The same payments on a second statement are not matched again
+        again = self.upload()
+        self.assertEqual(again.lines.filter(status="duplicate").count(), 2)
+
+        self.client.post(reverse("statement-confirm", args=[statement.pk]))
+        self.first.refresh_from_db()
+        self.second.refresh_from_db()
+        self.assertEqual((self.first.amount_paid, self.second.amount_paid), (400, 600))
+        self.assertEqual(ledger.current_balance(self.first.student), 600)
+        self.assertEqual(Receipt.objects.get(invoice=self.first).date_paid.day, 1)
+        self.assertEqual(statement.lines.filter(status="confirmed").count(), 2)
+
+        review = self.client.get(reverse("statement-review"))
+        self.assertEqual(len(review.context["page_obj"]), 4)
+        unknown = statement.lines.get(reference="TX3")
+        self.client.post(
+            reverse("statement-review"),
+            {"line": unknown.pk, "action": "assign", "invoice": "rec2"},
+        )
+        self.second.refresh_from_db()
+        self.assertEqual(self.second.amount_paid, 850)
+        too_much = statement.lines.get(reference="TX4")
+        self.client.post(reverse("statement-review"), {"line": too_much.pk, "action": "ignore"})
+        self.assertEqual(StatementLine.objects.filter(status="unmatched").count(), 2)
+        self.assertEqual(Receipt.objects.count(), 3)
+
+        response = self.client.get(reverse("statement-list"))
+        self.assertEqual(response.context["review_count"], 2)
+
+        for data in ({"action": "ignore"}, {"line": "abc", "action": "ignore"}):
+            response = self.client.post(reverse("statement-review"), data)
+            self.assertEqual(response.status_code, 404)
+
+    def test_repeated_generic_references_are_separate_payments(self):
+        self.STATEMENT = (
+            b"Date,Reference,Description,Amount\n"
+            b"2031-02-03,CASH DEPOSIT,REC1,100\n"
+            b"2031-02-03,CASH DEPOSIT,REC1,100\n"
+            b"2031-02-03,CASH DEPOSIT,REC2,100\n"
+        )
+        statement = self.upload()
+        self.assertEqual(statement.lines.filter(status="matched").count(), 3)
+        self.assertEqual(self.upload().lines.filter(status="duplicate").count(), 3)
+
+    def test_unconfirmed_matches_count_as_paid(self):
+        self.STATEMENT = b"Date,Reference,Description,Amount\n2031-02-03,TX1,REC1,1000\n"
+        first = self.upload()
+        self.STATEMENT = b"Date,Reference,Description,Amount\n2031-02-04,TX9,REC1,1000\n"
+        second = self.upload()
+        self.assertEqual(first.lines.get().status, "matched")
+        self.assertEqual(second.lines.get().note, "Pays 1000 but 0 is owed")
+
+        # Even when matched anyway, confirming checks what is still owed
+        second.lines.update(status="matched", invoice=self.first)
+        self.client.post(reverse("statement-confirm", args=[first.pk]))
+        self.client.post(reverse("statement-confirm", args=[second.pk]))
+        self.assertEqual(Receipt.objects.filter(invoice=self.first).count(), 1)
+        line = second.lines.get()
+        self.assertEqual((line.status, line.note), ("unmatched", "Pays 1000 but 0 is owed"))
+
+
+@override_settings(FINANCE_DOCUMENT_CACHE="default")
+class InvoiceDocumentsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("bursar", password="pw")
+        for reg in ("DOC1", "DOC2", "DOC3"):
+            invoice = make_invoice(reg)
+            InvoiceItem.objects.create(invoice=invoice, description="Tuition", amount=1000)
+            Receipt.objects.create(invoice=invoice, amount_paid=300, comment="Cash")
+        cls.invoice = invoice
+
+    def setUp(self):
+        caches["default"].clear()
+        self.client.force_login(self.user)
+
+    def test_zip_of_a_class(self):
+        response = self.client.get(
+            reverse("invoice-documents"),
+            {
+                "kind": "receipt",
+                "session": self.invoice.session.pk,
+                "term": self.invoice.term.pk,
+                "student_class": self.invoice.class_for.pk,
+            },
+        )
+        self.assertTrue(response.streaming)
+        archive = zipfile.ZipFile(BytesIO(b"".join(response.streaming_content)))
+        names = archive.namelist()
+        self.assertEqual(len(names), 3)
+        self.assertTrue(names[0].startswith("grade-1a/doc1-receipt-"))
+        self.assertIn(b"Balance after this payment", archive.read(names[0]))
+
+        response = self.client.get(reverse("invoice-print", args=[self.invoice.pk]))
+        self.assertContains(response, f"Invoice #{self.invoice.pk}")
+
+    def test_unchanged_documents_come_from_the_cache(self):
+        def render(**options):
+            with documents.DocumentRenderer(**options) as renderer:
+                for batch in documents.iter_documents("invoice", Invoice.objects.all()):
+                    html = renderer.render(batch)
+            return renderer, html
+
+        renderer, html = render(workers=1)
+        self.assertEqual((renderer.rendered, renderer.cached), (3, 0))
+        InvoiceItem.objects.filter(invoice=self.invoice).update(amount=1200)
+        renderer, _ = render(workers=1)
+        self.assertEqual((renderer.rendered, renderer.cached), (1, 2))
+
+        # A process pool renders the same documents
+        caches["default"].clear()
+        renderer, parallel = render(workers=2, min_parallel=2)
+        self.assertIsNotNone(renderer.pool)
+        self.assertEqual(len(parallel), 3)
+        self.assertEqual(parallel[:2], html[:2])
+
+
+class DailyCollectionTest(TestCase):
+    def summary(self):
+        return list(
+            DailyCollection.objects.order_by("date", "student_class").values_list(
+                "date", "student_class__name", "amount", "receipt_count"
+            )
+        )
+
+    def assertMatchesRebuild(self, expected):
+        self.assertEqual(self.summary(), expected)
+        call_command("rebuild_daily_collections", stdout=StringIO())
+        self.assertEqual(self.summary(), expected)
+
+    def test_summary_follows_receipt_changes(self):
+        today = timezone.localdate()
+        yesterday = today - timedelta(days=1)
+        invoice = make_invoice("COL1")
+        other = make_invoice("COL2")
+        first = Receipt.objects.create(invoice=invoice, amount_paid=500)
+        Receipt.objects.create(invoice=other, amount_paid=200, date_paid=yesterday)
+        create_receipts(
+            [Receipt(invoice=invoice, amount_paid=100), Receipt(invoice=other, amount_paid=50)]
+        )
+        self.assertMatchesRebuild(
+            [(yesterday, "Grade 1A", 200, 1), (today, "Grade 1A", 650, 3)]
+        )
+
+        first = Receipt.objects.get(pk=first.pk)
+        first.amount_paid, first.date_paid = 400, yesterday
+        first.save()
+        self.assertMatchesRebuild(
+            [(yesterday, "Grade 1A", 600, 2), (today, "Grade 1A", 150, 2)]
+        )
+
+        other.class_for = StudentClass.objects.create(name="Grade 2A")
+        other.save()
+        self.assertMatchesRebuild(
+            [
+                (yesterday, "Grade 1A", 400, 1),
+                (yesterday, "Grade 2A", 200, 1),
+                (today, "Grade 1A", 100, 1),
+                (today, "Grade 2A", 50, 1),
+            ]
+        )
+
+        first.delete()
+        other.delete()
+        self.assertMatchesRebuild([(today, "Grade 1A", 100, 1)])
+
+        self.client.force_login(User.objects.create_user("bursar", password="pw"))
+        response = self.client.get(reverse("daily-collections"), {"days": 7})
+        self.assertEqual(response.context["total"], 100)
+        self.assertEqual(response.context["rows"][-1]["percent"], 100)
+
+
+def _allocate_in_process(path, session_id, rounds):
+    # A forked child gets a fresh connection to the scratch database instead
+    # of the parent's in-memory one and its open transaction
+    settings_dict = {**connections["default"].settings_dict, "NAME": path}
+    connections["default"] = connections["default"].__class__(settings_dict, "default")
+    numbers = []
+    for n in range(rounds):
+        with transaction.atomic():
+            numbers += allocator.allocate(session_id, n % 3 + 1)
+    connections["default"].close()
+    return numbers
+
+
+@override_settings(RECEIPT_NUMBER_BLOCK_SIZE=5)
+class ReceiptNumberTest(TestCase):
+    def setUp(self):
+        allocator.clear()
+
+    def test_receipts_are_numbered_per_session(self):
+        audit_log.flush()
+        invoice = make_invoice("NUM1")
+        with self.captureOnCommitCallbacks(execute=True):
+            first = Receipt.objects.create(invoice=invoice, amount_paid=100)
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk = create_receipts(
+                [Receipt(invoice=invoice, amount_paid=10), Receipt(invoice=invoice, amount_paid=20)]
+            )
+        self.assertEqual([first.number] + [r.number for r in bulk], [1, 2, 3])
+        # Bulk receipts are audited like saved ones
+        audit_log.flush()
+        self.assertEqual(
+            set(AuditLog.objects.filter(model="finance.Receipt").values_list("object_repr", flat=True)),
+            {str(receipt) for receipt in [first, *bulk]},
+        )
+        self.assertEqual(first.session, invoice.session)
+        first.amount_paid = 150
+        first.save()
+        self.assertEqual(Receipt.objects.get(pk=first.pk).number, 1)
+
+        # A reservation rolled back with its transaction is reserved again
+        with self.assertRaises(ValueError), transaction.atomic():
+            allocator.clear()
+            allocator.allocate(invoice.session_id, 1)
+            raise ValueError
+        self.assertEqual(allocator.allocate(invoice.session_id, 2), [6, 7])
+
+        other = make_invoice("NUM2")
+        other.session = AcademicSession.objects.create(name="2031-2032")
+        other.save()
+        self.assertEqual(Receipt.objects.create(invoice=other, amount_paid=5).number, 1)
+
+    @override_settings(RECEIPT_NUMBER_DATABASE="receipt_numbers")
+    def test_blocks_from_their_own_connection(self):
+        invoice = make_invoice("NUM3")
+        reserve = allocator.reserve
+
+        def reserve_on(session_id, size, using="default"):
+            if using == "receipt_numbers":
+                # As if committed straight away on a connection of its own
+                return reserve(session_id, size)
+            return reserve(session_id, size, using)
+
+        with mock.patch.object(allocator, "reserve", side_effect=reserve_on) as reserved:
+            with self.captureOnCommitCallbacks() as callbacks:
+                self.assertEqual(allocator.allocate(invoice.session_id, 2), [1, 2])
+            # The rest of the block is kept without waiting for a commit
+            self.assertEqual(callbacks, [])
+            self.assertEqual(allocator.allocate(invoice.session_id, 1), [3])
+            self.assertEqual(reserved.call_count, 1)
+
+            # A session the other connection can't see yet falls back to ours
+            allocator.clear()
+            reserved.side_effect = [IntegrityError, 5]
+            with self.captureOnCommitCallbacks() as callbacks:
+                self.assertEqual(allocator.allocate(invoice.session_id, 1), [5])
+            self.assertEqual(reserved.call_args_list[-1], mock.call(invoice.session_id, 5))
+            self.assertEqual(len(callbacks), 1)
+
+    @unittest.skipUnless(connection.vendor == "sqlite", "needs a database file")
+    def test_processes_never_share_a_number(self):
+        session = AcademicSession.objects.create(name="2040-2041")
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        path = os.path.join(tmp, "numbers.sqlite3")
+        # The workers share a database file holding just the tables they need
+        editor = connection.schema_editor(collect_sql=True)
+        with sqlite3.connect(path) as scratch:
+            for model in (AcademicSession, ReceiptSequence):
+                scratch.execute(editor.table_sql(model)[0])
+            scratch.execute(
+                "INSERT INTO corecode_academicsession (id, name, current) VALUES (?, ?, 0)",
+                (session.pk, session.name),
+            )
+        scratch.close()
+
+        # Numbers this process holds must not be inherited by forked workers
+        with self.captureOnCommitCallbacks(execute=True):
+            allocator.allocate(session.pk)
+
+        workers = 4
+        with multiprocessing.get_context("fork").Pool(workers) as pool:
+            results = pool.starmap(
+                _allocate_in_process, [(path, session.pk, 30)] * workers
+            )
+        numbers = [number for result in results for number in result]
+        self.assertEqual(len(numbers), workers * 60)
+        self.assertEqual(len(set(numbers)), len(numbers))
+        # Gaps are only the unused ends of blocks
+        self.assertLess(max(numbers), len(numbers) + workers * 5)
+
+
+@override_settings(PAYMENT_WEBHOOK_SECRETS={"simulator": "s3cret"})
+class PaymentWebhookTest(TestCase):
+    def notify(self, secret="s3cret", **fields):
+        body = json.dumps(
+            {"reference": "TX1", "account": "PAY1", "amount": 400, "paid_at": "2031-01-05T10:00:00", **fields}
+        ).encode()
+        return self.client.post(
+            reverse("payment-webhook", args=["simulator"]),
+            body,
+            content_type="application/json",
+            headers={"X-Signature": payments.signature(secret, body)},
+        )
+
+    def test_resent_notifications_are_receipted_once(self):
+        invoice = make_invoice("PAY1")
+        InvoiceItem.objects.create(invoice=invoice, description="Tuition", amount=1000)
+        for _ in range(3):
+            self.assertEqual(self.notify().status_code, 200)
+        self.notify(reference="TX2", account=f"INV-{invoice.pk}", amount=100)
+        self.notify(reference="TX3", account="NOBODY")
+        self.assertEqual(PaymentNotification.objects.count(), 3)
+
+        self.assertEqual(payments.drain_all(), {"receipted": 2, "unmatched": 1})
+        self.assertEqual(payments.drain_all(), {})
+        self.notify()
+        self.assertEqual(payments.drain_all(), {})
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.amount_paid, 500)
+        receipt = PaymentNotification.objects.get(reference="TX1").receipt
+        self.assertEqual((receipt.amount_paid, str(receipt.date_paid)), (400, "2031-01-05"))
+
+    def test_invalid_notifications_are_rejected(self):
+        self.assertEqual(self.notify(secret="wrong").status_code, 400)
+        self.assertEqual(self.notify(amount="400").status_code, 400)
+        self.assertEqual(self.notify(reference="").status_code, 400)
+        self.assertEqual(self.notify(paid_at="2024-02-30T10:00:00").status_code, 400)
+        response = self.client.post(reverse("payment-webhook", args=["unknown"]), b"{}", content_type="application/json")
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(PaymentNotification.objects.exists())
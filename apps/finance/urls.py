@@ -1,6 +1,12 @@
 from django.urls import path
 
 from .views import (
+    BankStatementDetailView,
+    FeeStructureCreateView,
+    FeeStructureDeleteView,
+    FeeStructureListView,
+    FeeStructureUpdateView,
+    InvoiceImportDetailView,
     InvoiceCreateView,
     InvoiceDeleteView,
     InvoiceDetailView,
@@ -9,12 +15,25 @@ from .views import (
     ReceiptCreateView,
     ReceiptUpdateView,
     bulk_invoice,
+    daily_collections,
+    finance_report,
+    invoice_documents,
+    invoice_import,
+    invoice_import_errors,
+    invoice_import_progress,
+    invoice_print,
+    payment_webhook,
+    statement_confirm,
+    statement_list,
+    statement_review,
+    term_rollover,
 )
 
 urlpatterns = [
     path("list/", InvoiceListView.as_view(), name="invoice-list"),
     path("create/", InvoiceCreateView.as_view(), name="invoice-create"),
     path("<int:pk>/detail/", InvoiceDetailView.as_view(), name="invoice-detail"),
+    path("<int:pk>/print/", invoice_print, name="invoice-print"),
     path("<int:pk>/update/", InvoiceUpdateView.as_view(), name="invoice-update"),
     path("<int:pk>/delete/", InvoiceDeleteView.as_view(), name="invoice-delete"),
     path("receipt/create", ReceiptCreateView.as_view(), name="receipt-create"),
@@ -22,4 +41,44 @@ urlpatterns = [
         "receipt/<int:pk>/update/", ReceiptUpdateView.as_view(), name="receipt-update"
     ),
     path("bulk-invoice/", bulk_invoice, name="bulk-invoice"),
+    path("documents/", invoice_documents, name="invoice-documents"),
+    path("statements/", statement_list, name="statement-list"),
+    path("statements/review/", statement_review, name="statement-review"),
+    path(
+        "statements/<int:pk>/", BankStatementDetailView.as_view(), name="statement-detail"
+    ),
+    path("statements/<int:pk>/confirm/", statement_confirm, name="statement-confirm"),
+    path("payments/<slug:provider>/", payment_webhook, name="payment-webhook"),
+    path("reports/", finance_report, name="finance-reports"),
+    path("reports/daily/", daily_collections, name="daily-collections"),
+    path("reports/<slug:report>/", finance_report, name="finance-report"),
+    path("rollover/", term_rollover, name="term-rollover"),
+    path("import/", invoice_import, name="invoice-import"),
+    path(
+        "import/<int:pk>/", InvoiceImportDetailView.as_view(), name="invoice-import-detail"
+    ),
+    path(
+        "import/<int:pk>/progress/",
+        invoice_import_progress,
+        name="invoice-import-progress",
+    ),
+    path(
+        "import/<int:pk>/errors/", invoice_import_errors, name="invoice-import-errors"
+    ),
+    path("fee-structures/", FeeStructureListView.as_view(), name="fee-structure-list"),
+    path(
+        "fee-structures/create/",
+        FeeStructureCreateView.as_view(),
+        name="fee-structure-create",
+    ),
+    path(
+        "fee-structures/<int:pk>/update/",
+        FeeStructureUpdateView.as_view(),
+        name="fee-structure-update",
+    ),
+    path(
+        "fee-structures/<int:pk>/delete/",
+        FeeStructureDeleteView.as_view(),
+        name="fee-structure-delete",
+    ),
 ]
@@ -1,18 +1,75 @@
+from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.shortcuts import redirect, render
-from django.urls import reverse_lazy
+from django.core.paginator import Paginator
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.shortcuts import get_object_or_404, redirect, render
+from django.urls import reverse, reverse_lazy
+from django.utils.text import slugify
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 from django.views.generic import DetailView, ListView
 from django.views.generic.edit import CreateView, DeleteView, UpdateView
 
 from apps.students.models import Student
 
-from .forms import InvoiceItemFormset, InvoiceReceiptFormSet, Invoices
-from .models import Invoice, InvoiceItem, Receipt
+from . import documents, payments, reconcile, reports, summaries
+from .forms import (
+    BankStatementForm,
+    BulkInvoiceForm,
+    DocumentBatchForm,
+    FeeStructureItemFormset,
+    InvoiceFilterForm,
+    InvoiceImportForm,
+    InvoiceItemFormset,
+    InvoiceReceiptFormSet,
+    Invoices,
+    ReportFilterForm,
+    TermRolloverForm,
+)
+from .imports import ImportFormatError, start_import
+from .models import (
+    BankStatement,
+    FeeStructure,
+    Invoice,
+    InvoiceImport,
+    InvoiceItem,
+    Receipt,
+    StatementLine,
+)
+from .services import generate_invoices, rollover_term
 
 
 class InvoiceListView(LoginRequiredMixin, ListView):
     model = Invoice
+    paginate_by = 50
+
+    def get_queryset(self):
+        self.filter_form = InvoiceFilterForm(self.request.GET or None)
+        queryset = self.filter_form.filter(super().get_queryset())
+        self.totals = queryset.aggregate(
+            payable=Sum(F("balance_from_previous_term") + F("amount_payable")),
+            paid=Sum("amount_paid"),
+            balance=Sum("balance"),
+        )
+        # Totals are stored columns, so each page is a single query
+        return queryset.select_related(
+            "student", "session", "term", "class_for"
+        ).order_by("-pk")
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["filter_form"] = self.filter_form
+        context["totals"] = self.totals
+        return context
 
 
 class InvoiceCreateView(LoginRequiredMixin, CreateView):
@@ -33,12 +90,13 @@ class InvoiceCreateView(LoginRequiredMixin, CreateView):
     def form_valid(self, form):
         context = self.get_context_data()
         formset = context["items"]
-        self.object = form.save()
-        if self.object.id != None:
-            if form.is_valid() and formset.is_valid():
-                formset.instance = self.object
-                formset.save()
-        return super().form_valid(form)
+        with transaction.atomic():
+            self.object = form.save()
+            if self.object.id != None:
+                if form.is_valid() and formset.is_valid():
+                    formset.instance = self.object
+                    formset.save()
+            return super().form_valid(form)
 
 
 class InvoiceDetailView(LoginRequiredMixin, DetailView):
@@ -52,9 +110,43 @@ class InvoiceDetailView(LoginRequiredMixin, DetailView):
         return context
 
 
+@login_required
+def invoice_print(request, pk):
+    get_object_or_404(Invoice, pk=pk)
+    return HttpResponse(documents.render_invoice(pk))
+
+
+@login_required
+def invoice_documents(request):
+    """Printable invoices or receipts of a class or the whole school, as a zip."""
+    form = DocumentBatchForm(request.GET or None)
+    if form.is_valid():
+        data = form.cleaned_data
+        invoices = Invoice.objects.filter(session=data["session"], term=data["term"])
+        if data["student_class"]:
+            invoices = invoices.filter(class_for=data["student_class"])
+        name = slugify(
+            f"{data['kind']}s {data['session']} {data['term']} "
+            f"{data['student_class'] or 'all classes'}"
+        )
+        response = StreamingHttpResponse(
+            documents.stream_zip(data["kind"], invoices), content_type="application/zip"
+        )
+        response["Content-Disposition"] = f'attachment; filename="{name}.zip"'
+        return response
+    return render(request, "finance/invoice_documents.html", {"form": form})
+
+
 class InvoiceUpdateView(LoginRequiredMixin, UpdateView):
     model = Invoice
-    fields = ["student", "session", "term", "class_for", "balance_from_previous_term"]
+    fields = [
+        "student",
+        "session",
+        "term",
+        "class_for",
+        "balance_from_previous_term",
+        "issued_on",
+    ]
 
     def get_context_data(self, **kwargs):
         context = super(InvoiceUpdateView, self).get_context_data(**kwargs)
@@ -74,11 +166,12 @@ class InvoiceUpdateView(LoginRequiredMixin, UpdateView):
         context = self.get_context_data()
         formset = context["receipts"]
         itemsformset = context["items"]
-        if form.is_valid() and formset.is_valid() and itemsformset.is_valid():
-            form.save()
-            formset.save()
-            itemsformset.save()
-        return super().form_valid(form)
+        with transaction.atomic():
+            if form.is_valid() and formset.is_valid() and itemsformset.is_valid():
+                form.save()
+                formset.save()
+                itemsformset.save()
+            return super().form_valid(form)
 
 
 class InvoiceDeleteView(LoginRequiredMixin, DeleteView):
@@ -118,4 +211,354 @@ class ReceiptDeleteView(LoginRequiredMixin, DeleteView):
 
 @login_required
 def bulk_invoice(request):
-    return render(request, "finance/bulk_invoice.html")
+    """Invoice whole classes from their fee structures."""
+    result = None
+    if request.method == "POST":
+        form = BulkInvoiceForm(request.POST)
+        if form.is_valid():
+            data = form.cleaned_data
+            result = generate_invoices(
+                data["session"],
+                data["term"],
+                list(data["classes"]),
+                dry_run=data["dry_run"],
+            )
+            if not data["dry_run"]:
+                messages.success(
+                    request,
+                    f"Created {result.invoices} invoices "
+                    f"({result.skipped} students were already invoiced).",
+                )
+                return redirect(
+                    f"{reverse('invoice-list')}?session={data['session'].pk}"
+                    f"&term={data['term'].pk}"
+                )
+    else:
+        form = BulkInvoiceForm(
+            initial={
+                "session": request.current_session,
+                "term": request.current_term,
+            }
+        )
+    return render(request, "finance/bulk_invoice.html", {"form": form, "result": result})
+
+
+@login_required
+def term_rollover(request):
+    """Close a term's invoices and carry the balances to the next term."""
+    result = None
+    if request.method == "POST":
+        form = TermRolloverForm(request.POST)
+        if form.is_valid():
+            data = form.cleaned_data
+            result = rollover_term(
+                data["session"],
+                data["term"],
+                data["next_session"],
+                data["next_term"],
+                dry_run=data["dry_run"],
+            )
+            if not data["dry_run"]:
+                messages.success(
+                    request,
+                    f"Closed {result.closed} invoices and updated "
+                    f"{result.updated} carried balances.",
+                )
+                return redirect(
+                    f"{reverse('invoice-list')}?session={data['next_session'].pk}"
+                    f"&term={data['next_term'].pk}"
+                )
+    else:
+        form = TermRolloverForm(
+            initial={
+                "session": request.current_session,
+                "term": request.current_term,
+            }
+        )
+    return render(request, "finance/term_rollover.html", {"form": form, "result": result})
+
+
+class FeeStructureListView(LoginRequiredMixin, ListView):
+    model = FeeStructure
+
+    def get_queryset(self):
+        return (
+            super()
+            .get_queryset()
+            .select_related("student_class", "session", "term")
+            .annotate(total=Sum("items__amount"))
+        )
+
+
+class FeeStructureMixin:
+    model = FeeStructure
+    fields = ["student_class", "session", "term"]
+    success_url = reverse_lazy("fee-structure-list")
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        if "items" not in context:
+            context["items"] = FeeStructureItemFormset(
+                self.request.POST or None, instance=self.object
+            )
+        return context
+
+    def form_valid(self, form):
+        items = FeeStructureItemFormset(
+            self.request.POST, instance=form.instance
+        )
+        if not items.is_valid():
+            return self.render_to_response(
+                self.get_context_data(form=form, items=items)
+            )
+        with transaction.atomic():
+            self.object = form.save()
+            items.instance = self.object
+            items.save()
+        return redirect(self.success_url)
+
+
+class FeeStructureCreateView(LoginRequiredMixin, FeeStructureMixin, CreateView):
+    pass
+
+
+class FeeStructureUpdateView(LoginRequiredMixin, FeeStructureMixin, UpdateView):
+    pass
+
+
+class FeeStructureDeleteView(LoginRequiredMixin, DeleteView):
+    model = FeeStructure
+    success_url = reverse_lazy("fee-structure-list")
+
+
+@login_required
+def invoice_import(request):
+    """Upload a CSV/XLSX of invoice lines; the import runs in the background."""
+    if request.method == "POST":
+        form = InvoiceImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            job = form.save(commit=False)
+            job.uploaded_by = request.user
+            job.save()
+            start_import(job)
+            return redirect(job)
+    else:
+        form = InvoiceImportForm(
+            initial={"session": request.current_session, "term": request.current_term}
+        )
+    imports = InvoiceImport.objects.select_related("session", "term", "uploaded_by")[:20]
+    return render(
+        request, "finance/invoice_import.html", {"form": form, "imports": imports}
+    )
+
+
+class InvoiceImportDetailView(LoginRequiredMixin, DetailView):
+    model = InvoiceImport
+
+
+@login_required
+def invoice_import_progress(request, pk):
+    job = get_object_or_404(InvoiceImport, pk=pk)
+    return JsonResponse(
+        {
+            "status": job.status,
+            "status_display": job.get_status_display(),
+            "percent": job.percent,
+            "total_rows": job.total_rows,
+            "processed_rows": job.processed_rows,
+            "error_rows": job.error_rows,
+            "created_invoices": job.created_invoices,
+            "created_items": job.created_items,
+            "updated_items": job.updated_items,
+            "message": job.message,
+            "error_report": bool(job.error_report),
+        }
+    )
+
+
+@login_required
+def invoice_import_errors(request, pk):
+    job = get_object_or_404(InvoiceImport, pk=pk)
+    if not job.error_report:
+        raise Http404
+    return FileResponse(
+        job.error_report.open("rb"),
+        as_attachment=True,
+        filename=f"invoice-import-{job.pk}-errors.csv",
+    )
+
+
+@login_required
+def finance_report(request, report="outstanding"):
+    """One of ``reports.REPORTS`` as a table, or as CSV with ``?format=csv``."""
+    if report not in reports.REPORTS:
+        raise Http404
+    spec = reports.REPORTS[report]
+    form = ReportFilterForm(request.GET or None)
+    filters = form.cleaned_data if form.is_valid() else {}
+    rows = reports.run(report, **{key: value for key, value in filters.items() if value})
+    if request.GET.get("format") == "csv":
+        response = StreamingHttpResponse(
+            reports.stream_csv(spec.columns, rows), content_type="text/csv"
+        )
+        response["Content-Disposition"] = f'attachment; filename="{report}.csv"'
+        return response
+    return render(
+        request,
+        "finance/report.html",
+        {
+            "form": form,
+            "report": report,
+            "spec": spec,
+            "reports": reports.REPORTS,
+            "rows": [[row[key] for key, _ in spec.columns] for row in rows],
+        },
+    )
+
+
+@login_required
+def daily_collections(request):
+    """Collections per day, charted from the DailyCollection summary."""
+    form = ReportFilterForm(request.GET or None)
+    filters = form.cleaned_data if form.is_valid() else {}
+    try:
+        days = min(max(int(request.GET.get("days", 30)), 1), 366)
+    except ValueError:
+        days = 30
+    rows = summaries.daily_totals(
+        days,
+        session=filters.get("session"),
+        term=filters.get("term"),
+        student_class=filters.get("student_class"),
+    )
+    return render(
+        request,
+        "finance/daily_collections.html",
+        {
+            "form": form,
+            "days": days,
+            "rows": rows,
+            "total": sum(row["amount"] for row in rows),
+            "receipt_count": sum(row["receipt_count"] for row in rows),
+        },
+    )
+
+
+@login_required
+def statement_list(request):
+    """Upload a bank or mobile-money statement and match it to invoices."""
+    if request.method == "POST":
+        form = BankStatementForm(request.POST, request.FILES)
+        if form.is_valid():
+            try:
+                with transaction.atomic():
+                    statement = form.save(commit=False)
+                    statement.uploaded_by = request.user
+                    statement.save()
+                    counts = reconcile.match_statement(statement)
+            except ImportFormatError as exc:
+                form.add_error("file", str(exc))
+            else:
+                messages.success(
+                    request,
+                    f"{counts.get('matched', 0)} payments matched, "
+                    f"{counts.get('unmatched', 0)} need review.",
+                )
+                return redirect(statement)
+    else:
+        form = BankStatementForm()
+    statements = BankStatement.objects.select_related("uploaded_by").annotate(
+        line_count=Count("lines"),
+        matched=Count("lines", filter=Q(lines__status="matched")),
+        confirmed=Count("lines", filter=Q(lines__status="confirmed")),
+    )[:20]
+    return render(
+        request,
+        "finance/statement_list.html",
+        {
+            "form": form,
+            "statements": statements,
+            "review_count": StatementLine.objects.filter(status="unmatched").count(),
+        },
+    )
+
+
+class BankStatementDetailView(LoginRequiredMixin, DetailView):
+    model = BankStatement
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        lines = self.object.lines.select_related(
+            "invoice__student", "invoice__session", "invoice__term"
+        )
+        context["lines"] = lines
+        context["totals"] = {
+            row["status"]: row
+            for row in lines.order_by()
+            .values("status")
+            .annotate(count=Count("pk"), amount=Sum("amount"))
+        }
+        return context
+
+
+@login_required
+def statement_confirm(request, pk):
+    """Receipt every matched payment of a statement in one go."""
+    statement = get_object_or_404(BankStatement, pk=pk)
+    if request.method == "POST":
+        count = reconcile.confirm(statement.lines.all())
+        messages.success(request, f"Created {count} receipts.")
+    return redirect(statement)
+
+
+@login_required
+def statement_review(request):
+    """Payments no invoice was found for, to assign by hand or ignore."""
+    if request.method == "POST":
+        line_id = request.POST.get("line", "")
+        if not line_id.isdigit():
+            raise Http404
+        line = get_object_or_404(StatementLine, pk=line_id, status="unmatched")
+        if request.POST.get("action") == "ignore":
+            line.status, line.note = "ignored", f"Ignored by {request.user}"
+            line.save(update_fields=["status", "note"])
+        else:
+            invoice = reconcile.find_invoice(request.POST.get("invoice", ""))
+            if invoice is None or line.amount is None:
+                messages.error(request, "No open invoice with that number or reg. number.")
+            else:
+                line.invoice = invoice
+                line.status, line.note = "matched", f"Assigned by {request.user}"
+                line.save(update_fields=["invoice", "status", "note"])
+                if reconcile.confirm(StatementLine.objects.filter(pk=line.pk)):
+                    messages.success(request, f"Receipted {line.amount} to {invoice.student}.")
+                else:
+                    line.refresh_from_db(fields=["note"])
+                    messages.error(request, line.note)
+        return redirect(request.get_full_path())
+
+    lines = StatementLine.objects.filter(status="unmatched").select_related(
+        "statement", "invoice__student"
+    ).order_by("statement", "line_number")
+    page = Paginator(lines, 50).get_page(request.GET.get("page"))
+    return render(request, "finance/statement_review.html", {"page_obj": page})
+
+
+@csrf_exempt
+@require_POST
+def payment_webhook(request, provider):
+    """Accept a signed payment notification from a gateway into the inbox.
+
+    Receipting happens later in ``manage.py drain_payments``; a notification
+    already in the inbox is acknowledged again without being stored twice.
+    """
+    if payments.provider_secret(provider) is None:
+        raise Http404("Unknown payment provider")
+    try:
+        notification = payments.parse(
+            provider, request.body, request.headers.get(payments.SIGNATURE_HEADER)
+        )
+    except payments.InvalidNotification as exc:
+        return JsonResponse({"status": "rejected", "error": str(exc)}, status=400)
+    payments.receive(notification)
+    return JsonResponse({"status": "accepted", "reference": notification.reference})
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-18 21:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('corecode', '0009_auditlog'),
+        ('result', '0002_result_headteacher_comment_result_teacher_comment_and_more'),
+        ('students', '0004_guardians'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='result',
+            index=models.Index(fields=['session', 'term', 'current_class'], name='result_resu_session_a7c718_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.7 on 2026-10-18 21:26
+
+from django.db import migrations, models
+
+
+def remove_duplicates(apps, schema_editor):
+    # Keep one row per student, session, term and subject: the one with the
+    # highest marks, or the first created when they tie
+    Result = apps.get_model("result", "Result")
+    rows = (
+        Result.objects.annotate(total=models.F("test_score") + models.F("exam_score"))
+        .order_by("student", "session", "term", "subject", "-total", "pk")
+        .values_list("pk", "student_id", "session_id", "term_id", "subject_id")
+    )
+    duplicates, last = [], None
+    for pk, *key in rows.iterator(chunk_size=2000):
+        if key == last:
+            duplicates.append(pk)
+        last = key
+    for start in range(0, len(duplicates), 500):
+        Result.objects.filter(pk__in=duplicates[start : start + 500]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('corecode', '0009_auditlog'),
+        ('result', '0003_result_term_class_index'),
+        ('students', '0004_guardians'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='result',
+            constraint=models.UniqueConstraint(fields=('student', 'session', 'term', 'subject'), name='unique_result'),
+        ),
+    ]
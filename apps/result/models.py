@@ -25,6 +25,12 @@ class Result(models.Model):
 
     class Meta:
         ordering = ["subject"]
+        indexes = [models.Index(fields=["session", "term", "current_class"])]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["student", "session", "term", "subject"], name="unique_result"
+            )
+        ]
 
     def __str__(self):
         return f"{self.student} {self.session} {self.term} {self.subject}"
@@ -0,0 +1,75 @@
+from django.db import transaction
+from django.db.models import Max, Q
+
+from apps.corecode.audit import audit_log
+from apps.students.models import Student
+
+from .models import Result
+
+
+def selected_students(student_ids=(), class_ids=()):
+    """Hand-picked students plus every active student of the chosen classes."""
+    return Student.objects.filter(
+        Q(pk__in=student_ids) | Q(current_class__in=class_ids, current_status="active"),
+        current_class__isnull=False,
+    )
+
+
+def create_result_sheets(students, session, term, subjects, batch_size=1000):
+    """Add the missing result rows of ``students`` (a queryset) for ``subjects``.
+
+    The rows already there are found with one query and the rest inserted
+    in bulk; rows another user created meanwhile are skipped by the unique
+    constraint. Only the rows inserted here are audited and counted.
+    Returns how many rows were new.
+    """
+    subjects = list(subjects)
+    existing = set(
+        Result.objects.filter(
+            session=session, term=term, subject__in=subjects, student__in=students
+        )
+        .order_by()
+        .values_list("student_id", "subject_id")
+    )
+    # Loaded with what str() needs, so the audit entries cost no queries
+    students = students.only(
+        "current_class", "surname", "firstname", "other_name", "registration_number"
+    )
+    results = [
+        Result(
+            student=student,
+            session=session,
+            term=term,
+            current_class_id=student.current_class_id,
+            subject=subject,
+        )
+        for student in students
+        for subject in subjects
+        if (student.pk, subject.pk) not in existing
+    ]
+    if not results:
+        return 0
+    with transaction.atomic(savepoint=False):
+        before = Result.objects.aggregate(Max("pk"))["pk__max"] or 0
+        Result.objects.bulk_create(results, batch_size=batch_size, ignore_conflicts=True)
+        # ignore_conflicts leaves the new rows without their pk; rows another
+        # user inserted first were skipped and are neither counted nor audited
+        pks = {
+            (student_id, subject_id): pk
+            for pk, student_id, subject_id in Result.objects.filter(
+                pk__gt=before,
+                session=session,
+                term=term,
+                subject__in=subjects,
+                student__in=students,
+            )
+            .order_by()
+            .values_list("pk", "student_id", "subject_id")
+        }
+        created = []
+        for result in results:
+            result.pk = pks.get((result.student_id, result.subject_id))
+            if result.pk is not None:
+                created.append(result)
+        audit_log.record_many("create", created)
+    return len(created)
@@ -1,3 +1,162 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
 from django.test import TestCase
+from django.urls import reverse
+
+from apps.corecode.audit import audit_log
+from apps.corecode.models import AcademicSession, AcademicTerm, AuditLog, StudentClass, Subject
+from apps.students.models import Student
+
+from .models import Result
+from .services import create_result_sheets, selected_students
+from .views import ResultListView
+
+
+class ResultListViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("teacher", password="pw")
+        session = AcademicSession.objects.create(name="2030-2031", current=True)
+        term = AcademicTerm.objects.create(name="First Term", current=True)
+        subjects = [Subject.objects.create(name=name) for name in ("Listing A", "Listing B")]
+        cls.classes = [StudentClass.objects.create(name=name) for name in ("Grade 1", "Grade 2")]
+        # Per class, the totals are 100, 140 and 140: two students tie for first
+        for student_class in cls.classes:
+            for i, score in enumerate((20, 30, 30)):
+                student = Student.objects.create(
+                    registration_number=f"{student_class.name}-{i}",
+                    surname=f"S{i}",
+                    firstname="F",
+                    current_class=student_class,
+                )
+                for subject in subjects:
+                    Result.objects.create(
+                        student=student,
+                        session=session,
+                        term=term,
+                        current_class=student_class,
+                        subject=subject,
+                        test_score=score,
+                        exam_score=score + 10,
+                    )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_totals_and_class_positions(self):
+        response = self.client.get(reverse("view-results"))
+        rows = response.context["results"]
+        self.assertEqual(len(rows), 6)
+        first = [row for row in rows if row["current_class"] == self.classes[0].pk]
+        self.assertEqual([row["position"] for row in first], [1, 1, 3])
+        self.assertEqual(
+            [(row["test_total"], row["exam_total"], row["total_total"]) for row in first],
+            [(60, 80, 140), (60, 80, 140), (40, 60, 100)],
+        )
+        self.assertEqual([len(row["subjects"]) for row in first], [2, 2, 2])
+
+    @mock.patch.object(ResultListView, "paginate_by", 2)
+    def test_class_filter_keeps_positions_across_pages(self):
+        params = {"class": self.classes[1].pk}
+        first = self.client.get(reverse("view-results"), params).context["results"]
+        second = self.client.get(reverse("view-results"), {**params, "page": 2}).context["results"]
+        self.assertEqual([row["position"] for row in first], [1, 1])
+        self.assertEqual([row["position"] for row in second], [3])
+        self.assertTrue(
+            all(row["current_class"] == self.classes[1].pk for row in [*first, *second])
+        )
+
+    def test_unknown_class_is_not_found(self):
+        response = self.client.get(reverse("view-results"), {"class": self.classes[1].pk + 100})
+        self.assertEqual(response.status_code, 404)
+
+
+class CreateResultTest(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user("teacher", password="pw"))
+        self.session = AcademicSession.objects.create(name="2030-2031", current=True)
+        self.term = AcademicTerm.objects.create(name="First Term", current=True)
+        self.subjects = [Subject.objects.create(name=f"Sheet {i}") for i in range(3)]
+        self.class_a, self.class_b = (
+            StudentClass.objects.create(name=name) for name in ("Sheet A", "Sheet B")
+        )
+        self.students = [
+            Student.objects.create(
+                registration_number=f"CR{i}",
+                surname="S",
+                firstname="F",
+                current_class=self.class_a if i < 4 else self.class_b,
+            )
+            for i in range(6)
+        ]
+
+    def finish(self, students="", classes=""):
+        return self.client.post(
+            reverse("create-result"),
+            {
+                "finish": "True",
+                "students": students,
+                "classes": classes,
+                "session": self.session.pk,
+                "term": self.term.pk,
+                "subjects": [subject.pk for subject in self.subjects],
+            },
+        )
+
+    def test_whole_class_and_picked_students(self):
+        Result.objects.create(
+            student=self.students[0],
+            session=self.session,
+            term=self.term,
+            current_class=self.class_a,
+            subject=self.subjects[0],
+            test_score=30,
+        )
+        response = self.finish(students=str(self.students[5].pk), classes=str(self.class_a.pk))
+        self.assertRedirects(response, reverse("edit-results"), fetch_redirect_response=False)
+        # 4 students of class A and one of class B, less the existing row
+        self.assertEqual(Result.objects.count(), 15)
+        self.assertEqual(Result.objects.get(student=self.students[0], subject=self.subjects[0]).test_score, 30)
+
+        self.finish(classes=str(self.class_a.pk))
+        self.assertEqual(Result.objects.count(), 15)
+
+    def test_sheets_cost_five_queries(self):
+        audit_log.flush()
+        students = selected_students(class_ids=[self.class_a.pk, self.class_b.pk])
+        with self.assertNumQueries(5), self.captureOnCommitCallbacks(execute=True):
+            created = create_result_sheets(students, self.session, self.term, self.subjects)
+        self.assertEqual(created, 18)
+        audit_log.flush()
+        self.assertEqual(
+            set(AuditLog.objects.filter(model="result.Result").values_list("object_id", flat=True)),
+            {str(pk) for pk in Result.objects.values_list("pk", flat=True)},
+        )
+
+    def test_rows_another_user_inserted_are_not_counted(self):
+        audit_log.flush()
+        students = selected_students(class_ids=[self.class_a.pk])
+        aggregate = Result.objects.aggregate
+
+        # Another user adds a row after the existing ones were read
+        def inserted_meanwhile(*args, **kwargs):
+            Result.objects.create(
+                student=self.students[0],
+                session=self.session,
+                term=self.term,
+                current_class=self.class_a,
+                subject=self.subjects[0],
+            )
+            return aggregate(*args, **kwargs)
 
-# Create your tests here.
+        with mock.patch.object(Result.objects, "aggregate", inserted_meanwhile):
+            with self.captureOnCommitCallbacks(execute=True):
+                created = create_result_sheets(students, self.session, self.term, self.subjects)
+        self.assertEqual((created, Result.objects.count()), (11, 12))
+        audit_log.flush()
+        # The other user's row is audited once, by its own save
+        audited = AuditLog.objects.filter(model="result.Result").values_list("object_id", flat=True)
+        self.assertEqual(
+            sorted(audited), sorted(str(pk) for pk in Result.objects.values_list("pk", flat=True))
+        )
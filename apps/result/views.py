@@ -1,15 +1,31 @@
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.core.paginator import Paginator
+from django.db.models import Avg, Count, F, Q, Sum, Window
+from django.db.models.functions import Rank
 from django.shortcuts import get_object_or_404, redirect, render
 from django.views.generic import DetailView, ListView, View
 
 from apps.corecode.models import StudentClass
 from apps.students.models import Student
 
-from attendance.models import AttendanceEntry, AttendanceRegister
+from attendance.models import AttendanceEntry
 from .forms import CreateResults, EditResults
 from .models import Result
+from .services import create_result_sheets, selected_students
+
+
+ATTENDANCE_COUNTS = {
+    'present': Count('id', filter=Q(status=AttendanceEntry.STATUS_PRESENT)),
+    'absent': Count('id', filter=Q(status=AttendanceEntry.STATUS_ABSENT)),
+    'late': Count('id', filter=Q(status=AttendanceEntry.STATUS_LATE)),
+}
+
+
+def attendance_counts(entries):
+    """Present/absent/late totals for ``entries`` in a single query."""
+    return entries.aggregate(**ATTENDANCE_COUNTS)
 
 
 @login_required
@@ -53,61 +69,51 @@ def student_performance(request):
 
 @login_required
 def create_result(request):
-    students = Student.objects.all()
+    students = Student.objects.select_related("current_class")
     if request.method == "POST":
-
         # after visiting the second page
         if "finish" in request.POST:
+            id_list = [pk for pk in request.POST.get("students", "").split(",") if pk.isdigit()]
+            class_list = [pk for pk in request.POST.get("classes", "").split(",") if pk.isdigit()]
             form = CreateResults(request.POST)
             if form.is_valid():
-                subjects = form.cleaned_data["subjects"]
-                session = form.cleaned_data["session"]
-                term = form.cleaned_data["term"]
-                students = request.POST["students"]
-                results = []
-                for student in students.split(","):
-                    stu = Student.objects.get(pk=student)
-                    if stu.current_class:
-                        for subject in subjects:
-                            check = Result.objects.filter(
-                                session=session,
-                                term=term,
-                                current_class=stu.current_class,
-                                subject=subject,
-                                student=stu,
-                            ).first()
-                            if not check:
-                                results.append(
-                                    Result(
-                                        session=session,
-                                        term=term,
-                                        current_class=stu.current_class,
-                                        subject=subject,
-                                        student=stu,
-                                    )
-                                )
-
-                Result.objects.bulk_create(results)
+                created = create_result_sheets(
+                    selected_students(id_list, class_list),
+                    form.cleaned_data["session"],
+                    form.cleaned_data["term"],
+                    form.cleaned_data["subjects"],
+                )
+                messages.success(request, f"{created} result rows created.")
                 return redirect("edit-results")
 
-        # after choosing students
-        id_list = request.POST.getlist("students")
-        if id_list:
+        # after choosing students or whole classes
+        else:
+            id_list = [pk for pk in request.POST.getlist("students") if pk.isdigit()]
+            class_list = [pk for pk in request.POST.getlist("classes") if pk.isdigit()]
             form = CreateResults(
                 initial={
                     "session": request.current_session,
                     "term": request.current_term,
                 }
             )
-            studentlist = ",".join(id_list)
+        if id_list or class_list:
             return render(
                 request,
                 "result/create_result_page2.html",
-                {"students": studentlist, "form": form, "count": len(id_list)},
+                {
+                    "students": ",".join(id_list),
+                    "classes": ",".join(class_list),
+                    "form": form,
+                    "count": selected_students(id_list, class_list).count(),
+                },
             )
-        else:
-            messages.warning(request, "You didnt select any student.")
-    return render(request, "result/create_result.html", {"students": students})
+        messages.warning(request, "You didnt select any student.")
+    classes = StudentClass.objects.annotate(
+        student_count=Count("student", filter=Q(student__current_status="active"))
+    )
+    return render(
+        request, "result/create_result.html", {"students": students, "classes": classes}
+    )
 
 
 @login_required
@@ -127,31 +133,66 @@ def edit_results(request):
 
 
 class ResultListView(LoginRequiredMixin, View):
+    """Every student's results for the current term, a page at a time.
+
+    One grouped query gives each student's totals and their position in
+    their class (ranked over the whole class, so it doesn't depend on the
+    page), and one more fetches the subjects of the students on the page.
+    """
+
+    paginate_by = 25
+
     def get(self, request, *args, **kwargs):
         results = Result.objects.filter(
             session=request.current_session, term=request.current_term
         )
-        bulk = {}
-
-        for result in results:
-            test_total = 0
-            exam_total = 0
-            subjects = []
-            for subject in results:
-                if subject.student == result.student:
-                    subjects.append(subject)
-                    test_total += subject.test_score
-                    exam_total += subject.exam_score
-
-            bulk[result.student.id] = {
-                "student": result.student,
-                "subjects": subjects,
-                "test_total": test_total,
-                "exam_total": exam_total,
-                "total_total": test_total + exam_total,
-            }
-
-        context = {"results": bulk}
+        student_class = None
+        class_id = request.GET.get("class")
+        if class_id and class_id.isdigit():
+            student_class = get_object_or_404(StudentClass, pk=class_id)
+            results = results.filter(current_class=student_class)
+
+        totals = (
+            results.values(
+                "student",
+                "current_class",
+                "current_class__name",
+                "student__surname",
+                "student__firstname",
+                "student__other_name",
+                "student__registration_number",
+            )
+            .annotate(
+                test_total=Sum("test_score"),
+                exam_total=Sum("exam_score"),
+                total_total=Sum(F("test_score") + F("exam_score")),
+            )
+            # Ranked in a second annotate() so the window stays out of the GROUP BY
+            .annotate(
+                position=Window(
+                    Rank(),
+                    partition_by=F("current_class"),
+                    order_by=F("total_total").desc(),
+                )
+            )
+            .order_by("current_class__name", "current_class", "position", "student")
+        )
+        page = Paginator(totals, self.paginate_by).get_page(request.GET.get("page"))
+
+        subjects = {}
+        for result in results.filter(
+            student__in=[row["student"] for row in page]
+        ).select_related("subject"):
+            subjects.setdefault((result.student_id, result.current_class_id), []).append(result)
+        for row in page:
+            row["subjects"] = subjects.get((row["student"], row["current_class"]), [])
+
+        context = {
+            "page_obj": page,
+            "results": page.object_list,
+            "classes": StudentClass.objects.all(),
+            "student_class": student_class,
+        }
         return render(request, "result/all_results.html", context)
 
 
@@ -160,22 +201,24 @@ def report_card(request, student_id):
     student = get_object_or_404(Student, pk=student_id)
     session = request.current_session
     term = request.current_term
-    results = Result.objects.filter(student=student, session=session, term=term).select_related('subject', 'current_class')
+    results = list(
+        Result.objects.filter(student=student, session=session, term=term)
+        .select_related('subject', 'current_class')
+    )
     teacher_comment = next((r.teacher_comment for r in results if r.teacher_comment), "")
     headteacher_comment = next((r.headteacher_comment for r in results if r.headteacher_comment), "")
-    current_class = results.first().current_class if results.exists() else student.current_class
+    current_class = results[0].current_class if results else student.current_class
 
-    regs = AttendanceRegister.objects.filter(
-        session=session,
-        term=term,
-        student_class=current_class,
+    attendance = attendance_counts(
+        AttendanceEntry.objects.filter(
+            register__session=session,
+            register__term=term,
+            register__student_class=current_class,
+            student=student,
+        )
     )
-    entries = AttendanceEntry.objects.filter(register__in=regs, student=student)
-    present = entries.filter(status=AttendanceEntry.STATUS_PRESENT).count()
-    absent = entries.filter(status=AttendanceEntry.STATUS_ABSENT).count()
-    late = entries.filter(status=AttendanceEntry.STATUS_LATE).count()
 
-    avg = sum(r.total_score() for r in results)/results.count() if results else 0
+    avg = sum(r.total_score() for r in results)/len(results) if results else 0
 
     context = {
         'student': student,
@@ -184,7 +227,7 @@ def report_card(request, student_id):
         'term': term,
         'results': results,
         'average_total': round(avg, 2),
-        'attendance': {'present': present, 'absent': absent, 'late': late},
+        'attendance': attendance,
         'teacher_comment': teacher_comment,
         'headteacher_comment': headteacher_comment,
     }
@@ -198,19 +241,32 @@ def class_report_sheet(request, class_id):
     term = request.current_term
     students = Student.objects.filter(current_class=student_class, current_status='active')
 
+    # One grouped query each for averages and attendance, instead of per student
+    averages = dict(
+        Result.objects.filter(student__in=students, session=session, term=term)
+        .values('student')
+        .annotate(avg=Avg(F('test_score') + F('exam_score')))
+        .values_list('student', 'avg')
+    )
+    attendance = {
+        row['student']: row
+        for row in AttendanceEntry.objects.filter(
+            register__session=session,
+            register__term=term,
+            register__student_class=student_class,
+            student__in=students,
+        )
+        .values('student')
+        .annotate(**ATTENDANCE_COUNTS)
+    }
+
     rows = []
-    regs = AttendanceRegister.objects.filter(session=session, term=term, student_class=student_class)
     for stu in students:
-        results = Result.objects.filter(student=stu, session=session, term=term)
-        avg = round(sum(r.total_score() for r in results)/results.count(), 2) if results else 0
-        entries = AttendanceEntry.objects.filter(register__in=regs, student=stu)
-        present = entries.filter(status=AttendanceEntry.STATUS_PRESENT).count()
-        absent = entries.filter(status=AttendanceEntry.STATUS_ABSENT).count()
-        late = entries.filter(status=AttendanceEntry.STATUS_LATE).count()
+        counts = attendance.get(stu.id, {})
         rows.append({
             'student': stu,
-            'average_total': avg,
-            'attendance': {'present': present, 'absent': absent, 'late': late}
+            'average_total': round(averages.get(stu.id) or 0, 2),
+            'attendance': {key: counts.get(key, 0) for key in ATTENDANCE_COUNTS},
         })
 
     context = {
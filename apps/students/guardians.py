@@ -0,0 +1,123 @@
+"""Link students to shared Guardian rows.
+
+A guardian is identified by their phone number with everything but the
+digits removed (the student's guardian phone, or the parent mobile number
+when that is blank), or by their email when there is no phone. Students
+whose guardian has neither are left unlinked rather than matched by name.
+"""
+
+import re
+
+from django.db.models import Count, Q, Sum
+
+from .models import Guardian, Student
+
+
+def normalize_phone(value):
+    return re.sub(r"\D", "", value or "")
+
+
+def guardian_details(student):
+    """``(name, phone, email)`` of the guardian typed on ``student``."""
+    phone = normalize_phone(student.guardian_phone) or normalize_phone(
+        student.parent_mobile_number
+    )
+    return student.guardian_name.strip(), phone, student.guardian_email.strip().lower()
+
+
+def _key(phone, email):
+    if phone:
+        return ("phone", phone)
+    if email:
+        return ("email", email)
+    return None
+
+
+def link(students):
+    """Set ``guardian`` on ``students`` (not saved), creating guardians as needed.
+
+    Existing guardians are looked up with one indexed query per kind of key.
+    Returns the students whose guardian changed.
+    """
+    students = list(students)
+    details = {id(student): guardian_details(student) for student in students}
+    keys = {_key(phone, email) for _, phone, email in details.values()} - {None}
+    phones = [value for kind, value in keys if kind == "phone"]
+    emails = [value for kind, value in keys if kind == "email"]
+    found = {}
+    if phones:
+        found.update(
+            (("phone", g.phone), g) for g in Guardian.objects.filter(phone__in=phones)
+        )
+    if emails:
+        found.update(
+            (("email", g.email), g)
+            for g in Guardian.objects.filter(phone="", email__in=emails)
+        )
+
+    new, named = {}, {}
+    for student in students:
+        name, phone, email = details[id(student)]
+        key = _key(phone, email)
+        if key in found:
+            if name and not found[key].name:
+                found[key].name = name
+                named[key] = found[key]
+        elif key in new:
+            new[key].name = new[key].name or name
+        elif key:
+            new[key] = Guardian(name=name, phone=phone, email=email)
+    found.update(zip(new, Guardian.objects.bulk_create(new.values())))
+    Guardian.objects.bulk_update(named.values(), ["name"])
+
+    changed = []
+    for student in students:
+        key = _key(*details[id(student)][1:])
+        guardian_id = found[key].pk if key else None
+        if student.guardian_id != guardian_id:
+            student.guardian_id = guardian_id
+            changed.append(student)
+    return changed
+
+
+def link_all(batch_size=1000):
+    """Link every student, ``batch_size`` at a time; returns how many changed."""
+    changed = 0
+    last_pk = 0
+    students = Student.objects.order_by("pk").only(
+        "guardian", "guardian_name", "guardian_phone", "guardian_email", "parent_mobile_number"
+    )
+    while True:
+        batch = list(students.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            return changed
+        last_pk = batch[-1].pk
+        linked = link(batch)
+        Student.objects.bulk_update(linked, ["guardian"], batch_size=batch_size)
+        changed += len(linked)
+
+
+def find_by_phone(phone):
+    """Guardians with this phone number, using the phone index."""
+    phone = normalize_phone(phone)
+    return Guardian.objects.filter(phone=phone) if phone else Guardian.objects.none()
+
+
+def family_statement(guardian):
+    """The guardian's children with their fees, from one aggregate query.
+
+    Outstanding counts open invoices only, since a closed invoice's balance
+    was carried into the student's next one.
+    """
+    return (
+        guardian.students.select_related("current_class")
+        .annotate(
+            invoice_count=Count("invoice"),
+            billed=Sum("invoice__amount_payable", default=0),
+            paid=Sum("invoice__amount_paid", default=0),
+            outstanding=Sum(
+                "invoice__balance", filter=Q(invoice__status="active"), default=0
+            ),
+        )
+        .order_by("-date_of_birth", "pk")
+    )
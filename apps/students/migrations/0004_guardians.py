@@ -0,0 +1,68 @@
+# Generated by Django 5.2.7 on 2026-10-18 21:13
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def link_guardians(apps, schema_editor):
+    # Students sharing a guardian phone (digits only; the parent mobile number
+    # when blank) or, without a phone, a guardian email get one Guardian row
+    Guardian = apps.get_model("students", "Guardian")
+    Student = apps.get_model("students", "Student")
+    students = Student.objects.order_by("pk").only(
+        "guardian_name", "guardian_phone", "guardian_email", "parent_mobile_number"
+    )
+    guardians, last_pk = {}, 0
+    while True:
+        batch = list(students.filter(pk__gt=last_pk)[:1000])
+        if not batch:
+            return
+        last_pk = batch[-1].pk
+        keys, new = [], {}
+        for student in batch:
+            phone = re.sub(r"\D", "", student.guardian_phone or "") or re.sub(
+                r"\D", "", student.parent_mobile_number or ""
+            )
+            email = student.guardian_email.strip().lower()
+            key = ("phone", phone) if phone else ("email", email) if email else None
+            keys.append(key)
+            if key and key not in guardians and key not in new:
+                new[key] = Guardian(
+                    name=student.guardian_name.strip(), phone=phone, email=email
+                )
+            elif key in new and not new[key].name:
+                new[key].name = student.guardian_name.strip()
+        guardians.update(zip(new, Guardian.objects.bulk_create(new.values())))
+        for student, key in zip(batch, keys):
+            student.guardian_id = guardians[key].pk if key else None
+        Student.objects.bulk_update(batch, ["guardian"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0003_student_allergies_student_emergency_contact_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Guardian',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(blank=True, max_length=200)),
+                ('phone', models.CharField(blank=True, db_index=True, max_length=15)),
+                ('email', models.EmailField(blank=True, db_index=True, max_length=254)),
+            ],
+            options={
+                'ordering': ['name', 'phone'],
+            },
+        ),
+        migrations.AddField(
+            model_name='student',
+            name='guardian',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='students', to='students.guardian'),
+        ),
+        migrations.RunPython(link_guardians, migrations.RunPython.noop),
+    ]
@@ -6,6 +6,34 @@ from django.utils import timezone
 from apps.corecode.models import StudentClass
 
 
+mobile_num_regex = RegexValidator(
+    regex="^[0-9]{10,15}$", message="Entered mobile number isn't in a right format!"
+)
+
+
+class Guardian(models.Model):
+    """A parent or guardian, shared by all of their children at the school.
+
+    Students keep the guardian details typed on their form; ``guardians.py``
+    links each student to the Guardian with the same phone number (or email
+    when there is no phone), so siblings are found through an index.
+    """
+
+    name = models.CharField(max_length=200, blank=True)
+    # Digits only, as stored by guardians.normalize_phone
+    phone = models.CharField(max_length=15, blank=True, db_index=True)
+    email = models.EmailField(blank=True, db_index=True)
+
+    class Meta:
+        ordering = ["name", "phone"]
+
+    def __str__(self):
+        return self.name or self.phone or self.email
+
+    def get_absolute_url(self):
+        return reverse("guardian-detail", kwargs={"pk": self.pk})
+
+
 class Student(models.Model):
     STATUS_CHOICES = [("active", "Active"), ("inactive", "Inactive")]
 
@@ -25,9 +53,7 @@ class Student(models.Model):
     )
     date_of_admission = models.DateField(default=timezone.now)
 
-    mobile_num_regex = RegexValidator(
-        regex="^[0-9]{10,15}$", message="Entered mobile number isn't in a right format!"
-    )
+    mobile_num_regex = mobile_num_regex
     parent_mobile_number = models.CharField(
         validators=[mobile_num_regex], max_length=13, blank=True
     )
@@ -39,6 +65,14 @@ class Student(models.Model):
     relationship = models.CharField(max_length=50, blank=True, help_text="e.g., Mother, Father, Aunt")
     emergency_contact = models.CharField(max_length=200, blank=True)
     pickup_authorized = models.TextField(blank=True, help_text="Comma-separated list of authorized pickup persons")
+    guardian = models.ForeignKey(
+        Guardian,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name="students",
+    )
 
     medical_notes = models.TextField(blank=True)
     allergies = models.TextField(blank=True)
@@ -2,11 +2,13 @@ import csv
 import os
 from io import StringIO
 
-from django.db.models.signals import post_delete, post_save
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 
+from apps.corecode.audit import audit_log
 from apps.corecode.models import StudentClass
 
+from . import guardians
 from .models import Student, StudentBulkUpload
 
 
@@ -63,11 +65,20 @@ def create_bulk_student(sender, created, instance, *args, **kwargs):
                         )
                     )
 
-        Student.objects.bulk_create(students)
+        guardians.link(students)
+        created_students = Student.objects.bulk_create(students)
+        audit_log.record_many("create", created_students)
         instance.csv_file.close()
         instance.delete()
 
 
+@receiver(pre_save, sender=Student)
+def link_guardian(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Saves of selected fields leave the guardian as it is
+    if not raw and update_fields is None:
+        guardians.link([instance])
+
+
 def _delete_file(path):
     """Deletes file from filesystem."""
     if os.path.isfile(path):
@@ -1,3 +1,105 @@
-from django.test import TestCase
+import shutil
+import tempfile
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from apps.corecode.audit import audit_log
+from apps.corecode.models import AcademicSession, AcademicTerm, AuditLog, StudentClass
+from apps.finance.models import Invoice, InvoiceItem, Receipt
+
+from . import guardians
+from .models import Guardian, Student, StudentBulkUpload
+
+
+def make_student(reg, **kwargs):
+    return Student.objects.create(
+        registration_number=reg, surname="Phiri", firstname=reg, **kwargs
+    )
+
+
+class GuardianTest(TestCase):
+    def test_siblings_share_a_guardian_by_phone(self):
+        first = make_student("G1", guardian_name="Ruth Phiri", guardian_phone="+260 977 123")
+        second = make_student("G2", guardian_phone="+260977123")
+        third = make_student("G3", parent_mobile_number="+260977123")
+        other = make_student("G4", guardian_phone="+260977999")
+
+        self.assertEqual(Guardian.objects.count(), 2)
+        self.assertEqual(first.guardian_id, second.guardian_id)
+        self.assertEqual(first.guardian_id, third.guardian_id)
+        self.assertNotEqual(first.guardian_id, other.guardian_id)
+        self.assertEqual(first.guardian.name, "Ruth Phiri")
+        self.assertEqual(list(guardians.find_by_phone("260-977-123")), [first.guardian])
+
+    def test_email_when_there_is_no_phone(self):
+        first = make_student("E1", guardian_email="Ruth@Example.com")
+        second = make_student("E2", guardian_email="ruth@example.com")
+        alone = make_student("E3", guardian_name="Nobody")
+
+        self.assertEqual(first.guardian_id, second.guardian_id)
+        self.assertEqual(first.guardian.email, "ruth@example.com")
+        self.assertIsNone(alone.guardian_id)
+
+    def test_link_all_relinks_changed_details(self):
+        student = make_student("L1", guardian_phone="+260977123")
+        Student.objects.filter(pk=student.pk).update(guardian_phone="+260977456")
+
+        self.assertEqual(guardians.link_all(batch_size=1), 1)
+        student.refresh_from_db()
+        self.assertEqual(student.guardian.phone, "260977456")
+
+    def test_family_statement(self):
+        user = User.objects.create_user("bursar", password="pw")
+        session = AcademicSession.objects.create(name="2030-2031")
+        term = AcademicTerm.objects.create(name="First Term")
+        student_class = StudentClass.objects.create(name="Grade 1A")
+        for reg, fee, paid in (("F1", 1000, 400), ("F2", 800, 800)):
+            invoice = Invoice.objects.create(
+                student=make_student(reg, guardian_phone="+260977123"),
+                session=session,
+                term=term,
+                class_for=student_class,
+            )
+            InvoiceItem.objects.create(invoice=invoice, description="Tuition", amount=fee)
+            Receipt.objects.create(invoice=invoice, amount_paid=paid)
+        guardian = Guardian.objects.get()
+
+        with self.assertNumQueries(1):
+            children = {child.registration_number: child for child in guardians.family_statement(guardian)}
+        self.assertEqual(children["F1"].billed, 1000)
+        self.assertEqual(children["F1"].outstanding, 600)
+        self.assertEqual(children["F2"].outstanding, 0)
+
+        self.client.force_login(user)
+        response = self.client.get(reverse("guardian-detail", args=[guardian.pk]))
+        self.assertEqual(response.context["totals"], {"billed": 1800, "paid": 1200, "outstanding": 600})
+        response = self.client.get(reverse("guardian-list"), {"phone": "260 977 123"})
+        self.assertEqual(list(response.context["object_list"]), [guardian])
+
+
+class BulkUploadTest(TestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        settings = override_settings(MEDIA_ROOT=media)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_uploaded_students_are_audited(self):
+        audit_log.flush()
+        content = (
+            b"registration_number,surname,firstname,current_class\n"
+            b"B1,Phiri,Ada,Grade 1A\n"
+            b"B2,Banda,Joe,Grade 1A\n"
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            StudentBulkUpload.objects.create(csv_file=SimpleUploadedFile("students.csv", content))
+        audit_log.flush()
+        self.assertEqual(
+            set(AuditLog.objects.filter(model="students.Student").values_list("object_id", flat=True)),
+            {str(pk) for pk in Student.objects.values_list("pk", flat=True)},
+        )
+        self.assertEqual(Student.objects.count(), 2)
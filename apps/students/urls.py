@@ -2,6 +2,8 @@ from django.urls import path
 
 from .views import (
     DownloadCSVViewdownloadcsv,
+    GuardianDetailView,
+    GuardianListView,
     StudentBulkUploadView,
     StudentCreateView,
     StudentDeleteView,
@@ -17,5 +19,7 @@ urlpatterns = [
     path("<int:pk>/update/", StudentUpdateView.as_view(), name="student-update"),
     path("delete/<int:pk>/", StudentDeleteView.as_view(), name="student-delete"),
     path("upload/", StudentBulkUploadView.as_view(), name="student-upload"),
+    path("guardians/", GuardianListView.as_view(), name="guardian-list"),
+    path("guardians/<int:pk>/", GuardianDetailView.as_view(), name="guardian-detail"),
     path("download-csv/", DownloadCSVViewdownloadcsv.as_view(), name="download-csv"),
 ]
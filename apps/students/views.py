@@ -2,29 +2,77 @@ import csv
 
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.messages.views import SuccessMessageMixin
+from django.db.models import Count
 from django.forms import widgets
 from django.http import HttpResponse
 from django.urls import reverse_lazy
 from django.views.generic import DetailView, ListView, View
 from django.views.generic.edit import CreateView, DeleteView, UpdateView
 
+from apps.finance import ledger
 from apps.finance.models import Invoice
 
-from .models import Student, StudentBulkUpload
+from . import guardians
+from .models import Guardian, Student, StudentBulkUpload
 
 
 class StudentListView(LoginRequiredMixin, ListView):
     model = Student
     template_name = "students/student_list.html"
 
+    def get_queryset(self):
+        return super().get_queryset().select_related("current_class")
+
 
 class StudentDetailView(LoginRequiredMixin, DetailView):
     model = Student
     template_name = "students/student_detail.html"
 
+    def get_queryset(self):
+        return super().get_queryset().select_related("current_class", "guardian")
+
     def get_context_data(self, **kwargs):
         context = super(StudentDetailView, self).get_context_data(**kwargs)
-        context["payments"] = Invoice.objects.filter(student=self.object)
+        context["payments"] = Invoice.objects.filter(
+            student=self.object
+        ).select_related("session", "term")
+        context["balance"] = ledger.current_balance(self.object)
+        context["ledger_entries"] = self.object.ledger_entries.order_by("-pk")[:20]
+        if self.object.guardian_id:
+            context["siblings"] = (
+                Student.objects.filter(guardian_id=self.object.guardian_id)
+                .exclude(pk=self.object.pk)
+                .select_related("current_class")
+            )
+        return context
+
+
+class GuardianListView(LoginRequiredMixin, ListView):
+    model = Guardian
+    template_name = "students/guardian_list.html"
+    paginate_by = 50
+
+    def get_queryset(self):
+        phone = self.request.GET.get("phone")
+        queryset = guardians.find_by_phone(phone) if phone else super().get_queryset()
+        name = self.request.GET.get("name")
+        if name:
+            queryset = queryset.filter(name__icontains=name)
+        return queryset.annotate(children=Count("students")).order_by("name", "phone")
+
+
+class GuardianDetailView(LoginRequiredMixin, DetailView):
+    model = Guardian
+    template_name = "students/guardian_detail.html"
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        children = list(guardians.family_statement(self.object))
+        context["children"] = children
+        context["totals"] = {
+            key: sum(getattr(child, key) for child in children)
+            for key in ("billed", "paid", "outstanding")
+        }
         return context
 
 
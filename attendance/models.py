@@ -1,5 +1,7 @@
 from django.conf import settings
 from django.db import models
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from django.core.exceptions import ValidationError
 
@@ -7,6 +9,32 @@ from apps.corecode.models import StudentClass, AcademicSession, AcademicTerm
 from apps.students.models import Student
 
 
+class AttendanceRegisterQuerySet(models.QuerySet):
+    def with_counts(self):
+        """Annotate entry and roster counts so the count properties need no queries."""
+        roster = (
+            Student.objects.filter(
+                current_class=OuterRef("student_class"), current_status="active"
+            )
+            .order_by()
+            .values("current_class")
+            .annotate(n=Count("id"))
+            .values("n")
+        )
+        return self.annotate(
+            num_students=Coalesce(Subquery(roster, output_field=IntegerField()), 0),
+            num_present=Count(
+                "entries", filter=Q(entries__status=AttendanceEntry.STATUS_PRESENT)
+            ),
+            num_absent=Count(
+                "entries", filter=Q(entries__status=AttendanceEntry.STATUS_ABSENT)
+            ),
+            num_late=Count(
+                "entries", filter=Q(entries__status=AttendanceEntry.STATUS_LATE)
+            ),
+        )
+
+
 class AttendanceRegister(models.Model):
     date = models.DateField(default=timezone.now)
     student_class = models.ForeignKey(StudentClass, on_delete=models.CASCADE, related_name='attendance_registers')
@@ -19,6 +47,8 @@ class AttendanceRegister(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = AttendanceRegisterQuerySet.as_manager()
+
     class Meta:
         unique_together = ('date', 'student_class', 'term', 'session')
         ordering = ('-date',)
@@ -34,20 +64,30 @@ class AttendanceRegister(models.Model):
         if self.date > timezone.now().date():
             raise ValidationError("Attendance date cannot be in the future.")
     
+    # The count properties use the annotations from with_counts() when present
+
     @property
     def total_students(self):
+        if hasattr(self, 'num_students'):
+            return self.num_students
         return Student.objects.filter(current_class=self.student_class, current_status='active').count()
     
     @property
     def present_count(self):
+        if hasattr(self, 'num_present'):
+            return self.num_present
         return self.entries.filter(status=AttendanceEntry.STATUS_PRESENT).count()
     
     @property
     def absent_count(self):
+        if hasattr(self, 'num_absent'):
+            return self.num_absent
         return self.entries.filter(status=AttendanceEntry.STATUS_ABSENT).count()
     
     @property
     def late_count(self):
+        if hasattr(self, 'num_late'):
+            return self.num_late
         return self.entries.filter(status=AttendanceEntry.STATUS_LATE).count()
     
     @property
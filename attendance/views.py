@@ -1,7 +1,8 @@
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required, permission_required
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
-from django.db.models import Count, Q
+from django.db import transaction
+from django.db.models import Count, Q, Sum
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse_lazy
 from django.utils import timezone
@@ -78,6 +79,9 @@ class AttendanceRegisterDetailView(LoginRequiredMixin, PermissionRequiredMixin,
     model = AttendanceRegister
     template_name = 'attendance/register_detail.html'
 
+    def get_queryset(self):
+        return super().get_queryset().with_counts()
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         register = self.object
@@ -181,22 +185,31 @@ def take_attendance(request, pk):
     ).order_by('surname', 'firstname')
 
     if request.method == 'POST':
-        for student in students:
-            status = request.POST.get(f'status_{student.id}', AttendanceEntry.STATUS_PRESENT)
-            remarks = request.POST.get(f'remarks_{student.id}', '')
-            time_in = request.POST.get(f'time_in_{student.id}', '')
-            time_out = request.POST.get(f'time_out_{student.id}', '')
-            
-            entry, created = AttendanceEntry.objects.get_or_create(
-                register=register, 
-                student=student
+        # One short write transaction for the whole register (BEGIN IMMEDIATE
+        # on SQLite), instead of two or three autocommitted writes per student
+        with transaction.atomic():
+            existing = {
+                e.student_id: e for e in AttendanceEntry.objects.filter(register=register)
+            }
+            now = timezone.now()
+            new_entries, changed = [], []
+            for student in students:
+                entry = existing.get(student.id)
+                if entry is None:
+                    entry = AttendanceEntry(register=register, student=student)
+                    new_entries.append(entry)
+                else:
+                    entry.updated_at = now
+                    changed.append(entry)
+                entry.status = request.POST.get(f'status_{student.id}', AttendanceEntry.STATUS_PRESENT)
+                entry.remarks = request.POST.get(f'remarks_{student.id}', '')
+                entry.time_in = request.POST.get(f'time_in_{student.id}', '') or None
+                entry.time_out = request.POST.get(f'time_out_{student.id}', '') or None
+            AttendanceEntry.objects.bulk_create(new_entries)
+            AttendanceEntry.objects.bulk_update(
+                changed, ['status', 'remarks', 'time_in', 'time_out', 'updated_at']
             )
-            entry.status = status
-            entry.remarks = remarks
-            entry.time_in = time_in if time_in else None
-            entry.time_out = time_out if time_out else None
-            entry.save()
-        
+
         messages.success(request, 'Attendance saved successfully!')
         return redirect('attendance:register_detail', pk=register.pk)
 
@@ -271,21 +284,22 @@ def attendance_summary_data(request):
     if session_id:
         registers = registers.filter(session_id=session_id)
     
-    total_registers = registers.count()
+    # Totals in one aggregate over the annotated registers
+    totals = registers.with_counts().aggregate(
+        total_registers=Count('id'),
+        total_students=Sum('num_students'),
+        total_present=Sum('num_present'),
+        total_absent=Sum('num_absent'),
+        total_late=Sum('num_late'),
+    )
+    total_registers = totals['total_registers']
     if total_registers == 0:
         return JsonResponse({'error': 'No data found for the selected filters'})
     
-    # Calculate averages
-    total_students = 0
-    total_present = 0
-    total_absent = 0
-    total_late = 0
-    
-    for register in registers:
-        total_students += register.total_students
-        total_present += register.present_count
-        total_absent += register.absent_count
-        total_late += register.late_count
+    total_students = totals['total_students'] or 0
+    total_present = totals['total_present'] or 0
+    total_absent = totals['total_absent'] or 0
+    total_late = totals['total_late'] or 0
     
     avg_attendance_rate = round((total_present / total_students) * 100, 2) if total_students > 0 else 0
     
@@ -308,16 +322,20 @@ class DailyAttendanceDashboard(LoginRequiredMixin, View):
         today = timezone.now().date()
         
         # Get today's registers for classes taught by current user
-        today_registers = AttendanceRegister.objects.filter(date=today)
+        today_registers = list(
+            AttendanceRegister.objects.filter(date=today)
+            .select_related('student_class', 'term', 'session')
+            .with_counts()
+        )
         
         # Get recent registers
         recent_registers = AttendanceRegister.objects.filter(
             date__lt=today
-        ).order_by('-date')[:5]
+        ).select_related('student_class').with_counts().order_by('-date')[:5]
         
         # Statistics
         total_classes = StudentClass.objects.count()
-        registers_today = today_registers.count()
+        registers_today = len(today_registers)
         pending_today = total_classes - registers_today
         
         context = {
@@ -48,10 +48,13 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
-    "django.contrib.sessions.middleware.SessionMiddleware",
+    "apps.corecode.middleware.RequestStatsMiddleware",
+    "apps.corecode.middleware.ThrottledSessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "apps.corecode.middleware.RequestLogMiddleware",
+    "apps.corecode.middleware.ProfilerMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "apps.corecode.middleware.SiteWideConfigs",
@@ -90,6 +93,54 @@ DATABASES = {
     )
 }
 
+# Single-server SQLite profile (see apps.corecode.sqlite); SQLITE_TUNING=False
+# falls back to SQLite's defaults
+SQLITE_PRAGMAS = {}
+if DATABASES["default"]["ENGINE"] == "django.db.backends.sqlite3":
+    if os.getenv("SQLITE_TUNING", "True") == "True":
+        from apps.corecode.sqlite import PRODUCTION_PRAGMAS as SQLITE_PRAGMAS
+
+        DATABASES["default"].setdefault("OPTIONS", {})["transaction_mode"] = "IMMEDIATE"
+
+# Caches
+# "default" is private to each worker. "shared" holds the version stamps used
+# to invalidate per-process caches across all gunicorn workers, so it must be
+# reachable by every worker (a local directory, or e.g. Redis/Memcached).
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "shared": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.getenv(
+            "SHARED_CACHE_DIR", os.path.join(BASE_DIR, ".cache", "shared")
+        ),
+    },
+}
+VERSION_STAMP_CACHE = "shared"
+# Seconds a worker trusts its cached values before re-reading the stamp
+VERSION_STAMP_TTL = float(os.getenv("VERSION_STAMP_TTL", "2"))
+
+# Per-endpoint request/SQL statistics (see apps.corecode.instrumentation)
+REQUEST_STATS_ENABLED = os.getenv("REQUEST_STATS_ENABLED", "True") == "True"
+# Seconds between flushes of each worker's in-memory totals to the database
+REQUEST_STATS_FLUSH_INTERVAL = int(os.getenv("REQUEST_STATS_FLUSH_INTERVAL", "60"))
+# A statement shape repeated this many times in one request is flagged as N+1
+REQUEST_STATS_N_PLUS_ONE_THRESHOLD = 10
+REQUEST_STATS_MAX_ENDPOINTS = 500
+
+# Profiling: staff add ?_profile=1 (cProfile) or ?_profile=sample to any URL.
+# Requests slower than PROFILE_SLOW_REQUEST_MS are captured automatically
+# with the sampling profiler; leave it unset to turn that off.
+PROFILE_SLOW_REQUEST_MS = (
+    float(os.environ["PROFILE_SLOW_REQUEST_MS"])
+    if os.getenv("PROFILE_SLOW_REQUEST_MS")
+    else None
+)
+PROFILE_SAMPLE_INTERVAL = 0.005
+# Only the newest captures are kept
+PROFILE_MAX_CAPTURES = 50
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -129,30 +180,43 @@ MEDIA_URL = "/media/"
 LOGIN_REDIRECT_URL = "/"
 LOGOUT_REDIRECT_URL = "/"
 
-SESSION_SAVE_EVERY_REQUEST = True
 SESSION_EXPIRE_AT_BROWSER_CLOSE = True
 SESSION_COOKIE_AGE = 10800  # 3 hours
+# Sessions slide their expiry like SESSION_SAVE_EVERY_REQUEST, but
+# ThrottledSessionMiddleware only writes the refresh once this fraction of
+# SESSION_COOKIE_AGE has passed since the last save (18 minutes by default).
+SESSION_SAVE_EVERY_REQUEST = False
+SESSION_REFRESH_FRACTION = float(os.getenv("SESSION_REFRESH_FRACTION", "0.1"))
+# db, cached_db (database behind the shared cache) or signed_cookies
+SESSION_ENGINE = {
+    "db": "django.contrib.sessions.backends.db",
+    "cached_db": "django.contrib.sessions.backends.cached_db",
+    "signed_cookies": "django.contrib.sessions.backends.signed_cookies",
+}[os.getenv("SESSION_BACKEND", "db")]
+# Every worker must see the same session data, so not the per-process cache
+SESSION_CACHE_ALIAS = "shared"
 
-# Logging
+# Logging: JSON lines written by a background thread (see apps.corecode.log)
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
+    "filters": {
+        "request_context": {"()": "apps.corecode.log.RequestContextFilter"},
+    },
     "formatters": {
-        "verbose": {
-            "format": "{levelname} {asctime} {message}",
-            "style": "{",
-        },
+        "json": {"()": "apps.corecode.log.JsonFormatter"},
     },
     "handlers": {
         "file": {
             "level": "INFO",
-            "class": "logging.handlers.TimedRotatingFileHandler",
+            "class": "apps.corecode.log.QueueingFileHandler",
             "when": "W6",
             "interval": 4,
             "backupCount": 3,
             "encoding": "utf8",
             "filename": os.path.join(BASE_DIR, "debug.log"),
-            "formatter": "verbose",
+            "formatter": "json",
+            "filters": ["request_context"],
         },
     },
     "loggers": {
@@ -161,9 +225,79 @@ LOGGING = {
             "level": "INFO",
             "propagate": True,
         },
+        "apps": {
+            "handlers": ["file"],
+            "level": "INFO",
+        },
+        "attendance": {
+            "handlers": ["file"],
+            "level": "INFO",
+        },
+        "school_app": {
+            "handlers": ["file"],
+            "level": "INFO",
+        },
     },
 }
 
+# Audit log of creates, updates and deletes (see apps.corecode.audit)
+AUDITED_MODELS = [
+    "students.Student",
+    "finance.Invoice",
+    "finance.Receipt",
+    "result.Result",
+    "attendance.AttendanceRegister",
+]
+# Buffered entries are written once this many are waiting...
+AUDIT_BATCH_SIZE = 100
+# ...or this many seconds have passed
+AUDIT_FLUSH_INTERVAL = 10
+
+# Invoice imports (see apps.finance.imports): "worker" leaves each upload for
+# ``manage.py process_invoice_imports``; "thread" runs it in a background
+# thread of the web process, which dies with that process, so it is only the
+# default in DEBUG.
+INVOICE_IMPORT_RUNNER = os.getenv(
+    "INVOICE_IMPORT_RUNNER", "thread" if DEBUG else "worker"
+)
+# Seconds without progress after which the worker restarts a running import
+INVOICE_IMPORT_STALE_AFTER = 600
+# Rows validated and written per transaction
+INVOICE_IMPORT_CHUNK_SIZE = 1000
+
+# Bank reconciliation (see apps.finance.reconcile): how far a payment may
+# exceed the balance still owed and still be matched automatically...
+RECONCILE_AMOUNT_TOLERANCE = 0
+# ...and how invoice numbers are written in payment references
+RECONCILE_REFERENCE_PATTERN = r"\bINV[-\s#]?(\d+)\b"
+
+# Printable invoices and receipts (see apps.finance.documents): processes
+# rendering a batch (None uses every available core), and the cache keeping
+# rendered documents, keyed by a hash of their data
+FINANCE_DOCUMENT_WORKERS = None
+FINANCE_DOCUMENT_CACHE = "shared"
+
+# Receipt numbers each process reserves at a time (see apps.finance.numbering)...
+RECEIPT_NUMBER_BLOCK_SIZE = 20
+# ...on a connection of their own that commits the reservation straight away.
+# SQLite locks the whole database for a writing transaction anyway, so there
+# blocks are reserved in the caller's transaction.
+RECEIPT_NUMBER_DATABASE = "default"
+if DATABASES["default"]["ENGINE"] != "django.db.backends.sqlite3":
+    DATABASES["receipt_numbers"] = {**DATABASES["default"], "TEST": {"MIRROR": "default"}}
+    RECEIPT_NUMBER_DATABASE = "receipt_numbers"
+
+# Payment gateway webhooks (see apps.finance.payments): the secret each
+# provider signs its notifications with, by the provider name in the URL.
+# The simulator provider is only open with its own secret, or in DEBUG...
+PAYMENT_WEBHOOK_SECRETS = {}
+if os.getenv("SIMULATOR_WEBHOOK_SECRET"):
+    PAYMENT_WEBHOOK_SECRETS["simulator"] = os.environ["SIMULATOR_WEBHOOK_SECRET"]
+elif DEBUG:
+    PAYMENT_WEBHOOK_SECRETS["simulator"] = "unsafe-simulator-secret"
+# ...and how many notifications ``manage.py drain_payments`` receipts at once
+PAYMENT_DRAIN_BATCH_SIZE = 500
+
 DEFAULT_AUTO_FIELD = "django.db.models.AutoField"
 
 # Crispy Forms configuration